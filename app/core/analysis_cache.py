@@ -0,0 +1,134 @@
+"""
+Persistent cache for Gemini paper analyses.
+
+Entries are keyed by (collection, paper_id, prompt version, model) and
+stored in a local SQLite file together with the rendered HTML, so a popular
+paper is analyzed and rendered once. Concurrent requests for a paper that
+is not cached yet share one in-flight call (single-flight).
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    collection TEXT NOT NULL,
+    paper_id TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    model TEXT NOT NULL,
+    markdown TEXT NOT NULL,
+    html TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (collection, paper_id, prompt_version, model)
+)
+"""
+
+
+class AnalysisCache:
+    def __init__(self, path: str, prompt_version: str, model: str):
+        self.path = path
+        self.prompt_version = prompt_version
+        self.model = model
+        self.lock = threading.Lock()
+        self.conn = None
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def connect(self):
+        if self.conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(SCHEMA)
+            conn.commit()
+            self.conn = conn
+        return self.conn
+
+    def key(self, collection: str, paper_id: str):
+        return (collection, str(paper_id), self.prompt_version, self.model)
+
+    def get(self, collection: str, paper_id: str):
+        """
+        Returns the cached (markdown, html) for a paper, or None.
+        """
+        with self.lock:
+            row = self.connect().execute(
+                "SELECT markdown, html FROM analyses "
+                "WHERE collection = ? AND paper_id = ? AND prompt_version = ? AND model = ?",
+                self.key(collection, paper_id)
+            ).fetchone()
+        if row is not None:
+            self.hits += 1
+        return row
+
+    def set(self, collection: str, paper_id: str, markdown_text: str, html: str):
+        with self.lock:
+            conn = self.connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self.key(collection, paper_id) + (markdown_text, html, time.time())
+            )
+            conn.commit()
+
+    def record_miss(self):
+        """
+        Counts a miss computed outside get_or_compute (a streamed analysis).
+        """
+        self.misses += 1
+
+    async def get_or_compute(self, collection: str, paper_id: str, compute):
+        """
+        Returns (markdown, html) from the cache, or from `compute()` - an
+        async callable returning (markdown, html), or None when there is
+        nothing to cache (e.g. the paper doesn't exist). Concurrent misses
+        for the same paper await a single compute call and share its result
+        or its exception; failures are never stored.
+        """
+        cached = self.get(collection, paper_id)
+        if cached is not None:
+            return cached
+
+        key = self.key(collection, paper_id)
+        task = self.inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._compute(key, collection, paper_id, compute))
+            self.inflight[key] = task
+        # A client disconnecting must not cancel the call other viewers share
+        return await asyncio.shield(task)
+
+    async def _compute(self, key, collection: str, paper_id: str, compute):
+        try:
+            result = await compute()
+            if result is not None:
+                self.set(collection, paper_id, *result)
+            return result
+        finally:
+            self.inflight.pop(key, None)
+
+    def stats(self):
+        total = self.hits + self.misses + self.coalesced
+        with self.lock:
+            size = self.connect().execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "in_flight": len(self.inflight),
+            "hit_rate": (self.hits + self.coalesced) / total if total else 0.0
+        }
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
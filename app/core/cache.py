@@ -0,0 +1,331 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional per-entry TTL (seconds).
+    Keeps hit/miss counters so the size can be tuned from real traffic.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def add(self, key, value):
+        """
+        Sets key only if it has no live entry (doesn't touch hit counters).
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                return
+        self.set(key, value)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry is not None else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class DiskVectorStore:
+    """
+    Direct-mapped, memory-mapped float32 vector store that survives restarts.
+
+    Each key hashes to one of `slots` rows; a parallel uint64 array holds the
+    key hash of the row's occupant, so a colliding key simply overwrites the
+    previous one. Files are created on first use as <path>.f32 / <path>.keys.
+    """
+
+    def __init__(self, path: str, dim: int, slots: int = 100000):
+        self.path = path
+        self.dim = dim
+        self.slots = slots
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        vectors_file = f"{path}.f32"
+        keys_file = f"{path}.keys"
+        expected = (slots * dim * 4, slots * 8)
+        existing = (
+            os.path.getsize(vectors_file) if os.path.exists(vectors_file) else -1,
+            os.path.getsize(keys_file) if os.path.exists(keys_file) else -1
+        )
+        # Start over if the files were written with another shape
+        mode = "r+" if existing == expected else "w+"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._vectors = np.memmap(vectors_file, dtype=np.float32, mode=mode, shape=(slots, dim))
+        self._keys = np.memmap(keys_file, dtype=np.uint64, mode=mode, shape=(slots,))
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        h = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+        return h or 1  # 0 marks an empty slot
+
+    def get(self, key: str):
+        h = self._hash(key)
+        slot = h % self.slots
+        with self._lock:
+            if int(self._keys[slot]) == h:
+                self.hits += 1
+                return np.array(self._vectors[slot])
+            self.misses += 1
+            return None
+
+    def set(self, key: str, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (self.dim,):
+            return
+        h = self._hash(key)
+        slot = h % self.slots
+        with self._lock:
+            # Invalidate, write the row, then publish the key
+            self._keys[slot] = 0
+            self._vectors[slot] = vector
+            self._keys[slot] = h
+
+    def flush(self):
+        with self._lock:
+            self._vectors.flush()
+            self._keys.flush()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "slots": self.slots,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class QueryVectorCache:
+    """
+    Two-tier cache of query embeddings keyed by (normalized text, model).
+    Tier 1 is an in-process LRU with TTL; tier 2 is an optional on-disk
+    DiskVectorStore, created lazily once the vector dimension is known.
+    """
+
+    def __init__(self, model_name: str, max_size: int = 10000, ttl: float = None,
+                 disk_path: str = "", disk_slots: int = 100000):
+        self.model_name = model_name
+        self.memory = LRUCache(max_size=max_size, ttl=ttl)
+        self.disk_path = disk_path
+        self.disk_slots = disk_slots
+        self.disk = None
+        self._disk_lock = threading.Lock()
+
+    def key(self, text: str) -> str:
+        return f"{self.model_name}\x00{normalize_query(text)}"
+
+    def _get_disk(self, dim: int = None):
+        if self.disk is None and self.disk_path and not dim:
+            # After a restart, recover the dimension from the existing file
+            vectors_file = f"{self.disk_path}.f32"
+            if os.path.exists(vectors_file):
+                dim = os.path.getsize(vectors_file) // (self.disk_slots * 4)
+        if self.disk is None and self.disk_path and dim:
+            with self._disk_lock:
+                if self.disk is None:
+                    try:
+                        self.disk = DiskVectorStore(self.disk_path, dim, self.disk_slots)
+                    except Exception as e:
+                        print(f"Failed to open query vector store at {self.disk_path}: {e}")
+                        self.disk_path = ""
+        return self.disk
+
+    def get(self, text: str):
+        key = self.key(text)
+        vector = self.memory.get(key)
+        if vector is not None:
+            return vector
+        disk = self._get_disk()
+        if disk is not None:
+            vector = disk.get(key)
+            if vector is not None:
+                self.memory.set(key, vector)
+        return vector
+
+    def set(self, text: str, vector):
+        key = self.key(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        self.memory.set(key, vector)
+        disk = self._get_disk(len(vector))
+        if disk is not None:
+            disk.set(key, vector)
+
+    def flush(self):
+        if self.disk is not None:
+            self.disk.flush()
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None
+        }
+
+
+class SemanticResultCache:
+    """
+    Result cache keyed by query meaning rather than text: holds the unit
+    vectors of recent queries in one NumPy matrix and serves a new query
+    from the entry whose vector is most similar, if the cosine similarity
+    is at least `threshold`. Entries expire after `ttl` seconds; when full,
+    the least recently used one is replaced.
+
+    lookup() takes an optional `valid(value)` check, so callers can drop
+    entries whose context changed (e.g. routing) since they were stored.
+    """
+
+    def __init__(self, max_size: int = 2000, ttl: float = None, threshold: float = 0.92):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._vectors = None
+        self._values = [None] * max_size
+        self._expires = np.full(max_size, np.inf)
+        self._used = np.zeros(max_size, dtype=np.int64)
+        self._count = 0
+        self._tick = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _best(self, vector):
+        # Called with self._lock held: (slot, similarity) of the closest live entry
+        if not self._count or self._vectors is None or len(vector) != self._vectors.shape[1]:
+            return None, 0.0
+        scores = self._vectors[:self._count] @ vector
+        scores[self._expires[:self._count] <= time.monotonic()] = -np.inf
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+
+    def _drop(self, slot: int):
+        self._values[slot] = None
+        self._expires[slot] = -np.inf
+
+    def lookup(self, vector, valid=None):
+        """
+        Returns (value, similarity) for the closest cached query at or above
+        the threshold, or None.
+        """
+        vector = self._unit(vector)
+        with self._lock:
+            slot, similarity = self._best(vector)
+            if slot is None or similarity < self.threshold:
+                self.misses += 1
+                return None
+            value = self._values[slot]
+            if valid is not None and not valid(value):
+                self._drop(slot)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._tick += 1
+            self._used[slot] = self._tick
+            self.hits += 1
+            return value, similarity
+
+    def add(self, vector, value):
+        vector = self._unit(vector)
+        expires_at = time.monotonic() + self.ttl if self.ttl else np.inf
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, len(vector)), dtype=np.float32)
+            elif len(vector) != self._vectors.shape[1]:
+                return
+            slot, similarity = self._best(vector)
+            if slot is None or similarity < 0.999:
+                # New query: take a free row, else reuse an expired or the least recently used one
+                if self._count < self.max_size:
+                    slot = self._count
+                    self._count += 1
+                else:
+                    live = self._expires > time.monotonic()
+                    slot = int(np.argmin(np.where(live, self._used, -1)))
+            self._tick += 1
+            self._vectors[slot] = vector
+            self._values[slot] = value
+            self._expires[slot] = expires_at
+            self._used[slot] = self._tick
+
+    def clear(self):
+        with self._lock:
+            self._values = [None] * self.max_size
+            self._expires[:] = np.inf
+            self._count = 0
+
+    def __len__(self):
+        with self._lock:
+            return int(np.count_nonzero(self._expires[:self._count] > time.monotonic()))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
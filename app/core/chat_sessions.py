@@ -0,0 +1,117 @@
+"""
+Server-side chat sessions about a paper.
+
+A session holds the paper context once and the turns so far; the client
+sends only the session id and its new message. Each turn's prompt is the
+context, a running summary of older turns, and as many recent turns as
+fit the token budget (sliding window). Turns that slide out of the window
+are folded into the summary in the background, after the reply.
+
+Token counts are estimated locally (about 4 characters per token) to fit
+the budget; Gemini's own prompt token count is reported when it has one.
+"""
+import asyncio
+import math
+import secrets
+import time
+
+# Stands in for the model's reply to the context message, so the history
+# alternates user / model turns as the chat API expects
+CONTEXT_ACK = "Understood. Ask me anything about this paper."
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4) if text else 0
+
+
+class ChatSession:
+    """
+    Turns are {"role": "user" | "model", "text", "tokens"} dicts; the ones
+    before `summarized` are covered by `summary`.
+    """
+
+    def __init__(self, collection: str, paper_id: str, title: str, context: str):
+        self.id = secrets.token_urlsafe(12)
+        self.collection = collection
+        self.paper_id = paper_id
+        self.title = title
+        self.context = context
+        self.context_tokens = estimate_tokens(context)
+        self.summary = ""
+        self.summary_tokens = 0
+        self.summarized = 0
+        self.turns = []
+        self.summary_task = None
+        self.created_at = time.time()
+
+    def context_message(self) -> str:
+        if not self.summary:
+            return self.context
+        return f"{self.context}\n\nSummary of the conversation so far: {self.summary}"
+
+    def window_start(self, message_tokens: int, budget: int) -> int:
+        """
+        Index of the oldest turn that still fits the budget, newest first
+        and by whole user/model exchanges. Summarized turns never count.
+        """
+        fixed = self.context_tokens + self.summary_tokens + estimate_tokens(CONTEXT_ACK)
+        available = budget - fixed - message_tokens
+        start = len(self.turns)
+        while start - 2 >= self.summarized:
+            exchange = self.turns[start - 2]["tokens"] + self.turns[start - 1]["tokens"]
+            if exchange > available:
+                break
+            available -= exchange
+            start -= 2
+        return start
+
+    def prepare(self, message: str, budget: int):
+        """
+        Returns (history for the chat API, report, window start) for a new
+        message. The report has the estimated prompt tokens and how the
+        turns were split.
+        """
+        message_tokens = estimate_tokens(message)
+        start = self.window_start(message_tokens, budget)
+        context = self.context_message()
+        history = [
+            {"role": "user", "parts": [context]},
+            {"role": "model", "parts": [CONTEXT_ACK]},
+        ] + [{"role": t["role"], "parts": [t["text"]]} for t in self.turns[start:]]
+        estimate = (self.context_tokens + self.summary_tokens + estimate_tokens(CONTEXT_ACK)
+                    + message_tokens + sum(t["tokens"] for t in self.turns[start:]))
+        report = {
+            "prompt_tokens_estimate": estimate,
+            "prompt_tokens": None,
+            "budget": budget,
+            "window_turns": len(self.turns) - start,
+            "summarized_turns": self.summarized,
+            "dropped_turns": start - self.summarized,
+        }
+        return history, report, start
+
+    def record(self, message: str, reply: str):
+        self.turns.append({"role": "user", "text": message, "tokens": estimate_tokens(message)})
+        self.turns.append({"role": "model", "text": reply, "tokens": estimate_tokens(reply)})
+
+    def schedule_summary(self, upto: int, summarize, max_tokens: int):
+        """
+        Folds turns [summarized, upto) into the summary with the async
+        `summarize(summary, turns)` callable, unless one is already running.
+        A failed summary leaves the turns to be retried on a later turn.
+        """
+        if upto <= self.summarized or (self.summary_task is not None and not self.summary_task.done()):
+            return
+
+        async def run():
+            try:
+                summary = await summarize(self.summary, self.turns[self.summarized:upto])
+            except Exception as e:
+                print(f"Chat summary for session {self.id} failed: {e}")
+                return
+            # Keep the summary itself inside its share of the budget
+            self.summary = summary[:max_tokens * 4]
+            self.summary_tokens = estimate_tokens(self.summary)
+            self.summarized = upto
+
+        self.summary_task = asyncio.create_task(run())
@@ -0,0 +1,104 @@
+"""
+Circuit breaker for calls to a flaky upstream (Gemini).
+
+Closed: calls go through; consecutive failures are counted. After
+`failure_threshold` of them the breaker opens and calls fail fast with
+CircuitOpenError for `cooldown` seconds. Then it is half-open: up to
+`half_open_probes` calls are let through; a success closes it, a failure
+opens it for another cooldown.
+"""
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATES = (CLOSED, HALF_OPEN, OPEN)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown: float = 30.0, half_open_probes: int = 1):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.half_open_probes = max(1, half_open_probes)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def _current(self) -> str:
+        # Called with self._lock held
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current()
+
+    def before_call(self) -> bool:
+        """
+        Admits a call or raises CircuitOpenError. Returns True if the call
+        is a half-open probe; pass that to record_success/record_failure/release.
+        """
+        with self._lock:
+            state = self._current()
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            retry_in = max(self.cooldown - (time.monotonic() - self._opened_at), 0.0)
+        raise CircuitOpenError(f"{self.name} is unavailable after repeated errors; retrying in {retry_in:.0f}s")
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self.opened += 1
+        print(f"Circuit breaker {self.name} opened after {self.failures} consecutive failures")
+
+    def record_success(self, probe: bool = False):
+        with self._lock:
+            self.failures = 0
+            if probe:
+                self._probes -= 1
+            if self._state != CLOSED:
+                self._state = CLOSED
+                print(f"Circuit breaker {self.name} closed")
+
+    def record_failure(self, probe: bool = False):
+        with self._lock:
+            self.failures += 1
+            if probe:
+                self._probes -= 1
+                self._open()
+            elif self._state == CLOSED and self.failures >= self.failure_threshold:
+                self._open()
+
+    def release(self, probe: bool = False):
+        """
+        For calls that ended without an outcome (e.g. cancelled by the client).
+        """
+        if probe:
+            with self._lock:
+                self._probes -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._current(),
+                "consecutive_failures": self.failures,
+                "rejected": self.rejected,
+                "opened": self.opened
+            }
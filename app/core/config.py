@@ -10,12 +10,139 @@ class Settings:
     # Qdrant Configuration
     QDRANT_URL: str = os.getenv("QDRANT_URL", "")
     QDRANT_API_KEY: str = os.getenv("QDRANT_API_KEY", "")
+    # Connection pool for the async client shared by all searches
+    QDRANT_POOL_SIZE: int = int(os.getenv("QDRANT_POOL_SIZE", "32"))
+    QDRANT_PREFER_GRPC: bool = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+    QDRANT_TIMEOUT: int = int(os.getenv("QDRANT_TIMEOUT", "60"))
+    # Search Backend: "qdrant" (remote) or "local" (embedded index over the
+    # snapshots built by python -m app.core.local_index, no Qdrant needed)
+    SEARCH_BACKEND: str = os.getenv("SEARCH_BACKEND", "qdrant").lower()
+    LOCAL_INDEX_PATH: str = os.getenv("LOCAL_INDEX_PATH", "snapshots")
+    LOCAL_INDEX_NPROBE: int = int(os.getenv("LOCAL_INDEX_NPROBE", "16"))
+    # Abstract snippet length kept per search hit (results page only)
+    SNIPPET_LENGTH: int = int(os.getenv("SNIPPET_LENGTH", "300"))
+    # Search asks only for the snippet fields python -m app.core.ingest
+    # stores; the notebooks' collections lack them, so only turn this on
+    # after re-ingesting (it also stops search hits seeding the paper cache)
+    SEARCH_PAYLOAD_SNIPPETS: bool = os.getenv("SEARCH_PAYLOAD_SNIPPETS", "false").lower() == "true"
+    # Paper details for /analysis, seeded from search hits unless
+    # SEARCH_PAYLOAD_SNIPPETS (full payload is fetched on a miss)
+    PAPER_CACHE_SIZE: int = int(os.getenv("PAPER_CACHE_SIZE", "5000"))
+    PAPER_CACHE_TTL: float = float(os.getenv("PAPER_CACHE_TTL", "3600"))
+
+    # Result Sessions: each (query, route) is searched once in windows of N
+    # hits per collection and paged from memory under a short-lived cursor
+    RESULT_WINDOW_PER_COLLECTION: int = int(os.getenv("RESULT_WINDOW_PER_COLLECTION", "30"))
+    RESULT_SESSION_TTL: float = float(os.getenv("RESULT_SESSION_TTL", "600"))
+    RESULT_SESSION_CACHE_SIZE: int = int(os.getenv("RESULT_SESSION_CACHE_SIZE", "1000"))
+
+    # Adaptive Fan-out: search the top-ranked collection plus any within
+    # FANOUT_SCORE_MARGIN of its hybrid score (up to FANOUT_MAX_COLLECTIONS),
+    # splitting FANOUT_RESULT_BUDGET hits per window in proportion to score
+    ADAPTIVE_FANOUT: bool = os.getenv("ADAPTIVE_FANOUT", "true").lower() == "true"
+    FANOUT_MAX_COLLECTIONS: int = int(os.getenv("FANOUT_MAX_COLLECTIONS", "3"))
+    FANOUT_SCORE_MARGIN: float = float(os.getenv("FANOUT_SCORE_MARGIN", "0.1"))
+    FANOUT_RESULT_BUDGET: int = int(os.getenv("FANOUT_RESULT_BUDGET", "60"))
+    FANOUT_MIN_WINDOW: int = int(os.getenv("FANOUT_MIN_WINDOW", "10"))
+    # Early stop: the other collections wait up to DELAY_MS for the top one,
+    # and are skipped if it alone returns HITS results scoring >= SCORE
+    FANOUT_EARLY_STOP: bool = os.getenv("FANOUT_EARLY_STOP", "false").lower() == "true"
+    FANOUT_EARLY_STOP_DELAY_MS: float = float(os.getenv("FANOUT_EARLY_STOP_DELAY_MS", "25"))
+    FANOUT_EARLY_STOP_HITS: int = int(os.getenv("FANOUT_EARLY_STOP_HITS", "15"))
+    FANOUT_EARLY_STOP_SCORE: float = float(os.getenv("FANOUT_EARLY_STOP_SCORE", "0.5"))
+
+    # Semantic Result Cache: a new query whose embedding is within
+    # SEMANTIC_CACHE_THRESHOLD cosine similarity of a recent one is served
+    # that query's result set (paraphrases skip expansion and Qdrant).
+    # Entries are dropped once graph weights would route the query elsewhere.
+    SEMANTIC_CACHE: bool = os.getenv("SEMANTIC_CACHE", "true").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    SEMANTIC_CACHE_SIZE: int = int(os.getenv("SEMANTIC_CACHE_SIZE", "2000"))
+    SEMANTIC_CACHE_TTL: float = float(os.getenv("SEMANTIC_CACHE_TTL", "600"))
     
+    # Batch Search (POST /api/search/batch): max queries per request, and
+    # queries per batched backend call to one collection
+    BATCH_SEARCH_MAX_QUERIES: int = int(os.getenv("BATCH_SEARCH_MAX_QUERIES", "1000"))
+    BATCH_SEARCH_GROUP_SIZE: int = int(os.getenv("BATCH_SEARCH_GROUP_SIZE", "64"))
+
+    # Chat Sessions: paper context kept server-side; each turn's prompt
+    # (context + summary + recent turns + message) stays within
+    # CHAT_TOKEN_BUDGET estimated tokens, older turns are summarized
+    CHAT_TOKEN_BUDGET: int = int(os.getenv("CHAT_TOKEN_BUDGET", "2000"))
+    CHAT_SUMMARY_TOKENS: int = int(os.getenv("CHAT_SUMMARY_TOKENS", "200"))
+    CHAT_SESSION_TTL: float = float(os.getenv("CHAT_SESSION_TTL", "1800"))
+    CHAT_SESSION_CACHE_SIZE: int = int(os.getenv("CHAT_SESSION_CACHE_SIZE", "1000"))
+
     # Gemini Configuration
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
+    GEMINI_MODEL: str = os.getenv("GEMINI_MODEL", "gemini-flash-latest")
+    # Gemini client limits: concurrent calls, per-operation deadlines
+    # (seconds), and the circuit breaker - after N consecutive failures calls
+    # fail fast for COOLDOWN seconds, then PROBES trial calls decide recovery
+    GEMINI_MAX_CONCURRENCY: int = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+    GEMINI_EXPAND_TIMEOUT: float = float(os.getenv("GEMINI_EXPAND_TIMEOUT", "3"))
+    GEMINI_ANALYSIS_TIMEOUT: float = float(os.getenv("GEMINI_ANALYSIS_TIMEOUT", "30"))
+    GEMINI_CHAT_TIMEOUT: float = float(os.getenv("GEMINI_CHAT_TIMEOUT", "20"))
+    GEMINI_BREAKER_FAILURES: int = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+    GEMINI_BREAKER_COOLDOWN: float = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+    GEMINI_BREAKER_PROBES: int = int(os.getenv("GEMINI_BREAKER_PROBES", "1"))
+    # Paper analyses (markdown + rendered HTML) persisted across restarts
+    ANALYSIS_CACHE_PATH: str = os.getenv("ANALYSIS_CACHE_PATH", ".cache/analyses.sqlite3")
+
+    # Speculative Search: search on the raw query while Gemini expands it,
+    # and only add the expansion's results if it arrives within the deadline (seconds)
+    SPECULATIVE_SEARCH: bool = os.getenv("SPECULATIVE_SEARCH", "true").lower() == "true"
+    EXPANSION_DEADLINE: float = float(os.getenv("EXPANSION_DEADLINE", "0.8"))
     
     # Model Configuration
     EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+
+    # Embedding Backend: "torch" (SentenceTransformer), "onnx" (ONNX Runtime,
+    # int8-quantized export from python -m app.core.onnx_export; needs onnxruntime)
+    # or "remote" (see below)
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+    EMBEDDING_ONNX_PATH: str = os.getenv("EMBEDDING_ONNX_PATH", "models/all-MiniLM-L6-v2-onnx")
+    EMBEDDING_ONNX_THREADS: int = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))
+    # "remote": encode through the shared embedding server (python -m
+    # app.core.embedding_server), which loads EMBEDDING_SERVER_BACKEND once
+    # for all workers and batches their requests together
+    EMBEDDING_SERVER_SOCKET: str = os.getenv("EMBEDDING_SERVER_SOCKET", "/tmp/scholargraph-embed.sock")
+    EMBEDDING_SERVER_BACKEND: str = os.getenv("EMBEDDING_SERVER_BACKEND", "torch").lower()
+    EMBEDDING_SERVER_TIMEOUT: float = float(os.getenv("EMBEDDING_SERVER_TIMEOUT", "10"))
+
+    # Micro-batching: concurrent encode requests arriving within the window
+    # are run as one batch (capped), behind a bounded request queue
+    EMBEDDING_BATCH_WINDOW_MS: float = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "2"))
+    EMBEDDING_MAX_BATCH_SIZE: int = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "64"))
+    EMBEDDING_QUEUE_SIZE: int = int(os.getenv("EMBEDDING_QUEUE_SIZE", "1024"))
+    # Dedicated CPU executor for embedding/routing work (kept off the Qdrant path)
+    EMBEDDING_WORKERS: int = int(os.getenv("EMBEDDING_WORKERS", "2"))
+
+    # Cold Start: warm the model, router vectors and clients before serving,
+    # and keep encoded router vectors on disk across restarts
+    WARMUP_ON_STARTUP: bool = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+    ROUTER_VECTORS_DIR: str = os.getenv("ROUTER_VECTORS_DIR", ".cache")
+
+    # Query Cache: query vectors and router results, keyed by normalized text
+    # + model. The disk tier is a memory-mapped float32 store (off when empty)
+    QUERY_CACHE_SIZE: int = int(os.getenv("QUERY_CACHE_SIZE", "10000"))
+    QUERY_CACHE_TTL: float = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+    QUERY_CACHE_DISK_PATH: str = os.getenv("QUERY_CACHE_DISK_PATH", "")
+    QUERY_CACHE_DISK_SLOTS: int = int(os.getenv("QUERY_CACHE_DISK_SLOTS", "100000"))
+
+    # Graph Persistence: "sqlite" keeps the weights in a WAL-mode SQLite file
+    # shared by all worker processes (seeded from GRAPH_FILE on first start);
+    # "json" is the single-process GRAPH_FILE store with write-behind flushes
+    # every N seconds or after N updates
+    GRAPH_BACKEND: str = os.getenv("GRAPH_BACKEND", "sqlite")
+    GRAPH_DB_PATH: str = os.getenv("GRAPH_DB_PATH", ".cache/graph.sqlite3")
+    GRAPH_FILE: str = os.getenv("GRAPH_FILE", "graph_weights.json")
+    GRAPH_FLUSH_INTERVAL: float = float(os.getenv("GRAPH_FLUSH_INTERVAL", "5"))
+    GRAPH_FLUSH_THRESHOLD: int = int(os.getenv("GRAPH_FLUSH_THRESHOLD", "50"))
+    # Shared store: how stale a worker's cached weights may get (seconds), and
+    # the time decay - weights lose 1% per GRAPH_DECAY_INTERVAL seconds (0 = off)
+    GRAPH_READ_TTL: float = float(os.getenv("GRAPH_READ_TTL", "0.5"))
+    GRAPH_DECAY_INTERVAL: float = float(os.getenv("GRAPH_DECAY_INTERVAL", "0"))
     
     # Collection Descriptions (for Routing)
     COLLECTIONS = {
@@ -28,6 +155,18 @@ class Settings:
         "other_cs": "computer science theory, systems, databases, security, networks, software engineering"
     }
 
+    # Per-domain JSONL files written by the preprocessing notebook
+    # (<domain>.jsonl) and the collection each one is indexed into
+    DOMAIN_COLLECTIONS = {
+        "ai": "cs_ai_full",
+        "ml": "ML_collection",
+        "dl": "dl_collection",
+        "cv": "cv_collection",
+        "nlp": "nlp_collection",
+        "rl": "RL_collection",
+        "other_cs": "other_cs"
+    }
+
     # Display Names for UI
     COLLECTION_DISPLAY_NAMES = {
         "cs_ai_full": "Artificial Intelligence",
@@ -50,4 +189,7 @@ class Settings:
         "other_cs": ["database", "security", "network", "operating system", "software engineering"]
     }
 
+    # Autocomplete index built offline from the corpus (python -m app.core.suggest_index)
+    SUGGEST_INDEX_PATH: str = os.getenv("SUGGEST_INDEX_PATH", "suggest_index.npz")
+
 settings = Settings()
@@ -0,0 +1,120 @@
+"""
+Reading the per-domain OpenAlex JSONL files the preprocessing notebook
+writes (<domain>.jsonl), and turning papers into the text that gets
+embedded and the payload stored next to the vector. Mirrors the
+preprocessing and domain training notebooks, so locally built indexes
+match the Qdrant collections.
+"""
+import json
+import os
+
+from app.core.config import settings
+from app.core.records import search_fields
+
+# The notebooks skip papers whose title + abstract is shorter than this
+MIN_TEXT_LENGTH = 30
+
+# Concept-name keywords per domain (Preprocessing_MetaData); papers that
+# match none go to other_cs
+DOMAIN_KEYWORDS = {
+    "ai": {"artificial intelligence"},
+    "ml": {"machine learning"},
+    "dl": {"deep learning", "neural network"},
+    "nlp": {"natural language processing", "speech recognition", "text mining"},
+    "cv": {"computer vision", "image processing", "object detection"},
+    "rl": {"reinforcement learning"},
+}
+OTHER_DOMAIN = "other_cs"
+
+
+def clean_nulls(obj):
+    """
+    Removes null / empty fields recursively.
+    """
+    if isinstance(obj, dict):
+        return {k: clean_nulls(v) for k, v in obj.items() if v not in [None, "", [], {}]}
+    elif isinstance(obj, list):
+        return [clean_nulls(v) for v in obj if v not in [None, "", [], {}]]
+    return obj
+
+
+def detect_domains(concepts) -> set:
+    """
+    CS subdomains of a paper from its concept names.
+    """
+    found = set()
+    for c in concepts:
+        name = c.get("name", "").lower()
+        for domain, keywords in DOMAIN_KEYWORDS.items():
+            if any(k in name for k in keywords):
+                found.add(domain)
+    return found
+
+
+def paper_collections(paper: dict) -> list:
+    """
+    Collections a cleaned raw OpenAlex paper is indexed into.
+    """
+    domains = detect_domains(paper.get("concepts", [])) or {OTHER_DOMAIN}
+    return [settings.DOMAIN_COLLECTIONS[d] for d in sorted(domains)]
+
+
+def iter_domain_papers(input_dir: str):
+    """
+    Yields (collection, paper) from <domain>.jsonl files in input_dir.
+    """
+    for domain, collection in settings.DOMAIN_COLLECTIONS.items():
+        path = os.path.join(input_dir, f"{domain}.jsonl")
+        if not os.path.exists(path):
+            print(f"Skipping missing domain file {path}")
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield collection, json.loads(line)
+
+
+def paper_text(paper: dict) -> str:
+    return f"{paper.get('title', '')} {paper.get('abstract', '')}".strip()
+
+
+def paper_payload(paper: dict) -> dict:
+    """
+    The notebooks' payload, plus the snippet fields search projects.
+    """
+    payload = {
+        "openalex_id": paper.get("openalex_id"),
+        "doi": paper.get("doi"),
+        "title": paper.get("title"),
+        "abstract": paper.get("abstract"),
+        "publication_year": paper.get("publication_year"),
+        "publication_date": paper.get("publication_date"),
+        "venue": paper.get("venue"),
+        "citation_count": paper.get("citation_count"),
+        "is_open_access": paper.get("is_open_access"),
+        "oa_status": paper.get("oa_status"),
+        "url": paper.get("url"),
+        "authors": [
+            {"id": a.get("author_id"), "name": a.get("name")} for a in paper.get("authors", [])
+        ],
+        "concepts": [
+            {"id": c.get("id"), "name": c.get("name")} for c in paper.get("concepts", [])
+        ]
+    }
+    payload.update(search_fields(payload, settings.SNIPPET_LENGTH))
+    return payload
+
+
+def iter_indexable_papers(input_dir: str):
+    """
+    Yields (collection, point_id, text, paper) with the notebooks' point ids:
+    a per-collection counter over papers long enough to be indexed.
+    """
+    next_id = {}
+    for collection, paper in iter_domain_papers(input_dir):
+        text = paper_text(paper)
+        if len(text) < MIN_TEXT_LENGTH:
+            continue
+        point_id = next_id.get(collection, 0)
+        next_id[collection] = point_id + 1
+        yield collection, point_id, text, paper
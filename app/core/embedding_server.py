@@ -0,0 +1,212 @@
+"""
+Shared embedding server for multi-worker deployments.
+
+One process loads the embedding model and serves encode requests over a
+Unix socket. Requests from every web worker go through a single
+EmbeddingBatcher, so they are batched together and the model (and torch)
+is in memory once instead of once per worker. Workers use it with
+EMBEDDING_BACKEND=remote; RemoteEmbedder stands in for the model behind
+get_model, so each worker's own micro-batcher and caches work unchanged.
+
+Wire format: each message is a 4-byte big-endian length and a JSON
+header; encode responses append the float32 vectors (n x dim) as raw bytes.
+
+Run before starting the workers:
+    python -m app.core.embedding_server --socket /tmp/scholargraph-embed.sock
+"""
+import argparse
+import asyncio
+import json
+import os
+import queue
+import signal
+import socket
+import struct
+import sys
+import threading
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.embeddings import EmbeddingBatcher, embedding_model_id, load_embedding_model
+
+LENGTH = struct.Struct("!I")
+
+
+def recv_exactly(sock, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("Embedding server closed the connection")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+class RemoteEmbedder:
+    """
+    Client for the embedding server with the encode() signature of
+    SentenceTransformer. One connection, one request at a time (callers
+    are serialized; the worker's batcher is normally the only one);
+    reconnects once if the server was restarted.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 10.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock = None
+        self._lock = threading.Lock()
+        info = self._request({"op": "info"})[0]
+        self.dimension = info["dim"]
+        self.model_id = info["model_id"]
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _roundtrip(self, message: dict):
+        payload = json.dumps(message).encode("utf-8")
+        self._sock.sendall(LENGTH.pack(len(payload)) + payload)
+        (length,) = LENGTH.unpack(recv_exactly(self._sock, LENGTH.size))
+        header = json.loads(recv_exactly(self._sock, length))
+        if header.get("error"):
+            raise RuntimeError(f"Embedding server error: {header['error']}")
+        body = recv_exactly(self._sock, header.get("bytes", 0))
+        return header, body
+
+    def _request(self, message: dict):
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._sock = self._connect()
+                    return self._roundtrip(message)
+                except (ConnectionError, socket.timeout, OSError):
+                    if self._sock is not None:
+                        self._sock.close()
+                        self._sock = None
+                    if attempt:
+                        raise
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, sentences, normalize_embeddings: bool = True, batch_size: int = 32, **kwargs):
+        """
+        Vectors come back normalized (the server's batcher always
+        normalizes), which is what every caller in the app asks for.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        header, body = self._request({"op": "encode", "texts": texts})
+        vectors = np.frombuffer(body, dtype=np.float32).reshape(header["n"], header["dim"])
+        return vectors[0] if single else vectors
+
+    def close(self):
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+
+class EmbeddingServer:
+    def __init__(self, socket_path: str, backend: str = None):
+        self.socket_path = socket_path
+        self.backend = backend or settings.EMBEDDING_SERVER_BACKEND
+        self.model = None
+        self.batcher = None
+        self.connections = 0
+
+    def load(self):
+        print(f"Loading embedding model ({self.backend} backend)...")
+        self.model = load_embedding_model(self.backend)
+        self.batcher = EmbeddingBatcher(
+            lambda: self.model,
+            max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+            batch_window=settings.EMBEDDING_BATCH_WINDOW_MS / 1000.0,
+            max_queue_size=settings.EMBEDDING_QUEUE_SIZE
+        )
+        self.batcher.encode("warmup query")
+
+    async def send(self, writer, header: dict, body: bytes = b""):
+        header["bytes"] = len(body)
+        payload = json.dumps(header).encode("utf-8")
+        writer.write(LENGTH.pack(len(payload)) + payload + body)
+        await writer.drain()
+
+    async def submit(self, text: str):
+        """
+        Queues a text without blocking the event loop: only a full batcher
+        queue (backpressure) waits, in a thread.
+        """
+        try:
+            future = self.batcher.submit(text, block=False)
+        except queue.Full:
+            future = await asyncio.get_running_loop().run_in_executor(None, self.batcher.submit, text)
+        return asyncio.wrap_future(future)
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    (length,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+                    message = json.loads(await reader.readexactly(length))
+                except asyncio.IncompleteReadError:
+                    break
+                op = message.get("op")
+                if op == "info":
+                    await self.send(writer, {
+                        "dim": self.model.get_sentence_embedding_dimension(),
+                        "model_id": embedding_model_id(self.backend),
+                        "batcher": self.batcher.stats(),
+                        "connections": self.connections
+                    })
+                elif op == "encode":
+                    try:
+                        futures = [await self.submit(text) for text in message.get("texts", [])]
+                        vectors = [await f for f in futures]
+                    except Exception as e:
+                        await self.send(writer, {"error": str(e)})
+                        continue
+                    dim = self.model.get_sentence_embedding_dimension()
+                    body = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), dim).tobytes()
+                    await self.send(writer, {"n": len(vectors), "dim": dim}, body)
+                else:
+                    await self.send(writer, {"error": f"unknown op {op!r}"})
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        print(f"Embedding server listening on {self.socket_path}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=settings.EMBEDDING_SERVER_SOCKET)
+    parser.add_argument("--backend", default=settings.EMBEDDING_SERVER_BACKEND, choices=["torch", "onnx"])
+    args = parser.parse_args()
+
+    server = EmbeddingServer(args.socket, args.backend)
+    server.load()
+    # Stopped by a process manager: exit through the finally below
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from app.core.config import settings
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching front end for a SentenceTransformer-style model.
+
+    Callers from any thread submit single texts; a worker thread gathers
+    whatever arrives within `batch_window` seconds (up to `max_batch_size`
+    texts) and runs them through one `encode` call. The request queue is
+    bounded, so a saturated batcher blocks new callers instead of growing
+    without limit.
+    """
+
+    def __init__(self, model_getter, max_batch_size: int = 64, batch_window: float = 0.005,
+                 max_queue_size: int = 1024, submit_timeout: float = 5.0):
+        self.model_getter = model_getter
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window = max(0.0, batch_window)
+        self.submit_timeout = submit_timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._worker = None
+
+        # Counters for sizing the window / batch cap
+        self.batches = 0
+        self.items = 0
+        self.queue_full = 0
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def submit(self, text: str, block: bool = True) -> Future:
+        """
+        Queues a text for encoding and returns a Future resolving to its
+        normalized vector. When the queue is full this blocks for up to
+        `submit_timeout` (or not at all if block=False) and then raises
+        queue.Full.
+        """
+        self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put((text, future), block=block, timeout=self.submit_timeout)
+        except queue.Full:
+            self.queue_full += 1
+            raise
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        return self.submit(text).result()
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    # Window closed, but take anything already waiting
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            live = [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            texts = [t for t, _ in live]
+            futures = [f for _, f in live]
+            try:
+                m = self.model_getter()
+                if m is None:
+                    raise RuntimeError("Embedding model is not available")
+                vectors = m.encode(texts, normalize_embeddings=True, batch_size=len(texts))
+            except Exception as e:
+                for f in futures:
+                    f.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(texts)
+            for f, vector in zip(futures, vectors):
+                f.set_result(np.asarray(vector, dtype=np.float32))
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "queue_depth": self._queue.qsize(),
+            "queue_full": self.queue_full
+        }
+
+
+class OnnxEmbedder:
+    """
+    ONNX Runtime backend for sentence-transformers models exported by
+    app.core.onnx_export (typically dynamically quantized to int8).
+
+    Tokenizes with the Rust `tokenizers` fast path and mean-pools the last
+    hidden state, matching SentenceTransformer for all-MiniLM-L6-v2.
+    Exposes the same encode() signature, so it drops in behind get_model.
+    """
+
+    def __init__(self, model_dir: str, max_seq_length: int = 256, threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, "model_quantized.onnx")
+        if not os.path.exists(model_path):
+            model_path = os.path.join(model_dir, "model.onnx")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real (non-padding) tokens
+        mask = attention_mask[..., None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, normalize_embeddings: bool = False, batch_size: int = 32, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        # Length-sorted batches keep padding (and wasted compute) low
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            vectors[idx] = self._encode_batch([texts[i] for i in idx])
+
+        if normalize_embeddings:
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors[0] if single else vectors
+
+
+def embedding_model_id(backend: str = None) -> str:
+    """
+    Identifies the model and backend that produced a vector (cache keys).
+    A remote backend produces what the embedding server's backend does.
+    """
+    backend = backend or settings.EMBEDDING_BACKEND
+    if backend == "remote":
+        backend = settings.EMBEDDING_SERVER_BACKEND
+    if backend == "onnx":
+        return f"{settings.EMBEDDING_MODEL}:onnx:{os.path.basename(os.path.normpath(settings.EMBEDDING_ONNX_PATH))}"
+    return settings.EMBEDDING_MODEL
+
+
+def load_embedding_model(backend: str = None):
+    """
+    Loads the embedding backend selected by settings.EMBEDDING_BACKEND
+    ("torch" for SentenceTransformer, "onnx" for OnnxEmbedder, "remote"
+    for a client of the shared embedding server).
+    """
+    backend = backend or settings.EMBEDDING_BACKEND
+    if backend == "onnx":
+        return OnnxEmbedder(settings.EMBEDDING_ONNX_PATH, threads=settings.EMBEDDING_ONNX_THREADS)
+    if backend == "remote":
+        from app.core.embedding_server import RemoteEmbedder
+        remote = RemoteEmbedder(settings.EMBEDDING_SERVER_SOCKET, timeout=settings.EMBEDDING_SERVER_TIMEOUT)
+        if remote.model_id != embedding_model_id(backend):
+            # Cached query and router vectors are keyed by the model id
+            print(f"Warning: embedding server runs {remote.model_id}, expected {embedding_model_id(backend)} "
+                  f"(set EMBEDDING_SERVER_BACKEND to match the server).")
+        return remote
+    if backend != "torch":
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    from sentence_transformers import SentenceTransformer
+    # Force CPU device to avoid "meta tensor" errors on some environments
+    return SentenceTransformer(settings.EMBEDDING_MODEL, device='cpu')
@@ -1,19 +1,165 @@
-import google.generativeai as genai
+import asyncio
+
 from app.core.config import settings
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError, STATES
+from app.core.metrics import Callback, gemini_call, GEMINI_REJECTED, GEMINI_TIMEOUTS
+
+# Imported on first use: the SDK is slow to import and not needed to serve /suggest
+genai = None
+gemini_model = None
+
+# Every Gemini call goes through call_gemini / stream_gemini: one breaker
+# (quota errors hit all operations alike), a cap on concurrent calls and a
+# deadline per operation
+gemini_breaker = CircuitBreaker(
+    "Gemini",
+    failure_threshold=settings.GEMINI_BREAKER_FAILURES,
+    cooldown=settings.GEMINI_BREAKER_COOLDOWN,
+    half_open_probes=settings.GEMINI_BREAKER_PROBES
+)
+gemini_semaphore = None
+gemini_semaphore_loop = None
+in_flight = 0
+
+OPERATION_TIMEOUTS = {
+    "expand": settings.GEMINI_EXPAND_TIMEOUT,
+    "analysis": settings.GEMINI_ANALYSIS_TIMEOUT,
+    "analysis_stream": settings.GEMINI_ANALYSIS_TIMEOUT,
+    "chat": settings.GEMINI_CHAT_TIMEOUT,
+    "chat_stream": settings.GEMINI_CHAT_TIMEOUT,
+    "chat_summary": settings.GEMINI_CHAT_TIMEOUT,
+}
+
+class GeminiTimeout(Exception):
+    pass
 
-# Configure Gemini
-genai.configure(api_key=settings.GEMINI_API_KEY)
+def get_genai():
+    global genai
+    if genai is None:
+        import google.generativeai as sdk
+        # Configure Gemini
+        sdk.configure(api_key=settings.GEMINI_API_KEY)
+        genai = sdk
+    return genai
+
+# Bump when the analysis prompt changes so cached analyses are regenerated
+ANALYSIS_PROMPT_VERSION = "1"
 
 def get_gemini_model():
-    # Using the stable flash alias which usually has better free tier quotas
-    return genai.GenerativeModel('gemini-flash-latest')
+    # Defaults to the stable flash alias which usually has better free tier quotas
+    global gemini_model
+    if gemini_model is None:
+        gemini_model = get_genai().GenerativeModel(settings.GEMINI_MODEL)
+    return gemini_model
 
-async def analyze_paper_content(title: str, abstract: str):
+def get_gemini_semaphore():
+    # asyncio primitives belong to one event loop; recreate for a new one
+    global gemini_semaphore, gemini_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if gemini_semaphore is None or gemini_semaphore_loop is not loop:
+        gemini_semaphore = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+        gemini_semaphore_loop = loop
+    return gemini_semaphore
+
+def admit(operation: str) -> bool:
+    try:
+        return gemini_breaker.before_call()
+    except CircuitOpenError:
+        GEMINI_REJECTED.inc(operation=operation)
+        raise
+
+async def call_gemini(operation: str, make_call):
     """
-    Generates a detailed analysis of the paper using Gemini.
+    Runs `await make_call()` under the breaker, the concurrency limit and
+    the operation's deadline (which includes waiting for a slot). Raises
+    CircuitOpenError straight away while the breaker is open, and
+    GeminiTimeout when the deadline passes.
     """
-    model = get_gemini_model()
-    prompt = f"""
+    global in_flight
+    timeout = OPERATION_TIMEOUTS.get(operation, settings.GEMINI_CHAT_TIMEOUT)
+    probe = admit(operation)
+
+    async def guarded():
+        global in_flight
+        async with get_gemini_semaphore():
+            in_flight += 1
+            try:
+                with gemini_call(operation):
+                    return await make_call()
+            finally:
+                in_flight -= 1
+
+    outcome = False
+    try:
+        result = await asyncio.wait_for(guarded(), timeout)
+        outcome = True
+        gemini_breaker.record_success(probe)
+        return result
+    except asyncio.TimeoutError:
+        outcome = True
+        GEMINI_TIMEOUTS.inc(operation=operation)
+        gemini_breaker.record_failure(probe)
+        raise GeminiTimeout(f"Gemini {operation} timed out after {timeout}s")
+    except Exception:
+        outcome = True
+        gemini_breaker.record_failure(probe)
+        raise
+    finally:
+        if not outcome:
+            # Cancelled (client gone, or an outer deadline): no verdict on Gemini
+            gemini_breaker.release(probe)
+
+async def stream_gemini(operation: str, make_stream):
+    """
+    Streaming form of call_gemini: yields the chunks of `await make_stream()`.
+    The deadline applies to the first response and to each gap between chunks.
+    """
+    global in_flight
+    timeout = OPERATION_TIMEOUTS.get(operation, settings.GEMINI_CHAT_TIMEOUT)
+    probe = admit(operation)
+    outcome = False
+    semaphore = get_gemini_semaphore()
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout)
+        in_flight += 1
+        try:
+            with gemini_call(operation):
+                response = await asyncio.wait_for(make_stream(), timeout)
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                    except StopAsyncIteration:
+                        break
+                    yield chunk
+        finally:
+            in_flight -= 1
+            semaphore.release()
+        outcome = True
+        gemini_breaker.record_success(probe)
+    except asyncio.TimeoutError:
+        outcome = True
+        GEMINI_TIMEOUTS.inc(operation=operation)
+        gemini_breaker.record_failure(probe)
+        raise GeminiTimeout(f"Gemini {operation} timed out after {timeout}s")
+    except Exception:
+        outcome = True
+        gemini_breaker.record_failure(probe)
+        raise
+    finally:
+        if not outcome:
+            gemini_breaker.release(probe)
+
+def breaker_state_samples():
+    state = gemini_breaker.state
+    return [({"state": name}, 1 if name == state else 0) for name in STATES]
+
+Callback("scholargraph_gemini_breaker_state", "Gemini circuit breaker state (1 = current).", breaker_state_samples)
+Callback("scholargraph_gemini_in_flight", "Gemini calls holding a concurrency slot.",
+         lambda: [({}, in_flight)])
+
+def analysis_prompt(title: str, abstract: str) -> str:
+    return f"""
     You are an expert academic researcher. Please provide a detailed analysis of the following research paper.
     
     Title: {title}
@@ -28,10 +174,32 @@ async def analyze_paper_content(title: str, abstract: str):
     
     Keep the tone professional and academic.
     """
-    
+
+async def generate_paper_analysis(title: str, abstract: str) -> str:
+    """
+    Generates a detailed analysis of the paper using Gemini. Raises on failure.
+    """
+    model = get_gemini_model()
+    response = await call_gemini("analysis", lambda: model.generate_content_async(analysis_prompt(title, abstract)))
+    return response.text
+
+async def stream_paper_analysis(title: str, abstract: str):
+    """
+    Streams the paper analysis as markdown text chunks while Gemini
+    generates it. Raises on failure.
+    """
+    model = get_gemini_model()
+    prompt = analysis_prompt(title, abstract)
+    async for chunk in stream_gemini("analysis_stream", lambda: model.generate_content_async(prompt, stream=True)):
+        if chunk.text:
+            yield chunk.text
+
+async def analyze_paper_content(title: str, abstract: str):
+    """
+    Generates a detailed analysis of the paper using Gemini.
+    """
     try:
-        response = await model.generate_content_async(prompt)
-        return response.text
+        return await generate_paper_analysis(title, abstract)
     except Exception as e:
         return f"Error generating analysis: {str(e)}"
 
@@ -40,15 +208,36 @@ async def chat_with_paper_context(history: list, message: str, context: str):
     Handles chat conversation about the paper.
     """
     model = get_gemini_model()
+    chat, full_prompt = start_paper_chat(model, history, message, context)
     
-    # Construct prompt with context
-    system_prompt = f"""
+    try:
+        response = await call_gemini("chat", lambda: chat.send_message_async(full_prompt))
+        return response.text
+    except Exception as e:
+        return f"Error in chat: {str(e)}"
+
+async def stream_chat_with_paper_context(history: list, message: str, context: str):
+    """
+    Streams the chat reply as markdown text chunks. Raises on failure.
+    """
+    model = get_gemini_model()
+    chat, full_prompt = start_paper_chat(model, history, message, context)
+    async for chunk in stream_gemini("chat_stream", lambda: chat.send_message_async(full_prompt, stream=True)):
+        if chunk.text:
+            yield chunk.text
+
+def chat_system_prompt(context: str) -> str:
+    return f"""
     You are a helpful research assistant discussing a specific paper.
     Context (Paper Abstract): {context}
     
     Answer the user's questions based on this context and your general knowledge.
     If the answer isn't in the abstract, use your general knowledge but mention that it's not explicitly in the provided text.
     """
+
+def start_paper_chat(model, history: list, message: str, context: str):
+    # Construct prompt with context
+    system_prompt = chat_system_prompt(context)
     
     chat = model.start_chat(history=history)
     
@@ -58,12 +247,55 @@ async def chat_with_paper_context(history: list, message: str, context: str):
     # Gemini Pro API supports history.
     
     full_prompt = f"{system_prompt}\n\nUser: {message}"
+    return chat, full_prompt
+
+def prompt_token_count(response):
+    """
+    Prompt tokens Gemini billed for a response, if it reports usage.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "prompt_token_count", None) or None
+
+async def send_chat_message(history: list, message: str):
+    """
+    One chat turn on a prepared history (see chat_sessions). Returns
+    (reply text, prompt token count or None). Raises on failure.
+    """
+    chat = get_gemini_model().start_chat(history=history)
+    response = await call_gemini("chat", lambda: chat.send_message_async(message))
+    return response.text, prompt_token_count(response)
+
+async def stream_chat_message(history: list, message: str, usage: dict):
+    """
+    Streams one chat turn as markdown chunks; usage["prompt_tokens"] is set
+    once the stream ends, if Gemini reports it. Raises on failure.
+    """
+    chat = get_gemini_model().start_chat(history=history)
+    async for chunk in stream_gemini("chat_stream", lambda: chat.send_message_async(message, stream=True)):
+        usage["prompt_tokens"] = prompt_token_count(chunk) or usage.get("prompt_tokens")
+        if chunk.text:
+            yield chunk.text
+
+async def summarize_conversation(summary: str, turns: list, max_words: int) -> str:
+    """
+    Folds older chat turns ({"role", "text"} dicts) into the running
+    summary of the conversation. Raises on failure.
+    """
+    transcript = "\n".join(f"{t['role'].capitalize()}: {t['text']}" for t in turns)
+    prompt = f"""
+    Summarize this conversation about a research paper in at most {max_words} words.
+    Keep the questions asked, the facts established and anything the user said they care about.
     
-    try:
-        response = await chat.send_message_async(full_prompt)
-        return response.text
-    except Exception as e:
-        return f"Error in chat: {str(e)}"
+    Summary so far: {summary or "(none)"}
+    
+    New turns:
+    {transcript}
+    
+    Return ONLY the updated summary.
+    """
+    model = get_gemini_model()
+    response = await call_gemini("chat_summary", lambda: model.generate_content_async(prompt))
+    return response.text.strip()
 
 async def expand_query(query: str) -> str:
     """
@@ -73,8 +305,11 @@ async def expand_query(query: str) -> str:
     prompt = f"You are a search optimization assistant. Refine and expand the following search query to improve retrieval of academic papers. Return ONLY the optimized query string, no explanations. Original Query: {query}"
     
     try:
-        response = await model.generate_content_async(prompt)
+        response = await call_gemini("expand", lambda: model.generate_content_async(prompt))
         return response.text.strip()
+    except CircuitOpenError:
+        # Fail fast to the raw query while Gemini is down
+        return query
     except Exception as e:
         print(f"Query expansion failed: {e}")
         return query
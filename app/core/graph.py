@@ -1,58 +1,394 @@
 from collections import defaultdict
+import atexit
 import time
 import math
 import json
 import os
+import sqlite3
+import tempfile
+import threading
+from app.core.config import settings
 
-GRAPH_FILE = "graph_weights.json"
+GRAPH_FILE = settings.GRAPH_FILE
 
 class CollectionGraph:
-    def __init__(self):
+    def __init__(self, path: str = GRAPH_FILE, flush_interval: float = None, flush_threshold: int = None):
         # Node weights: Importance of each collection
         self.node_weights = defaultdict(lambda: 1.0)
-        
+
         # Edge weights: Co-occurrence strength (not fully used in simple routing but good for future)
         self.edge_weights = defaultdict(lambda: defaultdict(float))
-        
+
         # Decay factor for time-based relevance
         self.decay_rate = 0.99
+
+        # Write-behind state: updates land in memory and a background thread
+        # flushes them every flush_interval seconds or after flush_threshold updates
+        self.path = path
+        self.flush_interval = settings.GRAPH_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.flush_threshold = settings.GRAPH_FLUSH_THRESHOLD if flush_threshold is None else flush_threshold
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = 0
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher = None
         self.load()
-        
+
     def load(self):
-        if os.path.exists(GRAPH_FILE):
+        if os.path.exists(self.path):
             try:
-                with open(GRAPH_FILE, 'r') as f:
+                with open(self.path, 'r') as f:
                     data = json.load(f)
                     self.node_weights.update(data.get("node_weights", {}))
+                    for src, edges in data.get("edge_weights", {}).items():
+                        self.edge_weights[src].update(edges)
             except Exception as e:
                 print(f"Failed to load graph weights: {e}")
 
     def save(self):
-        try:
-            with open(GRAPH_FILE, 'w') as f:
-                json.dump({
-                    "node_weights": dict(self.node_weights)
-                }, f)
-        except Exception as e:
-            print(f"Failed to save graph weights: {e}")
+        """
+        Writes a snapshot of the weights atomically (temp file + rename),
+        so a crash mid-write never leaves a truncated graph file behind.
+        """
+        with self._write_lock:
+            with self._lock:
+                snapshot = {"node_weights": dict(self.node_weights),
+                            "edge_weights": {src: dict(edges) for src, edges in self.edge_weights.items() if edges}}
+                dirty = self._dirty
+                self._dirty = 0
+            directory = os.path.dirname(os.path.abspath(self.path))
+            tmp_path = None
+            try:
+                with tempfile.NamedTemporaryFile('w', dir=directory, prefix=".graph_weights.",
+                                                 suffix=".tmp", delete=False) as f:
+                    tmp_path = f.name
+                    json.dump(snapshot, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"Failed to save graph weights: {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                with self._lock:
+                    self._dirty += dirty
+
+    def flush(self):
+        if self._dirty:
+            self.save()
+
+    def _mark_dirty(self):
+        # Called with self._lock held
+        self._dirty += 1
+        if self._flusher is None and not self._stopped.is_set():
+            self._flusher = threading.Thread(target=self._run_flusher, name="graph-flusher", daemon=True)
+            self._flusher.start()
+        if self._dirty >= self.flush_threshold:
+            self._wake.set()
+
+    def _run_flusher(self):
+        while not self._stopped.is_set():
+            self._wake.wait(timeout=self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        """
+        Stops the background flusher and writes any pending updates.
+        """
+        self._stopped.set()
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval + 5)
+        self.flush()
 
     def get_weight(self, collection_name: str) -> float:
-        return self.node_weights[collection_name]
-    
+        # Plain read: don't insert defaults while the flusher may be snapshotting
+        return self.node_weights.get(collection_name, 1.0)
+
     def update(self, collection_name: str, reward: float = 0.1):
         """
         Update the weight of a collection based on user interaction or successful retrieval.
         """
-        self.node_weights[collection_name] += reward
-        self.save()
-        
+        with self._lock:
+            self.node_weights[collection_name] += reward
+            self._mark_dirty()
+        if self._stopped.is_set():
+            # No flusher after shutdown, so persist straight away
+            self.flush()
+
+    def get_edge_weight(self, a: str, b: str) -> float:
+        src, dst = sorted((a, b))
+        edges = self.edge_weights.get(src)
+        return edges.get(dst, 0.0) if edges else 0.0
+
+    def update_many(self, collection_names, reward: float = 0.1, edge_reward: float = 0.0):
+        """
+        Rewards collections that served a result together, and strengthens
+        the co-occurrence edges between them.
+        """
+        names = sorted(set(collection_names))
+        with self._lock:
+            for name in names:
+                self.node_weights[name] += reward
+            if edge_reward:
+                for i, src in enumerate(names):
+                    for dst in names[i + 1:]:
+                        self.edge_weights[src][dst] += edge_reward
+            self._mark_dirty()
+        if self._stopped.is_set():
+            self.flush()
+
     def decay(self):
         """
         Apply decay to all weights to prioritize recent trends.
         """
-        for col in self.node_weights:
-            self.node_weights[col] *= self.decay_rate
-        self.save()
+        with self._lock:
+            for col in self.node_weights:
+                self.node_weights[col] *= self.decay_rate
+            for edges in self.edge_weights.values():
+                for dst in edges:
+                    edges[dst] *= self.decay_rate
+            self._mark_dirty()
+        if self._stopped.is_set():
+            self.flush()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    name TEXT PRIMARY KEY,
+    weight REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    epoch INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS edges (
+    src TEXT NOT NULL,
+    dst TEXT NOT NULL,
+    weight REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    epoch INTEGER NOT NULL,
+    PRIMARY KEY (src, dst)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+
+class SharedCollectionGraph:
+    """
+    Graph weights in a SQLite file (WAL mode) shared by every worker process.
+
+    update() is a read-modify-write inside one write transaction, so rewards
+    from concurrent workers add up instead of overwriting each other. Reads
+    come from a per-process snapshot, reloaded at most every read_ttl
+    seconds and only if another connection has committed since.
+
+    Decay is lazy: each row keeps the time and decay epoch of its last write,
+    and its effective weight is weight * decay_rate ** (decay() calls since
+    then + elapsed / decay_interval), so decay() bumps one counter instead
+    of rewriting every row.
+    """
+
+    def __init__(self, path: str, seed_file: str = GRAPH_FILE, decay_interval: float = None,
+                 read_ttl: float = None):
+        self.path = path
+        self.seed_file = seed_file
+        self.decay_rate = 0.99
+        self.decay_interval = settings.GRAPH_DECAY_INTERVAL if decay_interval is None else decay_interval
+        self.read_ttl = settings.GRAPH_READ_TTL if read_ttl is None else read_ttl
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        # Writes use their own connection, so a write waiting on another
+        # worker's transaction never holds up reads
+        self._write_lock = threading.Lock()
+        self._write_conn = None
+        self._write_pid = None
+        self._data_version = None
+        self._checked_at = 0.0
+        self._nodes = {}
+        self._edges = {}
+
+    def connect(self):
+        # Called with self._lock held; a forked worker opens its own connection
+        if self._conn is None or self._pid != os.getpid():
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+            self._data_version = None
+            self._seed()
+        return self._conn
+
+    def _write_connection(self):
+        # Called with self._write_lock held
+        if self._write_conn is None or self._write_pid != os.getpid():
+            with self._lock:
+                # Schema and seed
+                self.connect()
+            self._write_conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._write_conn.execute("PRAGMA synchronous=NORMAL")
+            self._write_pid = os.getpid()
+        return self._write_conn
+
+    def _seed(self):
+        # First start of the shared store: import the weights learned so far
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seeded = conn.execute("SELECT value FROM meta WHERE key = 'seeded'").fetchone()
+            if seeded is None:
+                if self.seed_file and os.path.exists(self.seed_file):
+                    try:
+                        with open(self.seed_file, 'r') as f:
+                            data = json.load(f)
+                    except Exception as e:
+                        print(f"Failed to load graph weights from {self.seed_file}: {e}")
+                        data = {}
+                    now = time.time()
+                    conn.executemany("INSERT OR IGNORE INTO nodes VALUES (?, ?, ?, 0)",
+                                     [(name, float(w), now) for name, w in data.get("node_weights", {}).items()])
+                    conn.executemany("INSERT OR IGNORE INTO edges VALUES (?, ?, ?, ?, 0)",
+                                     [(src, dst, float(w), now)
+                                      for src, edges in data.get("edge_weights", {}).items()
+                                      for dst, w in edges.items()])
+                conn.execute("INSERT INTO meta VALUES ('seeded', 1)")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _epoch(self, conn) -> int:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'decay_epoch'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _effective(self, weight: float, updated_at: float, epoch: int, now: float, current_epoch: int) -> float:
+        steps = current_epoch - epoch
+        if self.decay_interval > 0:
+            steps += max(now - updated_at, 0.0) / self.decay_interval
+        return weight * self.decay_rate ** steps if steps else weight
+
+    def _refresh(self, force: bool = False):
+        # Called with self._lock held
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.read_ttl:
+            return
+        self._checked_at = now
+        conn = self.connect()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version and not force and self.decay_interval <= 0:
+            return
+        self._data_version = version
+        wall, current_epoch = time.time(), self._epoch(conn)
+        self._nodes = {
+            name: self._effective(w, t, e, wall, current_epoch)
+            for name, w, t, e in conn.execute("SELECT name, weight, updated_at, epoch FROM nodes")
+        }
+        edges = defaultdict(dict)
+        for src, dst, w, t, e in conn.execute("SELECT src, dst, weight, updated_at, epoch FROM edges"):
+            edges[src][dst] = self._effective(w, t, e, wall, current_epoch)
+        self._edges = dict(edges)
+
+    @property
+    def node_weights(self) -> dict:
+        with self._lock:
+            self._refresh()
+            return dict(self._nodes)
+
+    @property
+    def edge_weights(self) -> dict:
+        with self._lock:
+            self._refresh()
+            return {src: dict(edges) for src, edges in self._edges.items()}
+
+    def get_weight(self, collection_name: str) -> float:
+        with self._lock:
+            self._refresh()
+            return self._nodes.get(collection_name, 1.0)
+
+    def get_edge_weight(self, a: str, b: str) -> float:
+        src, dst = sorted((a, b))
+        with self._lock:
+            self._refresh()
+            return self._edges.get(src, {}).get(dst, 0.0)
+
+    def _add(self, conn, table: str, key: tuple, reward: float, default: float, now: float, current_epoch: int):
+        # Called inside a write transaction: decays the stored weight to now, then adds the reward
+        where = "name = ?" if table == "nodes" else "src = ? AND dst = ?"
+        row = conn.execute(f"SELECT weight, updated_at, epoch FROM {table} WHERE {where}", key).fetchone()
+        weight = self._effective(*row, now, current_epoch) if row else default
+        placeholders = ", ".join("?" * (len(key) + 3))
+        conn.execute(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})",
+                     key + (weight + reward, now, current_epoch))
+
+    def update_many(self, collection_names, reward: float = 0.1, edge_reward: float = 0.0):
+        """
+        Rewards collections that served a result together (and the edges
+        between them) in one transaction.
+        """
+        names = sorted(set(collection_names))
+        with self._write_lock:
+            conn = self._write_connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now, current_epoch = time.time(), self._epoch(conn)
+                for name in names:
+                    self._add(conn, "nodes", (name,), reward, 1.0, now, current_epoch)
+                if edge_reward:
+                    for i, src in enumerate(names):
+                        for dst in names[i + 1:]:
+                            self._add(conn, "edges", (src, dst), edge_reward, 0.0, now, current_epoch)
+                conn.execute("COMMIT")
+            except Exception as e:
+                conn.execute("ROLLBACK")
+                print(f"Failed to update graph weights: {e}")
+                return
+        with self._lock:
+            # Our own write: the next read checks data_version and reloads
+            self._checked_at = 0.0
+
+    def update(self, collection_name: str, reward: float = 0.1):
+        """
+        Update the weight of a collection based on user interaction or successful retrieval.
+        """
+        self.update_many([collection_name], reward)
+
+    def decay(self):
+        """
+        Apply decay to all weights to prioritize recent trends (lazily).
+        """
+        with self._lock:
+            conn = self.connect()
+            conn.execute("INSERT INTO meta VALUES ('decay_epoch', 1) "
+                         "ON CONFLICT(key) DO UPDATE SET value = value + 1")
+            self._refresh(force=True)
+
+    def flush(self):
+        # Every update is committed as it happens
+        pass
+
+    def close(self):
+        with self._write_lock:
+            if self._write_conn is not None and self._write_pid == os.getpid():
+                self._write_conn.close()
+            self._write_conn = None
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+def open_graph():
+    if settings.GRAPH_BACKEND == "sqlite":
+        return SharedCollectionGraph(settings.GRAPH_DB_PATH)
+    return CollectionGraph()
 
 # Global instance
-graph_db = CollectionGraph()
+graph_db = open_graph()
+atexit.register(graph_db.close)
@@ -0,0 +1,524 @@
+"""
+Offline ingestion: builds the domain collections from the raw OpenAlex
+JSONL in one parallel pass, into Qdrant or a local snapshot directory.
+
+    input file -> byte-range chunks -> process pool -> ids -> writers -> target
+
+The input is split into byte ranges that end on line boundaries. Each pool
+process reads its ranges itself and does the CPU work the notebooks did
+serially: parse each line, clean_nulls, classify it with the preprocessing
+notebook's concept rules, and encode every indexable paper in large
+batches. A paper that falls in several domains is encoded once. The main
+process takes the chunks back in input order, so point ids are the same
+per-collection counters the notebooks assigned. Upsert batches then go
+through several concurrent writers.
+
+A checkpoint records the input offset, the id counters and the counts of
+the last chunk before which everything has been written. An interrupted
+run picks up from there (pass --restart to start over). Chunks after the
+checkpoint are written again on resume; the ids are the same, so the
+upserts are idempotent.
+
+The local target stages each batch under <output>/.ingest and writes the
+snapshots (app.core.local_index) at the end, since IVF lists are trained
+on the whole collection.
+
+    python -m app.core.ingest --input openalex_cs_2025.jsonl --target qdrant --workers 4 --writers 8
+    python -m app.core.ingest --input openalex_cs_2025.jsonl --target local --output snapshots/
+"""
+import argparse
+import asyncio
+import glob
+import json
+import multiprocessing as mp
+import os
+import shutil
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.corpus import MIN_TEXT_LENGTH, clean_nulls, paper_collections, paper_payload, paper_text
+
+UPSERT_RETRIES = 3
+
+# Set in each pool process by init_worker
+worker_model = None
+worker_batch_size = 256
+
+
+def init_worker(backend: str, threads: int, batch_size: int):
+    global worker_model, worker_batch_size
+    from app.core.embeddings import load_embedding_model
+
+    # Ctrl-C is the main process's to handle; it stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Split the cores between the pool processes instead of each using all of them
+    settings.EMBEDDING_ONNX_THREADS = threads
+    if backend == "torch":
+        import torch
+        torch.set_num_threads(threads)
+    worker_model = load_embedding_model(backend)
+    worker_batch_size = batch_size
+
+
+def prepare_chunk(path: str, start: int, end: int):
+    """
+    Parses, classifies and encodes the lines in [start, end) of the input.
+    Returns {"collections", "payloads", "vectors", "lines", "bad_lines"}
+    with one entry (and one vector row) per indexable paper.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    collections, payloads, texts = [], [], []
+    lines = bad_lines = 0
+    for line in data.split(b"\n"):
+        if not line.strip():
+            continue
+        lines += 1
+        try:
+            paper = clean_nulls(json.loads(line))
+        except ValueError:
+            bad_lines += 1
+            continue
+        text = paper_text(paper)
+        if len(text) < MIN_TEXT_LENGTH:
+            continue
+        collections.append(paper_collections(paper))
+        payloads.append(paper_payload(paper))
+        texts.append(text)
+
+    vectors = None
+    if texts:
+        vectors = np.asarray(worker_model.encode(texts, batch_size=worker_batch_size, normalize_embeddings=True),
+                             dtype=np.float32)
+    return {"collections": collections, "payloads": payloads, "vectors": vectors,
+            "lines": lines, "bad_lines": bad_lines}
+
+
+def iter_chunks(path: str, offset: int, chunk_bytes: int):
+    """
+    Yields (start, end) byte ranges from offset to the end of the file,
+    about chunk_bytes long and ending after a newline.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        while offset < size:
+            end = offset + chunk_bytes
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            end = min(end, size)
+            yield offset, end
+            offset = end
+
+
+class QdrantSink:
+    """
+    Upserts into Qdrant, creating missing collections (cosine distance)
+    on first write.
+    """
+
+    def __init__(self):
+        from qdrant_client import AsyncQdrantClient
+        self.client = AsyncQdrantClient(
+            url=settings.QDRANT_URL,
+            api_key=settings.QDRANT_API_KEY or None,
+            timeout=settings.QDRANT_TIMEOUT,
+            prefer_grpc=settings.QDRANT_PREFER_GRPC
+        )
+        self.ready = set()
+        self.locks = {}
+
+    async def ensure_collection(self, collection: str, dim: int):
+        from qdrant_client import models
+        async with self.locks.setdefault(collection, asyncio.Lock()):
+            if collection in self.ready:
+                return
+            if not await self.client.collection_exists(collection):
+                await self.client.create_collection(
+                    collection_name=collection,
+                    vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE)
+                )
+                print(f"Created collection {collection} ({dim}-dim, cosine)")
+            self.ready.add(collection)
+
+    async def write(self, collection: str, name: str, ids, vectors, payloads):
+        from qdrant_client import models
+        if collection not in self.ready:
+            await self.ensure_collection(collection, vectors.shape[1])
+        for attempt in range(UPSERT_RETRIES):
+            try:
+                await self.client.upsert(
+                    collection_name=collection,
+                    points=models.Batch(ids=ids, vectors=vectors.tolist(), payloads=payloads),
+                    wait=True
+                )
+                return
+            except Exception as e:
+                if attempt == UPSERT_RETRIES - 1:
+                    raise
+                print(f"Upsert of {len(ids)} points into {collection} failed ({e}), retrying")
+                await asyncio.sleep(2 ** attempt)
+
+    def discard_after(self, chunk: int):
+        pass
+
+    async def close(self):
+        await self.client.close()
+
+    async def finish(self, model_id: str, args):
+        await self.close()
+
+
+class LocalSink:
+    """
+    Stages batches as files under <output>/.ingest/<collection>/ and writes
+    each collection's snapshot from them at the end.
+    """
+
+    def __init__(self, output: str):
+        self.output = output
+        self.staging = os.path.join(output, ".ingest")
+
+    def write_part(self, collection: str, name: str, ids, vectors, payloads):
+        directory = os.path.join(self.staging, collection)
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, f"{name}.ids.npy"), np.asarray(ids, dtype=np.int64))
+        np.save(os.path.join(directory, f"{name}.vectors.npy"), vectors)
+        tmp = os.path.join(directory, f"{name}.payloads.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for payload in payloads:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        # The payload file lands last: a part without one is incomplete
+        os.replace(tmp, os.path.join(directory, f"{name}.payloads.jsonl"))
+
+    async def write(self, collection: str, name: str, ids, vectors, payloads):
+        await asyncio.to_thread(self.write_part, collection, name, ids, vectors, payloads)
+
+    def discard_after(self, chunk: int):
+        """
+        Drops parts of chunks after the checkpoint (left by an interrupted
+        run); they are written again.
+        """
+        for path in glob.glob(os.path.join(self.staging, "*", "*-*.*")):
+            if int(os.path.basename(path).split("-", 1)[0]) >= chunk:
+                os.remove(path)
+
+    def build_collection(self, collection: str, model_id: str, args):
+        from app.core.local_index import write_collection
+
+        directory = os.path.join(self.staging, collection)
+        names = sorted(p[:-len(".payloads.jsonl")] for p in glob.glob(os.path.join(directory, "*.payloads.jsonl")))
+        ids = np.concatenate([np.load(f"{name}.ids.npy") for name in names])
+        vectors = np.concatenate([np.load(f"{name}.vectors.npy") for name in names])
+        payloads = []
+        for name in names:
+            with open(f"{name}.payloads.jsonl", "r", encoding="utf-8") as f:
+                payloads.extend(json.loads(line) for line in f)
+        start = time.time()
+        write_collection(os.path.join(self.output, collection), ids, vectors, payloads, args.lists, args.dtype,
+                         model_id)
+        print(f"Wrote {collection}: {len(ids)} points in {time.time() - start:.1f}s")
+
+    async def close(self):
+        pass
+
+    async def finish(self, model_id: str, args):
+        if not os.path.isdir(self.staging):
+            return
+        collections = sorted(os.listdir(self.staging))
+        collections = [c for c in collections if os.path.isdir(os.path.join(self.staging, c))]
+        # IVF training is numpy-heavy; a few collections at a time
+        semaphore = asyncio.Semaphore(max(1, min(args.writers, os.cpu_count() or 1)))
+
+        async def build(collection):
+            async with semaphore:
+                await asyncio.to_thread(self.build_collection, collection, model_id, args)
+
+        await asyncio.gather(*(build(c) for c in collections))
+        shutil.rmtree(self.staging)
+
+
+def load_checkpoint(path: str, fingerprint: dict, restart: bool):
+    if restart or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("fingerprint") != fingerprint:
+        raise SystemExit(f"Checkpoint {path} is for a different input, model or target; "
+                         f"pass --restart to start over")
+    return checkpoint
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)
+
+
+class Progress:
+    """
+    Completed-chunk watermark and throughput counters. A chunk is done once
+    all of its batches are written; the checkpoint moves past a chunk only
+    when it and every chunk before it are done.
+    """
+
+    def __init__(self, checkpoint_path: str, checkpoint: dict):
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint = checkpoint
+        self.pending = {}
+        self.states = {}
+        self.lines = 0
+        self.bad_lines = 0
+        self.encoded = 0
+        self.written = 0
+        self.started = time.perf_counter()
+
+    def add_chunk(self, chunk: int, batches: int, state: dict):
+        self.pending[chunk] = batches
+        self.states[chunk] = state
+        if not batches:
+            self.advance()
+
+    def batch_written(self, chunk: int, points: int):
+        self.written += points
+        self.pending[chunk] -= 1
+        if not self.pending[chunk]:
+            self.advance()
+
+    def advance(self):
+        moved = False
+        while self.pending.get(self.checkpoint["chunks"]) == 0:
+            chunk = self.checkpoint["chunks"]
+            del self.pending[chunk]
+            self.checkpoint.update(self.states.pop(chunk))
+            self.checkpoint["chunks"] = chunk + 1
+            moved = True
+        if moved:
+            save_checkpoint(self.checkpoint_path, self.checkpoint)
+
+    def report(self, size: int, queued: int):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        done = 100.0 * self.checkpoint["offset"] / size if size else 100.0
+        print(f"[{elapsed:7.1f}s] {done:5.1f}% checkpointed | {self.lines} lines ({self.lines / elapsed:.0f}/s) "
+              f"| {self.encoded} encoded ({self.encoded / elapsed:.0f}/s) "
+              f"| {self.written} points written ({self.written / elapsed:.0f}/s) | {queued} batches queued")
+
+
+async def ingest(args):
+    """
+    Runs the pipeline with the CLI options. Returns (counts per collection,
+    Progress), or None when stopped early by a signal. Exits with status 1
+    (checkpoint saved) when a write fails for good.
+    """
+    from app.core.embeddings import embedding_model_id
+
+    model_id = embedding_model_id(args.backend)
+    size = os.path.getsize(args.input)
+    if args.target == "local":
+        sink = LocalSink(args.output)
+        checkpoint_path = args.checkpoint or os.path.join(sink.staging, "checkpoint.json")
+    else:
+        if not settings.QDRANT_URL:
+            raise SystemExit("QDRANT_URL is not set")
+        sink = QdrantSink()
+        checkpoint_path = args.checkpoint or ".cache/ingest_checkpoint.json"
+
+    fingerprint = {"input": os.path.abspath(args.input), "size": size, "model": model_id,
+                   "target": args.target, "destination": args.output if args.target == "local" else settings.QDRANT_URL}
+    checkpoint = load_checkpoint(checkpoint_path, fingerprint, args.restart)
+    if checkpoint is None:
+        if args.target == "local" and os.path.isdir(sink.staging):
+            shutil.rmtree(sink.staging)
+        checkpoint = {"fingerprint": fingerprint, "offset": 0, "chunks": 0, "lines": 0, "next_id": {}, "counts": {}}
+    else:
+        print(f"Resuming from byte {checkpoint['offset']} of {size} ({checkpoint['lines']} lines done)")
+        sink.discard_after(checkpoint["chunks"])
+
+    progress = Progress(checkpoint_path, checkpoint)
+    next_id = dict(checkpoint["next_id"])
+    counts = dict(checkpoint["counts"])
+    lines_done = checkpoint["lines"]
+    queue = asyncio.Queue(maxsize=args.writers * 4)
+
+    async def writer():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            chunk, collection, name, ids, vectors, payloads = item
+            await sink.write(collection, name, ids, vectors, payloads)
+            progress.batch_written(chunk, len(ids))
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(args.report_every)
+            progress.report(size, queue.qsize())
+
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    pool = ProcessPoolExecutor(args.workers, mp_context=mp.get_context("spawn"), initializer=init_worker,
+                               initargs=(args.backend, threads, args.encode_batch_size))
+    loop = asyncio.get_running_loop()
+    writers = [asyncio.create_task(writer()) for _ in range(args.writers)]
+    report_task = asyncio.create_task(reporter())
+    stopping = []
+
+    def stop():
+        if not stopping:
+            print("Stopping: finishing the chunks in flight, then saving the checkpoint")
+        stopping.append(True)
+
+    def failed_writer():
+        for task in writers:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                return task
+        return None
+
+    async def put(item):
+        """
+        Queues an item for the writers. Returns False instead of blocking
+        forever when a writer has died (its write kept failing).
+        """
+        put_task = asyncio.ensure_future(queue.put(item))
+        while not put_task.done():
+            await asyncio.wait({put_task, *[t for t in writers if not t.done()]},
+                               return_when=asyncio.FIRST_COMPLETED)
+            if failed_writer() is not None:
+                put_task.cancel()
+                return False
+        return True
+
+    # Ctrl-C / SIGTERM stop reading and drain, so the checkpoint covers all
+    # work done; the pool processes ignore SIGINT
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop)
+    try:
+        ranges = iter_chunks(args.input, checkpoint["offset"], int(args.chunk_mb * 1024 * 1024))
+        in_flight = []
+        chunk = checkpoint["chunks"]
+
+        def submit():
+            if stopping:
+                return False
+            for start, end in ranges:
+                in_flight.append((start, end, loop.run_in_executor(pool, prepare_chunk, args.input, start, end)))
+                return True
+            return False
+
+        # Keep every pool process busy with one chunk queued behind it
+        while len(in_flight) < args.workers * 2 and submit():
+            pass
+        while in_flight:
+            start, end, future = in_flight.pop(0)
+            result = await future
+            submit()
+
+            progress.lines += result["lines"]
+            progress.bad_lines += result["bad_lines"]
+            lines_done += result["lines"]
+            # Ids in input order, per collection, like the notebooks
+            rows = {}
+            for row, targets in enumerate(result["collections"]):
+                for collection in targets:
+                    rows.setdefault(collection, []).append((next_id.get(collection, 0), row))
+                    next_id[collection] = next_id.get(collection, 0) + 1
+            batches = []
+            for collection, entries in rows.items():
+                counts[collection] = counts.get(collection, 0) + len(entries)
+                for i in range(0, len(entries), args.upsert_batch_size):
+                    part = entries[i:i + args.upsert_batch_size]
+                    batches.append((
+                        chunk, collection, f"{chunk:08d}-{i // args.upsert_batch_size:04d}",
+                        [point_id for point_id, _ in part],
+                        result["vectors"][[row for _, row in part]],
+                        [result["payloads"][row] for _, row in part]
+                    ))
+            progress.encoded += len(result["collections"])
+            progress.add_chunk(chunk, len(batches), {
+                "offset": end, "lines": lines_done, "next_id": dict(next_id), "counts": dict(counts)
+            })
+            for batch in batches:
+                if not await put(batch):
+                    break
+            chunk += 1
+            if failed_writer() is not None:
+                break
+
+        if failed_writer() is None:
+            for _ in writers:
+                if not await put(None):
+                    break
+            await asyncio.wait(writers)
+    finally:
+        report_task.cancel()
+        for task in writers:
+            task.cancel()
+        pool.shutdown(cancel_futures=True)
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+
+    progress.report(size, 0)
+    failed = failed_writer()
+    if failed is not None:
+        # The checkpoint only covers chunks whose every batch was written
+        save_checkpoint(checkpoint_path, progress.checkpoint)
+        await sink.close()
+        raise SystemExit(f"Writing failed: {failed.exception()}\nStopped at byte {progress.checkpoint['offset']} "
+                         f"of {size}; run the same command again to resume from {checkpoint_path}")
+    if stopping:
+        print(f"Stopped at byte {progress.checkpoint['offset']} of {size}; "
+              f"run the same command again to resume from {checkpoint_path}")
+        await sink.close()
+        return None
+    await sink.finish(model_id, args)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if progress.bad_lines:
+        print(f"Skipped {progress.bad_lines} malformed lines")
+    return counts, progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True, help="raw OpenAlex JSONL (one paper per line)")
+    parser.add_argument("--target", choices=["qdrant", "local"], default="qdrant",
+                        help="qdrant uses QDRANT_URL / QDRANT_API_KEY")
+    parser.add_argument("--output", default=settings.LOCAL_INDEX_PATH, help="snapshot directory for --target local")
+    parser.add_argument("--backend", choices=["torch", "onnx"],
+                        default="onnx" if settings.EMBEDDING_BACKEND == "onnx" else "torch")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="encoding processes")
+    parser.add_argument("--threads", type=int, default=0, help="threads per encoding process (default: cores / workers)")
+    parser.add_argument("--writers", type=int, default=8, help="concurrent upserts")
+    parser.add_argument("--chunk-mb", type=float, default=4.0, help="input read per pool task")
+    parser.add_argument("--encode-batch-size", type=int, default=256)
+    parser.add_argument("--upsert-batch-size", type=int, default=512)
+    parser.add_argument("--checkpoint", default=None,
+                        help="default: .cache/ingest_checkpoint.json (qdrant) or <output>/.ingest/checkpoint.json (local)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines")
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float32", help="local target only")
+    parser.add_argument("--lists", type=int, default=None, help="IVF lists per collection, local target only")
+    args = parser.parse_args()
+
+    start = time.time()
+    result = asyncio.run(ingest(args))
+    if result is None:
+        return
+    counts, progress = result
+    total = sum(counts.values())
+    print(f"Read {progress.lines} papers this run; {len(counts)} collections hold {total} points, "
+          f"in {time.time() - start:.1f}s")
+    for collection, count in sorted(counts.items()):
+        print(f"  {collection}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+Embedded vector index that serves the collections from local snapshots
+instead of a remote Qdrant (offline/dev setups, or to skip the network hop).
+
+A snapshot directory holds one sub-directory per collection:
+
+    manifest.json        count, dim, dtype, embedding model, IVF list count
+    vectors.npy          unit-normalized float16/float32 vectors (memory-mapped)
+    ids.npy              point id of each row
+    payloads.bin         compact JSON payloads, back to back
+    payload_offsets.npy  row -> byte range in payloads.bin
+    centroids.npy        IVF centroids (large collections only)
+    list_offsets.npy     IVF list -> row range (rows are stored grouped by list)
+
+Top-k probes the nprobe IVF lists closest to the query. Small collections
+have no IVF and are scored with an exact matmul, which is also the fallback
+when the probed lists hold fewer rows than requested.
+
+LocalSearchBackend has the same query_points / retrieve / get_collections /
+close methods as the AsyncQdrantClient the app uses (see get_search_backend).
+
+Build from the per-domain JSONL files:
+    python -m app.core.local_index --input-dir processed/ --output snapshots/
+"""
+import argparse
+import asyncio
+import json
+import mmap
+import os
+import threading
+import time
+import types
+
+import numpy as np
+
+from app.core.config import settings
+
+# Below this many rows an exact scan is as fast as an IVF probe
+EXACT_SEARCH_THRESHOLD = 20000
+# Rows scored per matmul, bounds the float32 copy of a float16 block
+BLOCK_ROWS = 65536
+KMEANS_SAMPLES_PER_LIST = 64
+
+
+class LocalPoint:
+    __slots__ = ("id", "score", "payload")
+
+    def __init__(self, id, score, payload):
+        self.id = id
+        self.score = score
+        self.payload = payload
+
+
+class LocalQueryResponse:
+    def __init__(self, points):
+        self.points = points
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores, k: int):
+    """
+    Indices of the k highest scores, best first.
+    """
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class LocalCollection:
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.ids = np.load(os.path.join(path, "ids.npy"))
+        self.id_order = np.argsort(self.ids, kind="stable")
+        self.sorted_ids = self.ids[self.id_order]
+        self.payload_offsets = np.load(os.path.join(path, "payload_offsets.npy"))
+        self.payloads = b""
+        with open(os.path.join(path, "payloads.bin"), "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                self.payloads = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.centroids = None
+        self.list_offsets = None
+        if os.path.exists(os.path.join(path, "centroids.npy")):
+            self.centroids = np.load(os.path.join(path, "centroids.npy"))
+            self.list_offsets = np.load(os.path.join(path, "list_offsets.npy"))
+        elif self.vectors.dtype != np.float32:
+            # Exact scans of float16 are dominated by the upcast; collections
+            # without IVF are small, so hold them as float32 in memory
+            self.vectors = np.asarray(self.vectors, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def score_rows(self, query, start: int, end: int):
+        scores = np.empty(end - start, dtype=np.float32)
+        for block in range(start, end, BLOCK_ROWS):
+            stop = min(block + BLOCK_ROWS, end)
+            scores[block - start:stop - start] = np.asarray(self.vectors[block:stop], dtype=np.float32) @ query
+        return scores
+
+    def search(self, query, k: int, nprobe: int = 8, exact: bool = False):
+        """
+        Returns (rows, scores) of the k rows closest to query, best first.
+        """
+        query = normalize(query)
+        if not exact and self.centroids is not None and nprobe < len(self.centroids):
+            lists = top_k(self.centroids @ query, nprobe)
+            ranges = [(int(self.list_offsets[l]), int(self.list_offsets[l + 1])) for l in lists]
+            if sum(end - start for start, end in ranges) >= k:
+                rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+                scores = np.concatenate([self.score_rows(query, start, end) for start, end in ranges])
+                best = top_k(scores, k)
+                return rows[best], scores[best]
+        scores = self.score_rows(query, 0, len(self))
+        best = top_k(scores, k)
+        return best, scores[best]
+
+    def search_batch(self, queries, k: int, nprobe: int = 8, exact: bool = False):
+        """
+        search() for many queries. Exact search scores the whole batch with
+        one matrix product per block of rows; IVF search goes query by query.
+        """
+        queries = normalize(np.asarray(queries, dtype=np.float32))
+        if not exact and self.centroids is not None and nprobe < len(self.centroids):
+            return [self.search(q, k, nprobe) for q in queries]
+        scores = np.empty((len(queries), len(self)), dtype=np.float32)
+        for block in range(0, len(self), BLOCK_ROWS):
+            stop = min(block + BLOCK_ROWS, len(self))
+            scores[:, block:stop] = queries @ np.asarray(self.vectors[block:stop], dtype=np.float32).T
+        results = []
+        for row_scores in scores:
+            best = top_k(row_scores, k)
+            results.append((best, row_scores[best]))
+        return results
+
+    def rows_for_ids(self, ids):
+        """
+        Row for each point id (None where the id isn't in the collection).
+        """
+        rows = []
+        for point_id in ids:
+            try:
+                point_id = int(point_id)
+            except (TypeError, ValueError):
+                rows.append(None)
+                continue
+            i = int(np.searchsorted(self.sorted_ids, point_id))
+            found = i < len(self.sorted_ids) and self.sorted_ids[i] == point_id
+            rows.append(int(self.id_order[i]) if found else None)
+        return rows
+
+    def payload(self, row: int, with_payload=True):
+        if with_payload is False or with_payload is None:
+            return None
+        data = json.loads(self.payloads[self.payload_offsets[row]:self.payload_offsets[row + 1]])
+        if with_payload is True:
+            return data
+        return {field: data[field] for field in with_payload if field in data}
+
+    def close(self):
+        if isinstance(self.payloads, mmap.mmap):
+            self.payloads.close()
+
+
+class LocalSearchBackend:
+    """
+    Serves query_points, query_batch_points and retrieve from the snapshots under root. Collections
+    are opened on first use; scoring runs in a worker thread (numpy releases
+    the GIL) so the event loop stays free.
+    """
+
+    def __init__(self, root: str, nprobe: int = 16):
+        self.root = root
+        self.nprobe = nprobe
+        self.collections = {}
+        self.lock = threading.Lock()
+
+    def collection(self, name: str) -> LocalCollection:
+        with self.lock:
+            if name not in self.collections:
+                path = os.path.join(self.root, name)
+                if not os.path.exists(os.path.join(path, "manifest.json")):
+                    raise ValueError(f"Collection {name} not found in {self.root}")
+                self.collections[name] = LocalCollection(path)
+            return self.collections[name]
+
+    def query_points_sync(self, collection_name: str, query, limit: int = 10, offset: int = 0,
+                          with_payload=True):
+        col = self.collection(collection_name)
+        rows, scores = col.search(query, min(offset + limit, len(col)), self.nprobe)
+        return LocalQueryResponse([
+            LocalPoint(col.ids[row].item(), float(score), col.payload(row, with_payload))
+            for row, score in zip(rows[offset:], scores[offset:])
+        ])
+
+    def query_batch_points_sync(self, collection_name: str, requests):
+        """
+        Requests are qdrant QueryRequest-shaped (query, limit, offset,
+        with_payload); all of them are scored together.
+        """
+        col = self.collection(collection_name)
+        k = min(max((r.limit or 10) + (r.offset or 0) for r in requests), len(col))
+        responses = []
+        for r, (rows, scores) in zip(requests, col.search_batch([r.query for r in requests], k, self.nprobe)):
+            offset = r.offset or 0
+            end = offset + (r.limit or 10)
+            responses.append(LocalQueryResponse([
+                LocalPoint(col.ids[row].item(), float(score), col.payload(row, r.with_payload))
+                for row, score in zip(rows[offset:end], scores[offset:end])
+            ]))
+        return responses
+
+    def retrieve_sync(self, collection_name: str, ids, with_payload=True):
+        col = self.collection(collection_name)
+        return [
+            LocalPoint(col.ids[row].item(), None, col.payload(row, with_payload))
+            for row in col.rows_for_ids(ids) if row is not None
+        ]
+
+    async def query_points(self, collection_name: str, query, limit: int = 10, offset: int = 0,
+                           with_payload=True, **kwargs):
+        return await asyncio.to_thread(self.query_points_sync, collection_name, query, limit, offset, with_payload)
+
+    async def query_batch_points(self, collection_name: str, requests, **kwargs):
+        return await asyncio.to_thread(self.query_batch_points_sync, collection_name, requests)
+
+    async def retrieve(self, collection_name: str, ids, with_payload=True, **kwargs):
+        return await asyncio.to_thread(self.retrieve_sync, collection_name, ids, with_payload)
+
+    async def get_collections(self):
+        names = sorted(
+            name for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, name, "manifest.json"))
+        ) if os.path.isdir(self.root) else []
+        return types.SimpleNamespace(collections=[types.SimpleNamespace(name=name) for name in names])
+
+    async def close(self):
+        with self.lock:
+            for col in self.collections.values():
+                col.close()
+            self.collections.clear()
+
+
+def assign_lists(vectors, centroids):
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for block in range(0, len(vectors), BLOCK_ROWS):
+        chunk = np.asarray(vectors[block:block + BLOCK_ROWS], dtype=np.float32)
+        assignment[block:block + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignment
+
+
+def train_ivf(vectors, n_lists: int, iterations: int = 10, seed: int = 0):
+    """
+    Spherical k-means on a sample of the (unit-normalized) vectors.
+    """
+    rng = np.random.default_rng(seed)
+    n_samples = min(len(vectors), n_lists * KMEANS_SAMPLES_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), n_samples, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(n_samples, n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = assign_lists(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        counts = np.bincount(assignment, minlength=n_lists)
+        empty = counts == 0
+        # Re-seed empty lists from random samples so no list is wasted
+        sums[empty] = sample[rng.choice(n_samples, int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+def default_list_count(n: int) -> int:
+    return 0 if n < EXACT_SEARCH_THRESHOLD else int(4 * np.sqrt(n))
+
+
+def write_collection(output_dir: str, ids, vectors, payloads, n_lists: int = None, dtype: str = "float32",
+                     model_id: str = None):
+    """
+    Writes one collection snapshot. vectors is (n, dim) float32; rows are
+    reordered so each IVF list is contiguous on disk.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    ids = np.asarray(ids, dtype=np.int64)
+    vectors = normalize(vectors)
+    if n_lists is None:
+        n_lists = default_list_count(len(vectors))
+    n_lists = min(n_lists, len(vectors))
+
+    order = np.arange(len(vectors))
+    if n_lists:
+        centroids = train_ivf(vectors, n_lists)
+        assignment = assign_lists(vectors, centroids)
+        order = np.argsort(assignment, kind="stable")
+        list_offsets = np.searchsorted(assignment[order], np.arange(n_lists + 1)).astype(np.int64)
+        np.save(os.path.join(output_dir, "centroids.npy"), centroids)
+        np.save(os.path.join(output_dir, "list_offsets.npy"), list_offsets)
+    else:
+        for name in ("centroids.npy", "list_offsets.npy"):
+            if os.path.exists(os.path.join(output_dir, name)):
+                os.remove(os.path.join(output_dir, name))
+
+    np.save(os.path.join(output_dir, "vectors.npy"), vectors[order].astype(dtype))
+    np.save(os.path.join(output_dir, "ids.npy"), ids[order])
+
+    offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    with open(os.path.join(output_dir, "payloads.bin"), "wb") as f:
+        for i, row in enumerate(order):
+            blob = json.dumps(payloads[row], separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            f.write(blob)
+            offsets[i + 1] = offsets[i] + len(blob)
+    np.save(os.path.join(output_dir, "payload_offsets.npy"), offsets)
+
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "count": int(len(order)),
+            "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            "dtype": dtype,
+            "metric": "cosine",
+            "model": model_id,
+            "n_lists": int(n_lists)
+        }, f, indent=2)
+
+
+def build_snapshots(input_dir: str, output: str, dtype: str = "float32", n_lists: int = None,
+                    batch_size: int = 64):
+    from app.core.corpus import iter_indexable_papers, paper_payload
+    from app.core.embeddings import embedding_model_id, load_embedding_model
+
+    model = load_embedding_model()
+    columns = {}
+
+    def encode_pending(col):
+        texts = col["pending"]
+        if texts:
+            col["vectors"].append(model.encode(texts, batch_size=batch_size, normalize_embeddings=True))
+            col["pending"] = []
+
+    for collection, point_id, text, paper in iter_indexable_papers(input_dir):
+        col = columns.setdefault(collection, {"ids": [], "payloads": [], "pending": [], "vectors": []})
+        col["ids"].append(point_id)
+        col["payloads"].append(paper_payload(paper))
+        col["pending"].append(text)
+        if len(col["pending"]) >= batch_size * 16:
+            encode_pending(col)
+
+    for collection, col in columns.items():
+        encode_pending(col)
+        start = time.time()
+        write_collection(os.path.join(output, collection), col["ids"], np.concatenate(col["vectors"]),
+                         col["payloads"], n_lists, dtype, embedding_model_id())
+        print(f"Wrote {collection}: {len(col['ids'])} points in {time.time() - start:.1f}s")
+    return {collection: len(col["ids"]) for collection, col in columns.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input-dir", required=True, help="directory with the per-domain <domain>.jsonl files")
+    parser.add_argument("--output", default=settings.LOCAL_INDEX_PATH)
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float32",
+                        help="float16 halves vector memory but scores ~2-3x slower (upcast per probe)")
+    parser.add_argument("--lists", type=int, default=None,
+                        help="IVF lists per collection (default: 4*sqrt(n) above the exact-search threshold, 0 = exact only)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    start = time.time()
+    counts = build_snapshots(args.input_dir, args.output, args.dtype, args.lists, args.batch_size)
+    print(f"Exported {sum(counts.values())} points in {len(counts)} collections to {args.output} "
+          f"in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Latency histograms, counters and per-request stage traces, exposed in the
+Prometheus text format at /metrics.
+
+Stage timers also append a span to the current request's Trace (held in a
+ContextVar, so tasks spawned by the request record into the same trace),
+which /search returns when called with debug=1.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+registry = []
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(dict(zip(self.labelnames, key)))} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.series = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                labels = dict(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{format_labels(dict(labels, le=format_value(bound)))} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(series['sum'])}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {series['count']}")
+        return lines
+
+
+class Callback:
+    """
+    Gauge or counter whose samples are read at scrape time from fn(), which
+    returns a list of (labels dict, value) - for state other modules already
+    track (cache stats, queue depths).
+    """
+
+    def __init__(self, name: str, help: str, fn, kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+        registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            samples = self.fn()
+        except Exception as e:
+            print(f"Metric {self.name} failed: {e}")
+            samples = []
+        for labels, value in samples:
+            lines.append(f"{self.name}{format_labels(labels)} {format_value(value)}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram(
+    "scholargraph_stage_seconds", "Time spent in each search pipeline stage.", ["stage"]
+)
+QDRANT_SECONDS = Histogram(
+    "scholargraph_qdrant_request_seconds", "Search backend calls per collection.", ["collection", "operation"]
+)
+QDRANT_ERRORS = Counter(
+    "scholargraph_qdrant_errors_total", "Failed search backend calls per collection.", ["collection", "operation"]
+)
+SEARCH_SECONDS = Histogram(
+    "scholargraph_search_seconds", "End-to-end graph_optimized_search latency.", ["cached"]
+)
+GEMINI_SECONDS = Histogram(
+    "scholargraph_gemini_seconds", "Gemini call latency.", ["operation"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.8, 1.0, 2.0, 5.0, 10.0, 30.0)
+)
+GEMINI_ERRORS = Counter(
+    "scholargraph_gemini_errors_total", "Failed Gemini calls.", ["operation"]
+)
+GEMINI_REJECTED = Counter(
+    "scholargraph_gemini_rejected_total", "Gemini calls failed fast by the open circuit breaker.", ["operation"]
+)
+GEMINI_TIMEOUTS = Counter(
+    "scholargraph_gemini_timeouts_total", "Gemini calls that missed their deadline.", ["operation"]
+)
+EXPANSION_DEADLINE_MISSES = Counter(
+    "scholargraph_expansion_deadline_misses_total", "Query expansions that missed the speculative deadline."
+)
+FANOUT_COLLECTIONS = Histogram(
+    "scholargraph_fanout_collections", "Collections searched for a query's first window.", buckets=(1, 2, 3, 4, 5)
+)
+FANOUT_CALLS_SAVED = Counter(
+    "scholargraph_fanout_calls_saved_total", "Backend calls saved versus the fixed top-3 fan-out."
+)
+FANOUT_EARLY_STOPS = Counter(
+    "scholargraph_fanout_early_stops_total", "First windows served by the top collection alone (early stop)."
+)
+CHAT_PROMPT_TOKENS = Histogram(
+    "scholargraph_chat_prompt_tokens", "Estimated prompt tokens per chat turn.",
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 8000)
+)
+HTTP_SECONDS = Histogram(
+    "scholargraph_http_request_seconds", "HTTP request latency by route.", ["method", "route", "status"]
+)
+
+
+class Trace:
+    """
+    Stage spans of one request, for the debug breakdown.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def add(self, stage: str, started: float, elapsed: float, labels: dict):
+        self.spans.append(dict(
+            {"stage": stage, "start_ms": round((started - self.start) * 1000, 2),
+             "ms": round(elapsed * 1000, 2)},
+            **labels
+        ))
+
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def stage(name: str, **labels):
+    """
+    Times a pipeline stage into scholargraph_stage_seconds and the current
+    request's trace. Extra labels only go to the trace.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add(name, started, elapsed, labels)
+
+
+@contextmanager
+def backend_call(collection: str, operation: str):
+    """
+    Times one search backend call (Qdrant or local); failures are counted
+    and re-raised.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        QDRANT_ERRORS.inc(collection=collection, operation=operation)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        QDRANT_SECONDS.observe(elapsed, collection=collection, operation=operation)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add("qdrant", started, elapsed, {"collection": collection, "operation": operation})
+
+
+@contextmanager
+def gemini_call(operation: str):
+    """
+    Times one Gemini call; failures are counted and re-raised.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        GEMINI_ERRORS.inc(operation=operation)
+        raise
+    finally:
+        GEMINI_SECONDS.observe(time.perf_counter() - started, operation=operation)
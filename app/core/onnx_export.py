@@ -0,0 +1,123 @@
+"""
+Exports the embedding model to ONNX, quantizes it to int8 and checks parity.
+
+The export directory holds model.onnx (fp32), model_quantized.onnx (int8,
+dynamic quantization) and tokenizer.json; point EMBEDDING_ONNX_PATH at it
+and set EMBEDDING_BACKEND=onnx. The parity check encodes a fixed query set
+with both backends and fails if any cosine falls below the threshold.
+
+    python -m app.core.onnx_export --output models/all-MiniLM-L6-v2-onnx
+    python -m app.core.onnx_export --output models/all-MiniLM-L6-v2-onnx --check-only
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.embeddings import OnnxEmbedder
+
+PARITY_QUERIES = [
+    "vision transformers for image classification",
+    "transformers for vision",
+    "reinforcement learning from human feedback",
+    "policy gradient methods for robotic control",
+    "graph neural networks for molecule property prediction",
+    "federated learning with differential privacy",
+    "self-supervised speech representation learning",
+    "diffusion models for image synthesis",
+    "explainable ai in healthcare",
+    "large language models hallucination detection",
+    "query optimization in distributed databases",
+    "intrusion detection in computer networks",
+    "semantic segmentation of medical images",
+    "machine translation for low-resource languages",
+    "bayesian optimization of hyperparameters",
+    "ai",
+]
+
+INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+
+
+def export(output_dir: str, model_name: str = settings.EMBEDDING_MODEL, quantize: bool = True, opset: int = 17):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(output_dir)  # writes tokenizer.json for the fast path
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    sample = tokenizer(["a sample query"], return_tensors="pt")
+    inputs = tuple(sample[name] for name in INPUT_NAMES)
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    export_kwargs = dict(
+        input_names=INPUT_NAMES,
+        output_names=["last_hidden_state"],
+        dynamic_axes={name: {0: "batch", 1: "sequence"} for name in INPUT_NAMES + ["last_hidden_state"]},
+        opset_version=opset,
+    )
+    with torch.no_grad():
+        try:
+            torch.onnx.export(model, inputs, fp32_path, dynamo=False, **export_kwargs)
+        except TypeError:
+            # Older torch without the dynamo switch
+            torch.onnx.export(model, inputs, fp32_path, **export_kwargs)
+    print(f"Exported {model_name} to {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quant_path = os.path.join(output_dir, "model_quantized.onnx")
+        quantize_dynamic(fp32_path, quant_path, weight_type=QuantType.QInt8)
+        print(f"Quantized to int8 at {quant_path}")
+
+
+def check_parity(model_dir: str, reference=None, queries=PARITY_QUERIES) -> dict:
+    """
+    Compares ONNX vectors with the torch SentenceTransformer on a fixed query
+    set: per-query cosine, plus whether both pick the same top-1 collection.
+    """
+    if reference is None:
+        from sentence_transformers import SentenceTransformer
+        reference = SentenceTransformer(settings.EMBEDDING_MODEL, device="cpu")
+    candidate = OnnxEmbedder(model_dir)
+
+    ref = reference.encode(queries, normalize_embeddings=True)
+    got = candidate.encode(queries, normalize_embeddings=True)
+    cosines = np.sum(ref * got, axis=1)
+
+    descriptions = list(settings.COLLECTIONS.values())
+    ref_routes = np.argmax(ref @ reference.encode(descriptions, normalize_embeddings=True).T, axis=1)
+    got_routes = np.argmax(got @ candidate.encode(descriptions, normalize_embeddings=True).T, axis=1)
+
+    return {
+        "queries": len(queries),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "routing_agreement": float(np.mean(ref_routes == got_routes)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=settings.EMBEDDING_ONNX_PATH)
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL)
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("--check-only", action="store_true", help="skip export, only run the parity check")
+    parser.add_argument("--threshold", type=float, default=0.99, help="minimum per-query cosine")
+    args = parser.parse_args()
+
+    if not args.check_only:
+        export(args.output, args.model, quantize=not args.no_quantize)
+
+    report = check_parity(args.output)
+    print(f"Parity over {report['queries']} queries: min cosine {report['min_cosine']:.4f}, "
+          f"mean {report['mean_cosine']:.4f}, routing agreement {report['routing_agreement']:.0%}")
+    if report["min_cosine"] < args.threshold:
+        print(f"Parity check FAILED (threshold {args.threshold})")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# Payload fields the results page renders, for collections built by
+# app.core.ingest (SEARCH_PAYLOAD_SNIPPETS=true): the snippet and author
+# summary are stored at ingest (search_fields), so the full abstract and
+# author list never cross the wire for a results page. The full payload is
+# fetched on the /analysis path.
+SEARCH_PAYLOAD_FIELDS = [
+    "title",
+    "snippet",
+    "snippet_truncated",
+    "first_author",
+    "author_count",
+    "publication_year",
+    "venue",
+    "citation_count",
+    "url",
+    "doi",
+    "is_open_access",
+    "publication_date",
+]
+
+# The default, which works on the notebooks' collections too: the snippet
+# is cut after transfer
+FULL_SEARCH_PAYLOAD_FIELDS = [
+    "title",
+    "abstract",
+    "publication_year",
+    "venue",
+    "citation_count",
+    "url",
+    "doi",
+    "is_open_access",
+    "authors",
+    "publication_date",
+]
+
+
+def search_fields(payload: dict, snippet_length: int = 300) -> dict:
+    """
+    The results-page summary of a paper's abstract and authors, stored in
+    its payload at ingest.
+    """
+    # The notebooks store null for a missing abstract or author list
+    abstract = payload.get("abstract") or ""
+    authors = payload.get("authors") or []
+    return {
+        "snippet": abstract[:snippet_length],
+        "snippet_truncated": len(abstract) > snippet_length,
+        "first_author": (authors[0] or {}).get("name") or "Unknown Author" if authors else None,
+        "author_count": len(authors)
+    }
+
+class SearchHit:
+    """
+    Compact record for one search result.
+    Holds only what the results page renders, with the abstract cut to a snippet.
+    """
+    __slots__ = (
+        "id", "score", "collection", "display_collection", "title", "abstract",
+        "abstract_truncated", "year", "venue", "citations", "url", "doi", "is_oa",
+        "first_author", "author_count"
+    )
+
+    def __init__(self, id, score, collection, display_collection, title, abstract,
+                 abstract_truncated, year, venue, citations, url, doi, is_oa,
+                 first_author, author_count):
+        self.id = id
+        self.score = score
+        self.collection = collection
+        self.display_collection = display_collection
+        self.title = title
+        self.abstract = abstract
+        self.abstract_truncated = abstract_truncated
+        self.year = year
+        self.venue = venue
+        self.citations = citations
+        self.url = url
+        self.doi = doi
+        self.is_oa = is_oa
+        self.first_author = first_author
+        self.author_count = author_count
+
+    @classmethod
+    def from_point(cls, point, collection: str, display_collection: str, snippet_length: int = 300):
+        payload = point.payload or {}
+        if "snippet" not in payload:
+            # Full abstract and authors (older collections): summarize here
+            payload = {**payload, **search_fields(payload, snippet_length)}
+        snippet = payload.get("snippet") or ""
+        return cls(
+            id=point.id,
+            score=point.score,
+            collection=collection,
+            display_collection=display_collection,
+            title=payload.get("title") or "No Title",
+            abstract=snippet[:snippet_length],
+            abstract_truncated=bool(payload.get("snippet_truncated")) or len(snippet) > snippet_length,
+            year=payload.get("publication_year", "N/A"),
+            venue=payload.get("venue", "Unknown Venue"),
+            citations=payload.get("citation_count", 0),
+            url=payload.get("url", "#"),
+            doi=payload.get("doi", ""),
+            is_oa=payload.get("is_open_access", False),
+            first_author=payload.get("first_author"),
+            author_count=payload.get("author_count") or 0
+        )
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def paper_details(point, collection: str, display_collection: str) -> dict:
+    """
+    Paper detail record for the /analysis page and the analysis prompt.
+    Built from a full retrieve, or from a search hit's projected payload
+    (which has no concepts).
+    """
+    payload = point.payload or {}
+    return {
+        "id": point.id,
+        "collection": collection,
+        "display_collection": display_collection,
+        "title": payload.get("title") or "No Title",
+        "abstract": payload.get("abstract") or "",
+        "year": payload.get("publication_year", "N/A"),
+        "date": payload.get("publication_date", ""),
+        "venue": payload.get("venue", "Unknown Venue"),
+        "citations": payload.get("citation_count", 0),
+        "url": payload.get("url", "#"),
+        "doi": payload.get("doi", ""),
+        "authors": payload.get("authors") or [],
+        "concepts": payload.get("concepts") or []
+    }
@@ -1,17 +1,66 @@
-from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer
 import numpy as np
 from app.core.config import settings
 from app.core.graph import graph_db
-from app.core.gemini_service import expand_query
+from app.core.gemini_service import expand_query, get_genai, generate_paper_analysis, stream_paper_analysis, ANALYSIS_PROMPT_VERSION
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.gemini_service import chat_system_prompt, send_chat_message, stream_chat_message, summarize_conversation
+from app.core.chat_sessions import ChatSession
+from app.core.analysis_cache import AnalysisCache
+from app.core.embeddings import EmbeddingBatcher, load_embedding_model, embedding_model_id
+from app.core.cache import LRUCache, QueryVectorCache, SemanticResultCache, normalize_query
+from app.core.records import SearchHit, SEARCH_PAYLOAD_FIELDS, FULL_SEARCH_PAYLOAD_FIELDS, paper_details
+from app.core.sessions import ResultSession, session_token
+from app.core.suggest_index import SuggestIndex
+from app.core.metrics import Callback, Trace, backend_call, current_trace, stage, SEARCH_SECONDS, EXPANSION_DEADLINE_MISSES
+from app.core.metrics import FANOUT_COLLECTIONS, FANOUT_CALLS_SAVED, FANOUT_EARLY_STOPS, CHAT_PROMPT_TOKENS
+import hashlib
+import markdown
+import os
+import queue
+import threading
 import time
 
 # Global variables for lazy loading
 client = None
+async_client = None
+local_backend = None
 model = None
+batcher = None
+suggest_index = None
+suggest_index_loaded = False
+batcher_lock = threading.Lock()
 collection_vectors = None
 collection_names = None
 
+# Query caches (cheap to build, filled on demand)
+query_cache = QueryVectorCache(
+    embedding_model_id(),
+    max_size=settings.QUERY_CACHE_SIZE,
+    ttl=settings.QUERY_CACHE_TTL,
+    disk_path=settings.QUERY_CACHE_DISK_PATH,
+    disk_slots=settings.QUERY_CACHE_DISK_SLOTS
+)
+router_cache = LRUCache(max_size=settings.QUERY_CACHE_SIZE, ttl=settings.QUERY_CACHE_TTL)
+
+# Ranked result sets for cursor pagination, keyed by cursor token
+result_sessions = LRUCache(max_size=settings.RESULT_SESSION_CACHE_SIZE, ttl=settings.RESULT_SESSION_TTL)
+
+# The same sessions by the embedding of the user's query, for paraphrases
+semantic_cache = SemanticResultCache(
+    max_size=settings.SEMANTIC_CACHE_SIZE,
+    ttl=settings.SEMANTIC_CACHE_TTL,
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD
+)
+
+# Paper details by (collection, id): seeded by search hits, filled by retrieve
+paper_cache = LRUCache(max_size=settings.PAPER_CACHE_SIZE, ttl=settings.PAPER_CACHE_TTL)
+
+# Chat sessions by id (paper context, turns and summary live server-side)
+chat_sessions = LRUCache(max_size=settings.CHAT_SESSION_CACHE_SIZE, ttl=settings.CHAT_SESSION_TTL)
+
+# Gemini paper analyses, persisted on disk and shared by concurrent viewers
+analysis_cache = AnalysisCache(settings.ANALYSIS_CACHE_PATH, ANALYSIS_PROMPT_VERSION, settings.GEMINI_MODEL)
+
 def get_client():
     global client
     if client is None:
@@ -19,61 +68,203 @@ def get_client():
             print("Warning: QDRANT_URL not set. Search will fail.")
             return None
         try:
+            from qdrant_client import QdrantClient
             client = QdrantClient(
                 url=settings.QDRANT_URL,
-                api_key=settings.QDRANT_API_KEY,
-                timeout=60
+                api_key=settings.QDRANT_API_KEY or None,
+                timeout=settings.QDRANT_TIMEOUT
             )
         except Exception as e:
             print(f"Failed to initialize Qdrant client: {e}")
             return None
     return client
 
+def get_async_client():
+    """
+    Async Qdrant client used by the search and paper-detail paths.
+    Requests share one pooled HTTP (or gRPC) connection set.
+    """
+    global async_client
+    if async_client is None:
+        if not settings.QDRANT_URL:
+            print("Warning: QDRANT_URL not set. Search will fail.")
+            return None
+        try:
+            from qdrant_client import AsyncQdrantClient
+            async_client = AsyncQdrantClient(
+                url=settings.QDRANT_URL,
+                api_key=settings.QDRANT_API_KEY or None,
+                timeout=settings.QDRANT_TIMEOUT,
+                prefer_grpc=settings.QDRANT_PREFER_GRPC,
+                pool_size=settings.QDRANT_POOL_SIZE
+            )
+        except Exception as e:
+            print(f"Failed to initialize async Qdrant client: {e}")
+            return None
+    return async_client
+
+def get_search_backend():
+    """
+    What the search and paper-detail paths query: the async Qdrant client,
+    or the embedded local index when SEARCH_BACKEND=local. Both provide
+    query_points, retrieve, get_collections and close.
+    """
+    global local_backend
+    if settings.SEARCH_BACKEND == "local":
+        if local_backend is None:
+            from app.core.local_index import LocalSearchBackend
+            local_backend = LocalSearchBackend(settings.LOCAL_INDEX_PATH, settings.LOCAL_INDEX_NPROBE)
+        return local_backend
+    return get_async_client()
+
+async def close_clients():
+    global async_client, local_backend
+    if async_client is not None:
+        await async_client.close()
+        async_client = None
+    if local_backend is not None:
+        await local_backend.close()
+        local_backend = None
+
 def get_model():
     global model
     if model is None:
         print("Loading Embedding Model...")
         try:
-            # Force CPU device to avoid "meta tensor" errors on some environments
-            model = SentenceTransformer(settings.EMBEDDING_MODEL, device='cpu')
-            print("Model Loaded.")
+            model = load_embedding_model()
+            print(f"Model Loaded ({settings.EMBEDDING_BACKEND} backend).")
         except Exception as e:
             print(f"Failed to load embedding model: {e}")
             return None
     return model
 
+def get_batcher():
+    global batcher
+    if batcher is None:
+        with batcher_lock:
+            if batcher is None:
+                batcher = EmbeddingBatcher(
+                    get_model,
+                    max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+                    batch_window=settings.EMBEDDING_BATCH_WINDOW_MS / 1000.0,
+                    max_queue_size=settings.EMBEDDING_QUEUE_SIZE
+                )
+    return batcher
+
+def encode_query(text: str):
+    """
+    Encodes a single query through the query cache and shared micro-batcher.
+    Returns None if the model is unavailable or the queue stays full.
+    """
+    vector = query_cache.get(text)
+    if vector is not None:
+        return vector
+    try:
+        vector = get_batcher().encode(text)
+    except Exception as e:
+        print(f"Failed to encode query: {e}")
+        return None
+    query_cache.set(text, vector)
+    return vector
+
+def get_cache_stats():
+    return {
+        "query_vectors": query_cache.stats(),
+        "router": router_cache.stats(),
+        "papers": paper_cache.stats(),
+        "analyses": analysis_cache.stats(),
+        "sessions": result_sessions.stats(),
+        "semantic": semantic_cache.stats(),
+        "chat_sessions": chat_sessions.stats()
+    }
+
+def cache_metric_samples(field: str):
+    stats = get_cache_stats()
+    tiers = {
+        "query_vectors": stats["query_vectors"]["memory"],
+        "query_vectors_disk": stats["query_vectors"]["disk"],
+        "router": stats["router"],
+        "papers": stats["papers"],
+        "analyses": stats["analyses"],
+        "sessions": stats["sessions"],
+        "semantic": stats["semantic"],
+        "chat_sessions": stats["chat_sessions"]
+    }
+    return [({"cache": name}, tier[field]) for name, tier in tiers.items() if tier and field in tier]
+
+def queue_depth_samples():
+    samples = [({"queue": "embedding_executor"}, embedding_executor.queued)]
+    if batcher is not None:
+        samples.append(({"queue": "embedding_batcher"}, batcher.stats()["queue_depth"]))
+    samples.append(({"queue": "analyses_in_flight"}, len(analysis_cache.inflight)))
+    return samples
+
+Callback("scholargraph_cache_hits_total", "Cache hits.", lambda: cache_metric_samples("hits"), kind="counter")
+Callback("scholargraph_cache_misses_total", "Cache misses.", lambda: cache_metric_samples("misses"), kind="counter")
+Callback("scholargraph_cache_size", "Entries held per cache.", lambda: cache_metric_samples("size"))
+Callback("scholargraph_queue_depth", "Work waiting in executor and batcher queues.", queue_depth_samples)
+
+def router_vectors_path():
+    """
+    Router vectors are persisted per (model, collection descriptions), so a
+    restart with the same setup skips re-encoding them.
+    """
+    key = embedding_model_id() + "\n" + "\n".join(f"{n}={d}" for n, d in settings.COLLECTIONS.items())
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(settings.ROUTER_VECTORS_DIR, f"router_vectors_{digest}.npy")
+
 def get_collection_data():
     global collection_vectors, collection_names
     if collection_vectors is None:
-        m = get_model()
-        if m:
-            collection_names = list(settings.COLLECTIONS.keys())
-            collection_descriptions = list(settings.COLLECTIONS.values())
-            collection_vectors = m.encode(collection_descriptions, normalize_embeddings=True)
-        else:
-            return [], []
+        names = list(settings.COLLECTIONS.keys())
+        path = router_vectors_path()
+        vectors = None
+        if os.path.exists(path):
+            try:
+                vectors = np.load(path)
+            except Exception as e:
+                print(f"Failed to load router vectors from {path}: {e}")
+        if vectors is None or len(vectors) != len(names):
+            m = get_model()
+            if not m:
+                return [], []
+            vectors = m.encode(list(settings.COLLECTIONS.values()), normalize_embeddings=True)
+            try:
+                os.makedirs(settings.ROUTER_VECTORS_DIR, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.save(f, vectors)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"Failed to persist router vectors to {path}: {e}")
+        collection_names = names
+        collection_vectors = vectors
     return collection_vectors, collection_names
 
 def get_embedding(text: str):
-    m = get_model()
-    if not m:
+    vector = encode_query(text)
+    if vector is None:
         return []
-    return m.encode(text, normalize_embeddings=True).tolist()
+    return vector.tolist()
 
 def master_router(query: str, top_k: int = 3, query_vector=None):
     """
     Stage 1: Semantic Routing
     Finds the most relevant collections based on vector similarity.
     """
+    cache_key = query_cache.key(query)
+    cached = router_cache.get(cache_key)
+    if cached is not None:
+        return [dict(item) for item in cached[:top_k]]
+
     if query_vector is None:
-        m = get_model()
-        if not m:
-            return []
-        query_vector = m.encode(query, normalize_embeddings=True)
+        query_vector = encode_query(query)
+    if query_vector is None or len(query_vector) == 0:
+        return []
     
     vectors, names = get_collection_data()
-    if not vectors is not None and len(vectors) > 0:
-         return []
+    if vectors is None or len(vectors) == 0:
+        return []
 
     # Compute cosine similarity
     scores = np.dot(vectors, query_vector)
@@ -85,34 +276,74 @@ def master_router(query: str, top_k: int = 3, query_vector=None):
         
     # Sort by score
     ranked_collections.sort(key=lambda x: x["semantic_score"], reverse=True)
+    router_cache.set(cache_key, ranked_collections)
     
-    return ranked_collections[:top_k]
+    return [dict(item) for item in ranked_collections[:top_k]]
 
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 
-# Create a thread pool for blocking operations
-executor = ThreadPoolExecutor(max_workers=3)
+class QueuedThreadPool(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor that counts the tasks submitted but not yet started
+    (the queue depth metric), without reading the pool's private queue.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queued = 0
+        self.queued_lock = threading.Lock()
 
-async def graph_optimized_search(query: str, page: int = 1, limit: int = 15):
+    def dequeued(self):
+        with self.queued_lock:
+            self.queued -= 1
+
+    def submit(self, fn, /, *args, **kwargs):
+        def run():
+            self.dequeued()
+            return fn(*args, **kwargs)
+        with self.queued_lock:
+            self.queued += 1
+        try:
+            future = super().submit(run)
+        except BaseException:
+            # Shut down: the task never reached the queue
+            self.dequeued()
+            raise
+        # A future can only be cancelled before it starts (e.g. a timed-out await)
+        future.add_done_callback(lambda f: self.dequeued() if f.cancelled() else None)
+        return future
+
+# Dedicated thread pool for CPU-bound embedding and routing work.
+# Qdrant calls are native async and never queue behind it.
+embedding_executor = QueuedThreadPool(max_workers=settings.EMBEDDING_WORKERS, thread_name_prefix="embedding")
+
+async def get_embedding_async(text: str):
     """
-    Stage 2 & 3: Graph Re-ranking & Search
-    Combines semantic score with graph weights and searches Qdrant.
+    Awaits the micro-batcher without parking an executor thread on it.
+    Only falls back to the executor when the queue is full (backpressure).
+    """
+    vector = query_cache.get(text)
+    if vector is not None:
+        return vector.tolist()
+    b = get_batcher()
+    try:
+        try:
+            future = b.submit(text, block=False)
+        except queue.Full:
+            loop = asyncio.get_running_loop()
+            future = await loop.run_in_executor(embedding_executor, b.submit, text)
+        vector = await asyncio.wrap_future(future)
+    except Exception as e:
+        print(f"Failed to encode query: {e}")
+        return []
+    query_cache.set(text, vector)
+    return vector.tolist()
+
+def rank_routes(candidates):
+    """
+    Stage 2: Graph Re-ranking
+    Combines each candidate's semantic score with its learned graph weight.
     """
-    start_time = time.time()
-    
-    # 0. Query Expansion (Async)
-    expanded_query = await expand_query(query)
-    
-    # 1. Generate Embedding ONCE (Blocking - Run in ThreadPool)
-    loop = asyncio.get_event_loop()
-    query_vector = await loop.run_in_executor(executor, get_embedding, expanded_query)
-    
-    # 2. Get Semantic Candidates (Fast now, but keep in executor for safety)
-    # Pass the pre-computed vector to avoid re-encoding
-    candidates = await loop.run_in_executor(executor, master_router, expanded_query, 4, query_vector)
-    
-    # 3. Apply Graph Weights (Re-ranking)
     final_routes = []
     for item in candidates:
         col_name = item["name"]
@@ -135,87 +366,585 @@ async def graph_optimized_search(query: str, page: int = 1, limit: int = 15):
         
     # Sort by hybrid score
     final_routes.sort(key=lambda x: x["score"], reverse=True)
-    
-    # Select top collections to search (e.g., top 2 or 3)
-    selected_collections = final_routes[:3]
-    
-    # Calculate pagination
-    num_collections = len(selected_collections)
-    per_collection_limit = max(1, limit // num_collections)
-    offset = (page - 1) * per_collection_limit
-
-    # 4. Perform Vector Search in Selected Collections (Parallel)
-    all_results = []
-    c = get_client()
-    if not c:
-        return {"results": [], "latency": 0, "routed_to": []}
+    return final_routes
 
-    def search_single_collection(route, vector, limit, offset):
-        col_name = route["name"]
-        display_name = route["display_name"]
-        results = []
-        try:
-            hits = c.query_points(
+# The fan-out before adaptive selection: always the top 3 collections
+FIXED_FANOUT = 3
+
+def select_routes(final_routes):
+    """
+    Adaptive fan-out: the top collection, plus the next ones whose hybrid
+    score is within FANOUT_SCORE_MARGIN of it. Each selected route gets a
+    per-window hit budget proportional to its score.
+    """
+    if not final_routes:
+        return []
+    if not settings.ADAPTIVE_FANOUT:
+        selected = final_routes[:FIXED_FANOUT]
+        for route in selected:
+            route["budget"] = settings.RESULT_WINDOW_PER_COLLECTION
+        return selected
+
+    top_score = final_routes[0]["score"]
+    selected = [
+        route for route in final_routes[:settings.FANOUT_MAX_COLLECTIONS]
+        if top_score - route["score"] <= settings.FANOUT_SCORE_MARGIN
+    ]
+    weights = [max(float(route["score"]), 1e-6) for route in selected]
+    for route, weight in zip(selected, weights):
+        share = round(settings.FANOUT_RESULT_BUDGET * weight / sum(weights))
+        route["budget"] = max(settings.FANOUT_MIN_WINDOW, share)
+    return selected
+
+def search_payload_fields():
+    return SEARCH_PAYLOAD_FIELDS if settings.SEARCH_PAYLOAD_SNIPPETS else FULL_SEARCH_PAYLOAD_FIELDS
+
+async def search_single_collection(route, vector, limit, offset):
+    """
+    One window of one collection as SearchHits, or None if the backend call
+    failed (so a failure isn't mistaken for a short, exhausted window).
+    """
+    c = get_search_backend()
+    col_name = route["name"]
+    display_name = route["display_name"]
+    results = []
+    try:
+        # Only the fields the results page renders; /analysis fetches the rest
+        with backend_call(col_name, "query"):
+            response = await c.query_points(
                 collection_name=col_name,
                 query=vector,
                 limit=limit,
                 offset=offset,
-                with_payload=True
-            ).points
-            
-            if hits:
-                graph_db.update(col_name, reward=0.5)
-                
-            for hit in hits:
-                payload = hit.payload
-                results.append({
-                    "id": hit.id,
-                    "score": hit.score,
-                    "collection": col_name,
-                    "display_collection": display_name,
-                    "title": payload.get("title", "No Title"),
-                    "abstract": payload.get("abstract", ""),
-                    "year": payload.get("publication_year", "N/A"),
-                    "date": payload.get("publication_date", ""),
-                    "venue": payload.get("venue", "Unknown Venue"),
-                    "citations": payload.get("citation_count", 0),
-                    "url": payload.get("url", "#"),
-                    "doi": payload.get("doi", ""),
-                    "is_oa": payload.get("is_open_access", False),
-                    "authors": payload.get("authors", []),
-                    "concepts": payload.get("concepts", [])[:5]
-                })
-        except Exception as e:
-            print(f"Error searching collection {col_name}: {e}")
-        return results
+                with_payload=search_payload_fields()
+            )
+        for hit in response.points:
+            results.append(SearchHit.from_point(hit, col_name, display_name, settings.SNIPPET_LENGTH))
+            # A full-projection hit already has what /analysis needs; keep it
+            # for a click-through (snippet hits are fetched in full on a miss)
+            if not settings.SEARCH_PAYLOAD_SNIPPETS:
+                paper_cache.add(paper_cache_key(col_name, hit.id), paper_details(hit, col_name, display_name))
+    except Exception as e:
+        print(f"Error searching collection {col_name}: {e}")
+        return None
+    return results
+
+async def search_routes(session, routes, window: int):
+    """
+    Fetches the next window of each given route in parallel and merges the
+    hits into the session. A route whose call failed keeps its offset and
+    stays pending for the next window. Returns the number of hits fetched.
+    """
+    results_lists = await asyncio.gather(*[
+        search_single_collection(route, session.query_vector, route.get("budget", window),
+                                 session.offsets[route["name"]])
+        for route in routes
+    ])
+    session.calls += len(routes)
+    fetched = 0
+    for route, r_list in zip(routes, results_lists):
+        if r_list is None:
+            continue
+        session.add_window(route["name"], r_list, route.get("budget", window))
+        fetched += len(r_list)
+    return fetched
+
+async def fill_session(session, window: int, include_deferred: bool = True):
+    """
+    Fetches the next window from every collection that isn't exhausted, in
+    parallel, and merges it into the session. Routes carrying a "budget"
+    (see select_routes) use it instead of window. Routes an early stop
+    deferred are left out unless include_deferred. Returns the number of hits fetched.
+    """
+    pending = session.pending_routes(include_deferred)
+    if not pending:
+        return 0
+    # The fixed fan-out would search its top collections that aren't exhausted yet
+    session.fixed_calls += max(session.fixed_width - sum(session.exhausted.values()), len(pending))
+    session.deferred.difference_update(r["name"] for r in pending)
+    fetched = await search_routes(session, pending, window)
+    record_fanout(session)
+    return fetched
+
+def record_fanout(session):
+    """
+    Updates the session's fan-out report from the calls it has really made
+    and counts newly saved calls (versus the fixed top-3 fan-out) in the metric.
+    """
+    saved = max(session.fixed_calls - session.calls, 0)
+    if saved > session.saved_counted:
+        FANOUT_CALLS_SAVED.inc(saved - session.saved_counted)
+        session.saved_counted = saved
+    if session.fanout is not None:
+        session.fanout["calls"] = session.calls
+        session.fanout["saved_calls"] = saved
 
-    # Create tasks for parallel execution
-    search_tasks = []
-    for route in selected_collections:
-        search_tasks.append(
-            loop.run_in_executor(executor, search_single_collection, route, query_vector, per_collection_limit, offset)
-        )
+async def fill_first_window_early_stop(session):
+    """
+    First window with early stop: the top collection is queried at once and
+    the others wait up to FANOUT_EARLY_STOP_DELAY_MS for it. If it returns
+    enough high-score hits by then, the others are deferred (a deeper page
+    that needs them still reaches them). Returns True if it stopped early.
+    """
+    session.fixed_calls += session.fixed_width
+    try:
+        return await early_stop_window(session)
+    finally:
+        record_fanout(session)
+
+async def early_stop_window(session):
+    window = settings.RESULT_WINDOW_PER_COLLECTION
+    primary, others = session.routes[0], session.routes[1:]
+    primary_task = asyncio.create_task(search_routes(session, [primary], window))
+    done, _ = await asyncio.wait({primary_task}, timeout=settings.FANOUT_EARLY_STOP_DELAY_MS / 1000.0)
+
+    if not done:
+        # The top collection is slow: don't hold the others back any longer
+        await asyncio.gather(primary_task, search_routes(session, others, window))
+        return False
+
+    primary_task.result()
+    confident = sum(1 for hit in session.hits if hit.score >= settings.FANOUT_EARLY_STOP_SCORE)
+    if confident >= settings.FANOUT_EARLY_STOP_HITS:
+        FANOUT_EARLY_STOPS.inc()
+        session.deferred.update(r["name"] for r in others)
+        return True
+    await search_routes(session, others, window)
+    return False
+
+async def refill_session(session):
+    async with session.lock:
+        return await fill_session(session, settings.RESULT_WINDOW_PER_COLLECTION, include_deferred=False)
+
+async def serve_session_page(session, page: int, limit: int):
+    """
+    Serves a page from the session's cached candidates, fetching more first
+    if needed so that has_next is exact. When the next page would run short,
+    the following window is prefetched in the background (collections an
+    early stop skipped are only searched once a page needs them).
+    """
+    end = page * limit
+    with stage("page"):
+        async with session.lock:
+            while len(session.hits) <= end and not session.complete:
+                # Nothing fetched and nothing exhausted: the backend is failing
+                if not await fill_session(session, settings.RESULT_WINDOW_PER_COLLECTION) and not session.complete:
+                    break
+            results, has_next = session.page(page, limit)
+
+    if session.pending_routes(include_deferred=False) and len(session.hits) <= end + limit:
+        if session.refill_task is None or session.refill_task.done():
+            session.refill_task = asyncio.create_task(refill_session(session))
+    return results, has_next
+
+async def run_search_pipeline(search_query: str):
+    """
+    Embeds, routes and searches Qdrant for a single query string.
+    Returns a ResultSession holding the first window of merged hits,
+    or None if routing failed.
+    """
+    # 1. Generate Embedding ONCE (joins the shared micro-batch)
+    loop = asyncio.get_running_loop()
+    with stage("embed", query=search_query):
+        query_vector = await get_embedding_async(search_query)
     
-    # Wait for all searches to complete
-    results_lists = await asyncio.gather(*search_tasks)
+    with stage("route", query=search_query):
+        # 2. Get Semantic Candidates (Fast now, but keep in executor for safety)
+        # Pass the pre-computed vector to avoid re-encoding
+        candidates = await loop.run_in_executor(embedding_executor, master_router, search_query, 4, query_vector)
+        
+        # 3. Apply Graph Weights (Re-ranking)
+        final_routes = rank_routes(candidates)
     
-    # Flatten results
-    for r_list in results_lists:
-        all_results.extend(r_list)
-            
-    # 5. Final Merge & Sort
-    # Sort all results by their vector score
-    all_results.sort(key=lambda x: x["score"], reverse=True)
+    # Select the collections the router is confident about (at most 3)
+    selected_collections = select_routes(final_routes)
+    if not selected_collections:
+        return None
+
+    # 4. Perform Vector Search in Selected Collections (Parallel, async I/O)
+    # 5. Final Merge & Sort happens inside the session, by vector score
+    session = ResultSession(session_token(search_query, selected_collections), search_query,
+                            query_vector, selected_collections)
+    session.candidates = candidates
+    session.fixed_width = min(FIXED_FANOUT, len(final_routes))
+    session.fanout = {
+        "collections": [r["name"] for r in selected_collections],
+        "calls": 0,
+        "saved_calls": 0,
+        "early_stop": False,
+    }
+    with stage("fanout", query=search_query):
+        if settings.FANOUT_EARLY_STOP and len(selected_collections) > 1:
+            session.fanout["early_stop"] = await fill_first_window_early_stop(session)
+        else:
+            await fill_session(session, settings.RESULT_WINDOW_PER_COLLECTION)
+
+    FANOUT_COLLECTIONS.observe(len(selected_collections))
+    return session
+
+# Expansion calls in progress, which may outlive their search's deadline
+# (referenced here so they aren't garbage collected)
+late_expansions = set()
+
+async def expand_query_within_deadline(query: str, deadline: float):
+    """
+    Runs Gemini query expansion, giving up waiting once the deadline
+    (seconds) passes. Returns None when the expansion did not arrive in time.
+    The deadline is a latency budget, not a health signal: the call itself
+    keeps running to GEMINI_EXPAND_TIMEOUT, so only a real timeout or error
+    counts against the circuit breaker.
+    """
+    task = asyncio.create_task(expand_query(query))
+    late_expansions.add(task)
+    task.add_done_callback(late_expansions.discard)
+    try:
+        with stage("expand"):
+            return await asyncio.wait_for(asyncio.shield(task), timeout=deadline)
+    except asyncio.TimeoutError:
+        EXPANSION_DEADLINE_MISSES.inc()
+        print(f"Query expansion missed the {deadline}s deadline, serving raw query")
+        return None
+
+async def search_expansion(expanded_query: str):
+    """
+    Embeds and routes the expanded query and fetches one window from each
+    collection it selects. Returns the hits, to merge into the raw query's
+    session rather than building a second one.
+    """
+    loop = asyncio.get_running_loop()
+    with stage("embed", query=expanded_query):
+        vector = await get_embedding_async(expanded_query)
+    if not vector:
+        return []
+    with stage("route", query=expanded_query):
+        candidates = await loop.run_in_executor(embedding_executor, master_router, expanded_query, 4, vector)
+        routes = select_routes(rank_routes(candidates))
+    with stage("fanout", query=expanded_query):
+        results_lists = await asyncio.gather(*[
+            search_single_collection(route, vector, route.get("budget", settings.RESULT_WINDOW_PER_COLLECTION), 0)
+            for route in routes
+        ])
+    return [hit for r_list in results_lists if r_list for hit in r_list]
+
+def routing_unchanged(session) -> bool:
+    """
+    Whether the current graph weights still route a cached session's query
+    to the collections it searched (otherwise its semantic cache entry is stale).
+    """
+    if not session.candidates:
+        return True
+    current = {route["name"] for route in select_routes(rank_routes(session.candidates))}
+    return current == {route["name"] for route in session.routes}
+
+# Graph writes run off the event loop, one at a time: the shared SQLite
+# store's write transaction can wait on other workers for seconds
+graph_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="graph")
+
+def reward_collections(collection_names):
+    """
+    Queues the reward for a background write; the search doesn't wait for it.
+    Collections that served a result set together also strengthen their edge.
+    """
+    graph_executor.submit(graph_db.update_many, collection_names, 0.5, 0.1)
+
+async def graph_optimized_search(query: str, page: int = 1, limit: int = 15, speculative: bool = None,
+                                 cursor: str = None, debug: bool = False):
+    """
+    Stage 2 & 3: Graph Re-ranking & Search
+    Combines semantic score with graph weights and searches Qdrant.
+
+    In speculative mode the raw query is searched straight away while Gemini
+    expands it; if the expansion arrives within settings.EXPANSION_DEADLINE,
+    its hits are merged into the raw results.
+
+    The merged result set is cached under a cursor token; passing it back
+    serves later pages without re-running expansion, embedding or routing.
+    A new query close enough in meaning to a recent one (semantic_cache)
+    is served that query's result set the same way.
+
+    With debug set, the response also carries the per-stage spans.
+    """
+    trace = Trace()
+    token = current_trace.set(trace)
+    try:
+        response = await run_graph_optimized_search(query, page, limit, speculative, cursor)
+    finally:
+        current_trace.reset(token)
+    SEARCH_SECONDS.observe(time.perf_counter() - trace.start, cached=str(response["cached"]).lower())
+    if debug:
+        response["stages"] = sorted(trace.spans, key=lambda span: span["start_ms"])
+    return response
+
+async def run_graph_optimized_search(query: str, page: int, limit: int, speculative: bool, cursor: str):
+    start_time = time.time()
+    if speculative is None:
+        speculative = settings.SPECULATIVE_SEARCH
+
+    session = result_sessions.get(cursor) if cursor else None
+    if session is not None and normalize_query(query) not in session.source_queries:
+        session = None
+    cached = session is not None
+
+    query_vector = None
+    semantic_match = None
+    if session is None and settings.SEMANTIC_CACHE:
+        # A paraphrase of a recent query reuses its result set
+        with stage("semantic_cache"):
+            query_vector = await get_embedding_async(query)
+            hit = semantic_cache.lookup(query_vector, routing_unchanged) if query_vector else None
+        if hit is not None:
+            session, semantic_match = hit[0], round(hit[1], 4)
+            session.source_queries.add(normalize_query(query))
+            result_sessions.set(session.token, session)
+            cached = True
+
+    if session is None:
+        if not get_search_backend():
+            return {"results": [], "latency": 0, "routed_to": [], "page": page, "has_next": False,
+                    "served_by": "none", "expanded_query": None, "cursor": None, "cached": False,
+                    "semantic_match": None, "fanout": None}
+
+        if not speculative:
+            # 0. Query Expansion (Async)
+            with stage("expand"):
+                expanded_query = await expand_query(query)
+            session = await run_search_pipeline(expanded_query)
+            served_by = "expanded"
+        else:
+            # 0. Speculative: search the raw query while the expansion is in flight.
+            # An expansion that arrives in time extends the raw results (its
+            # search runs while the raw one is still going) instead of replacing them.
+            # The deadline covers the expansion and its search, so this path
+            # never waits longer than max(raw search, EXPANSION_DEADLINE).
+            started = time.perf_counter()
+            raw_task = asyncio.create_task(run_search_pipeline(query))
+            expanded_query = await expand_query_within_deadline(query, settings.EXPANSION_DEADLINE)
+
+            expansion_task = None
+            if expanded_query and expanded_query != query:
+                expansion_task = asyncio.create_task(search_expansion(expanded_query))
+
+            session = await raw_task
+            expansion_hits = []
+            if expansion_task is not None:
+                remaining = settings.EXPANSION_DEADLINE - (time.perf_counter() - started)
+                done, _ = await asyncio.wait({expansion_task}, timeout=max(remaining, 0))
+                if done:
+                    expansion_hits = expansion_task.result()
+                else:
+                    expansion_task.cancel()
+                    EXPANSION_DEADLINE_MISSES.inc()
+                    print(f"Expanded search missed the {settings.EXPANSION_DEADLINE}s deadline, serving raw query")
+            served_by = "raw"
+            if session is not None and session.merge_hits(expansion_hits):
+                served_by = "expanded"
+
+        if session is None:
+            return {"results": [], "latency": round(time.time() - start_time, 3), "routed_to": [],
+                    "page": page, "has_next": False, "served_by": served_by, "expanded_query": None,
+                    "cursor": None, "cached": False, "semantic_match": None,
+                    "fanout": None}
+
+        session.served_by = served_by
+        session.source_queries.add(normalize_query(query))
+        session.expanded_query = expanded_query if served_by == "expanded" else None
+        result_sessions.set(session.token, session)
+        if query_vector and session.hits:
+            semantic_cache.add(query_vector, session)
+
+        # Reward only the collections that served the result set (written
+        # in the background)
+        reward_collections([name for name, offset in session.offsets.items() if offset])
+
+    results, has_next = await serve_session_page(session, page, limit)
     
     latency = time.time() - start_time
     
     return {
-        "results": all_results[:limit],
+        "results": results,
         "latency": round(latency, 3),
-        "routed_to": selected_collections,
-        "page": page
+        "routed_to": session.routes,
+        "page": page,
+        "has_next": has_next,
+        "served_by": session.served_by,
+        "expanded_query": session.expanded_query,
+        "cursor": session.token,
+        "cached": cached,
+        "semantic_match": semantic_match,
+        "fanout": session.fanout
     }
 
+def encode_queries(texts):
+    """
+    Encodes many queries at once: cached vectors from the query cache, the
+    rest in one batched model.encode call. Returns an (n, dim) array, or
+    None if the model is unavailable.
+    """
+    vectors = [query_cache.get(text) for text in texts]
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        m = get_model()
+        if m is None:
+            return None
+        encoded = m.encode([texts[i] for i in missing], normalize_embeddings=True,
+                           batch_size=settings.EMBEDDING_MAX_BATCH_SIZE)
+        for i, vector in zip(missing, encoded):
+            vector = np.asarray(vector, dtype=np.float32)
+            query_cache.set(texts[i], vector)
+            vectors[i] = vector
+    return np.vstack(vectors)
+
+def route_queries(query_vectors, top_k: int = 4):
+    """
+    Routes a batch of query vectors with one matrix product against the
+    router vectors, then graph re-ranking and fan-out selection per query.
+    Returns one list of selected routes per query.
+    """
+    vectors, names = get_collection_data()
+    if vectors is None or len(vectors) == 0:
+        return [[] for _ in range(len(query_vectors))]
+    scores = query_vectors @ np.asarray(vectors).T
+    routes = []
+    for row in scores:
+        best = np.argsort(-row)[:top_k]
+        candidates = [{"name": names[j], "semantic_score": float(row[j])} for j in best]
+        routes.append(select_routes(rank_routes(candidates)))
+    return routes
+
+async def search_collection_batch(col_name: str, vectors, limit: int):
+    """
+    One batched query call for several query vectors against one
+    collection. Returns a list of SearchHit lists (or None on failure).
+    """
+    from qdrant_client import models
+    c = get_search_backend()
+    display_name = settings.COLLECTION_DISPLAY_NAMES.get(col_name, col_name)
+    requests = [
+        models.QueryRequest(query=vector.tolist(), limit=limit, with_payload=search_payload_fields())
+        for vector in vectors
+    ]
+    try:
+        with backend_call(col_name, "query_batch"):
+            responses = await c.query_batch_points(collection_name=col_name, requests=requests)
+    except Exception as e:
+        print(f"Error batch searching collection {col_name}: {e}")
+        return None
+    return [
+        [SearchHit.from_point(hit, col_name, display_name, settings.SNIPPET_LENGTH) for hit in response.points]
+        for response in responses
+    ]
+
+async def batch_search(queries, limit: int = 10):
+    """
+    Searches many raw queries together and yields one result dict per query
+    as soon as all of its collections have answered (not in input order).
+
+    The batch is embedded in one encode call and routed with one matrix
+    product; queries are grouped by collection and each group (up to
+    BATCH_SEARCH_GROUP_SIZE) goes to the backend as one batched query.
+    There is no Gemini expansion, and batch traffic doesn't reward the graph.
+    """
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    with stage("embed"):
+        query_vectors = await loop.run_in_executor(embedding_executor, encode_queries, list(queries))
+    if query_vectors is None or not get_search_backend():
+        for index, query in enumerate(queries):
+            yield {"index": index, "query": query, "results": [], "routed_to": [], "error": "search unavailable"}
+        return
+    with stage("route"):
+        routes = await loop.run_in_executor(embedding_executor, route_queries, query_vectors)
+
+    groups = {}
+    for index, query_routes in enumerate(routes):
+        for route in query_routes:
+            groups.setdefault(route["name"], []).append(index)
+    remaining = [len(r) for r in routes]
+    hits = [[] for _ in queries]
+    failed = [[] for _ in queries]
+
+    def finished(index):
+        merged = sorted(hits[index], key=lambda x: x.score, reverse=True)[:limit]
+        return {
+            "index": index,
+            "query": queries[index],
+            "routed_to": [r["name"] for r in routes[index]],
+            "results": [hit.to_dict() for hit in merged],
+            "failed_collections": failed[index],
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+
+    for index, count in enumerate(remaining):
+        if not count:
+            yield finished(index)
+
+    async def run_group(col_name, indexes):
+        return col_name, indexes, await search_collection_batch(col_name, query_vectors[indexes], limit)
+
+    size = settings.BATCH_SEARCH_GROUP_SIZE
+    tasks = [
+        asyncio.create_task(run_group(col_name, indexes[i:i + size]))
+        for col_name, indexes in groups.items()
+        for i in range(0, len(indexes), size)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            col_name, indexes, results = await next_done
+            for position, index in enumerate(indexes):
+                if results is None:
+                    failed[index].append(col_name)
+                else:
+                    hits[index].extend(results[position])
+                remaining[index] -= 1
+                if remaining[index] == 0:
+                    yield finished(index)
+    finally:
+        # Client went away mid-stream: don't leave the rest running
+        for task in tasks:
+            task.cancel()
+
+def get_suggest_index():
+    global suggest_index, suggest_index_loaded
+    if not suggest_index_loaded:
+        suggest_index_loaded = True
+        path = settings.SUGGEST_INDEX_PATH
+        if path and os.path.exists(path):
+            try:
+                suggest_index = SuggestIndex.load(path)
+                print(f"Loaded suggest index with {len(suggest_index)} terms.")
+            except Exception as e:
+                print(f"Failed to load suggest index {path}: {e}")
+        else:
+            print(f"Suggest index {path} not found, falling back to keyword suggestions.")
+    return suggest_index
+
+def lookup_suggestions(query: str):
+    """
+    Answers /suggest from the corpus prefix index, without the model.
+    Returns None when there is no index or nothing matches the prefix.
+    """
+    index = get_suggest_index()
+    if index is None:
+        return None
+    matches = index.complete(query, k=4)
+    if not matches:
+        return None
+    normalized = normalize_query(query)
+    col_name = matches[0][2]
+    return {
+        "completions": [term for term, _, _ in matches if term != normalized][:3],
+        "predicted_domain": settings.COLLECTION_DISPLAY_NAMES.get(col_name, col_name),
+        "graph_weight": graph_db.get_weight(col_name)
+    }
+
+async def get_suggestions_async(query: str):
+    data = lookup_suggestions(query)
+    if data is None:
+        # No prefix match: keyword scan + semantic routing off the event loop
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(embedding_executor, get_suggestions, query)
+    return data
+
 def get_suggestions(query: str):
     """
     Provides real-time suggestions and routing preview.
@@ -249,50 +978,188 @@ def get_suggestions(query: str):
         "graph_weight": graph_db.get_weight(col_name)
     }
 
-def get_paper_details(collection_name: str, paper_id: str):
+def warmup():
+    """
+    Loads everything the first request would otherwise pay for: the model
+    (plus a dummy encode through the batcher), router vectors, the suggest
+    index and the Gemini SDK. Returns per-step timings in seconds.
+    """
+    timings = {}
+    steps = [
+        ("model", get_model),
+        ("encode", lambda: get_batcher().encode("warmup query")),
+        ("router_vectors", get_collection_data),
+        ("suggest_index", get_suggest_index),
+        ("gemini_sdk", get_genai),
+    ]
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"Warmup step {name} failed: {e}")
+        timings[name] = round(time.perf_counter() - start, 3)
+    return timings
+
+async def warmup_async():
+    loop = asyncio.get_running_loop()
+    timings = await loop.run_in_executor(embedding_executor, warmup)
+
+    # Open the Qdrant connection pool (or map the local snapshots) so the
+    # first search skips the handshake
+    start = time.perf_counter()
+    c = get_search_backend()
+    if c:
+        try:
+            response = await c.get_collections()
+            if c is local_backend:
+                for col in response.collections:
+                    c.collection(col.name)
+        except Exception as e:
+            print(f"Warmup search backend connection failed: {e}")
+    timings["search_backend"] = round(time.perf_counter() - start, 3)
+    print(f"Warmup done: {timings}")
+    return timings
+
+def paper_cache_key(collection_name: str, paper_id):
+    return (collection_name, str(paper_id))
+
+def qdrant_point_id(paper_id):
+    # Qdrant requires integer IDs to be passed as integers, not strings
+    return int(paper_id) if str(paper_id).isdigit() else paper_id
+
+async def get_papers_details(collection_name: str, paper_ids):
     """
-    Fetches a single paper's details from Qdrant by ID.
+    Fetches several papers of one collection, in order (None where missing).
+    Cached papers come from memory, the rest from a single batched retrieve.
     """
-    c = get_client()
+    results = [paper_cache.get(paper_cache_key(collection_name, pid)) for pid in paper_ids]
+    missing = list(dict.fromkeys(str(pid) for pid, r in zip(paper_ids, results) if r is None))
+    if not missing:
+        return results
+
+    c = get_search_backend()
     if not c:
-        return None
+        return results
 
     try:
-        # Try to convert ID to integer if it looks like one
-        # Qdrant requires integer IDs to be passed as integers, not strings
-        if str(paper_id).isdigit():
-            qdrant_id = int(paper_id)
-        else:
-            qdrant_id = paper_id
-
-        # Qdrant retrieve API
-        points = c.retrieve(
-            collection_name=collection_name,
-            ids=[qdrant_id],
-            with_payload=True
-        )
-        
-        if not points:
+        with backend_call(collection_name, "retrieve"):
+            points = await c.retrieve(
+                collection_name=collection_name,
+                ids=[qdrant_point_id(pid) for pid in missing],
+                with_payload=True
+            )
+    except Exception as e:
+        print(f"Error fetching papers {missing} from {collection_name}: {e}")
+        return results
+
+    display_name = settings.COLLECTION_DISPLAY_NAMES.get(collection_name, collection_name)
+    fetched = {}
+    for point in points:
+        details = paper_details(point, collection_name, display_name)
+        paper_cache.set(paper_cache_key(collection_name, point.id), details)
+        fetched[str(point.id)] = details
+    return [r if r is not None else fetched.get(str(pid)) for pid, r in zip(paper_ids, results)]
+
+async def get_paper_details(collection_name: str, paper_id: str):
+    """
+    Fetches a single paper's details (paper cache first, then Qdrant by ID).
+    """
+    return (await get_papers_details(collection_name, [paper_id]))[0]
+
+async def get_paper_analysis(collection_name: str, paper_id: str):
+    """
+    Returns the rendered analysis HTML for a paper, or None if the paper
+    doesn't exist. Cached analyses skip both the Qdrant lookup and Gemini.
+    """
+    async def compute():
+        paper = await get_paper_details(collection_name, paper_id)
+        if not paper:
             return None
-            
-        point = points[0]
-        payload = point.payload
-        
-        return {
-            "id": point.id,
-            "collection": collection_name,
-            "display_collection": settings.COLLECTION_DISPLAY_NAMES.get(collection_name, collection_name),
-            "title": payload.get("title", "No Title"),
-            "abstract": payload.get("abstract", ""),
-            "year": payload.get("publication_year", "N/A"),
-            "date": payload.get("publication_date", ""),
-            "venue": payload.get("venue", "Unknown Venue"),
-            "citations": payload.get("citation_count", 0),
-            "url": payload.get("url", "#"),
-            "doi": payload.get("doi", ""),
-            "authors": payload.get("authors", []),
-            "concepts": payload.get("concepts", [])
-        }
+        abstract_text = paper.get("abstract") or "Abstract not available."
+        analysis_md = await generate_paper_analysis(paper["title"], abstract_text)
+        return analysis_md, markdown.markdown(analysis_md)
+
+    try:
+        result = await analysis_cache.get_or_compute(collection_name, paper_id, compute)
+    except CircuitOpenError as e:
+        # Gemini is failing fast; not cached either
+        return markdown.markdown(f"Analysis unavailable right now: {str(e)}")
     except Exception as e:
-        print(f"Error fetching paper {paper_id} from {collection_name}: {e}")
+        # Shown to the user but not cached, so the next view retries
+        return markdown.markdown(f"Error generating analysis: {str(e)}")
+    return result[1] if result else None
+
+async def get_paper_analysis_stream(collection_name: str, paper_id: str):
+    """
+    Returns (chunks, on_complete) to stream a paper's analysis as markdown
+    chunks, or None if the paper doesn't exist. A cached analysis is replayed
+    as one chunk; a fresh one is stored once the stream completes.
+    """
+    cached = analysis_cache.get(collection_name, paper_id)
+    if cached is not None:
+        async def replay():
+            yield cached[0]
+        return replay(), None
+
+    paper = await get_paper_details(collection_name, paper_id)
+    if not paper:
         return None
+    # Each streaming viewer gets their own generation (no single-flight here)
+    analysis_cache.record_miss()
+    abstract_text = paper.get("abstract") or "Abstract not available."
+
+    def store(analysis_md, analysis_html):
+        analysis_cache.set(collection_name, paper_id, analysis_md, analysis_html)
+
+    return stream_paper_analysis(paper["title"], abstract_text), store
+
+async def create_chat_session(collection_name: str, paper_id: str):
+    """
+    Starts a chat about a paper, or returns None if the paper doesn't exist.
+    The abstract is looked up here, so the client never sends it.
+    """
+    paper = await get_paper_details(collection_name, paper_id)
+    if not paper:
+        return None
+    abstract_text = paper.get("abstract") or "Abstract not available."
+    context = chat_system_prompt(f"{paper['title']}. {abstract_text}")
+    session = ChatSession(collection_name, paper_id, paper["title"], context)
+    chat_sessions.set(session.id, session)
+    return session
+
+def get_chat_session(session_id: str):
+    return chat_sessions.get(session_id)
+
+def summarize_chat_turns(summary: str, turns):
+    return summarize_conversation(summary, turns, max_words=settings.CHAT_SUMMARY_TOKENS * 3 // 4)
+
+def finish_chat_turn(session, message: str, reply: str, report: dict, window_start: int):
+    session.record(message, reply)
+    session.schedule_summary(window_start, summarize_chat_turns, settings.CHAT_SUMMARY_TOKENS)
+    CHAT_PROMPT_TOKENS.observe(report["prompt_tokens_estimate"])
+
+async def chat_turn(session, message: str):
+    """
+    Answers one message in a chat session. Returns (reply, token report).
+    """
+    history, report, window_start = session.prepare(message, settings.CHAT_TOKEN_BUDGET)
+    try:
+        reply, report["prompt_tokens"] = await send_chat_message(history, message)
+    except Exception as e:
+        # Not recorded, so the failed turn doesn't enter the history
+        return f"Error in chat: {str(e)}", report
+    finish_chat_turn(session, message, reply, report, window_start)
+    return reply, report
+
+def chat_turn_stream(session, message: str):
+    """
+    Streams one chat turn. Returns (chunks, on_complete, report); the
+    report gets Gemini's prompt token count once the stream ends.
+    """
+    history, report, window_start = session.prepare(message, settings.CHAT_TOKEN_BUDGET)
+
+    def on_complete(reply_md, reply_html):
+        finish_chat_turn(session, message, reply_md, report, window_start)
+
+    return stream_chat_message(history, message, report), on_complete, report
@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+
+from app.core.cache import normalize_query
+
+
+def session_token(query: str, routes) -> str:
+    """
+    Cursor token for a (query, route) pair. Deterministic, so reloading a
+    page or sharing a link lands on the same cached result set.
+    """
+    key = normalize_query(query) + "|" + ",".join(r["name"] for r in routes)
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class ResultSession:
+    """
+    Merged, ranked candidate list for one (query, route), built once and
+    paged from memory. Each collection is read in windows; when a window
+    runs out, the next one is fetched at that collection's offset and merged
+    into the not-yet-served tail, so pages already shown never reorder.
+    """
+
+    def __init__(self, token: str, query: str, query_vector, routes, served_by: str = "raw",
+                 expanded_query: str = None):
+        self.token = token
+        self.query = query
+        self.query_vector = query_vector
+        self.routes = routes
+        self.served_by = served_by
+        self.expanded_query = expanded_query
+        # The user queries (normalized) this session serves, to validate
+        # cursors against: the one it was built for plus semantic cache hits
+        self.source_queries = set()
+        # Router candidates, to re-rank when graph weights change
+        self.candidates = None
+        self.hits = []
+        # (collection, id) of every hit merged so far, so a paper found by
+        # both the raw and the expanded query is listed once
+        self.seen = set()
+        self.served = 0
+        self.offsets = {r["name"]: 0 for r in routes}
+        self.exhausted = {r["name"]: False for r in routes}
+        self.lock = asyncio.Lock()
+        self.refill_task = None
+        # Routes an early stop skipped: searched when a page needs them,
+        # never by the background prefetch
+        self.deferred = set()
+        # Search backend calls made for this session, the collections the
+        # fixed top-3 fan-out would search (set by the pipeline), the calls
+        # it would have made for the same windows, the saved calls already
+        # counted in the metric, and the fan-out report
+        self.calls = 0
+        self.fixed_width = len(routes)
+        self.fixed_calls = 0
+        self.saved_counted = 0
+        self.fanout = None
+
+    @property
+    def complete(self) -> bool:
+        return all(self.exhausted.values())
+
+    def pending_routes(self, include_deferred: bool = True):
+        return [r for r in self.routes if not self.exhausted[r["name"]]
+                and (include_deferred or r["name"] not in self.deferred)]
+
+    def add_window(self, collection: str, hits, requested: int):
+        self.offsets[collection] += len(hits)
+        if len(hits) < requested:
+            self.exhausted[collection] = True
+        self.merge_hits(hits)
+
+    def merge_hits(self, hits):
+        """
+        Merges hits into the not-yet-served tail, skipping papers already
+        in the session. Offsets are untouched: hits from another query
+        vector (the expanded query) don't advance this session's windows.
+        """
+        fresh = []
+        for hit in hits:
+            key = (hit.collection, hit.id)
+            if key not in self.seen:
+                self.seen.add(key)
+                fresh.append(hit)
+        if fresh:
+            tail = self.hits[self.served:] + fresh
+            tail.sort(key=lambda x: x.score, reverse=True)
+            self.hits[self.served:] = tail
+        return len(fresh)
+
+    def page(self, page: int, limit: int):
+        start = (page - 1) * limit
+        end = start + limit
+        self.served = max(self.served, min(end, len(self.hits)))
+        return self.hits[start:end], len(self.hits) > end
@@ -0,0 +1,54 @@
+"""
+Server-Sent Events helpers for streaming Gemini output.
+
+Markdown chunks are accumulated and the text so far is re-rendered on every
+event, so the client just swaps in the growing HTML (a half-written block
+renders as a plain paragraph until it closes). A stream ends with a "done"
+event carrying time to first token and total time, or with an "error" event.
+"""
+import json
+import time
+
+import markdown
+
+# Disable proxy buffering (nginx) so events reach the browser as they're sent
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def markdown_events(chunks, started: float, error_prefix: str = "Error", on_complete=None,
+                          report: dict = None):
+    """
+    Turns an async iterator of markdown chunks into SSE "delta" events with
+    the rendered HTML so far. `started` is the perf_counter() value the
+    request arrived at; on_complete(markdown, html) runs after a full stream.
+    `report` (read once the stream ends) is added to the "done" event.
+    """
+    text = ""
+    first_token = None
+    try:
+        async for chunk in chunks:
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            text += chunk
+            yield sse_event("delta", {"html": markdown.markdown(text)})
+    except Exception as e:
+        message = f"{error_prefix}: {str(e)}"
+        yield sse_event("error", {"error": message, "html": markdown.markdown(message)})
+        return
+
+    html = markdown.markdown(text)
+    if on_complete:
+        on_complete(text, html)
+    total = time.perf_counter() - started
+    done = {
+        "text": text,
+        "ttfb_ms": round((first_token if first_token is not None else total) * 1000, 1),
+        "total_ms": round(total * 1000, 1)
+    }
+    if report is not None:
+        done["report"] = report
+    yield sse_event("done", done)
@@ -0,0 +1,167 @@
+"""
+Prefix index for /suggest autocomplete, built offline from the corpus.
+
+Terms are the concept names and titles of the per-domain OpenAlex JSONL
+files the preprocessing notebook writes. They are stored as one sorted
+UTF-8 blob with offsets, alongside each term's paper frequency and
+dominant collection. Prefixes whose range is too large to rank on the fly
+get their top-k precomputed, so a lookup is two binary searches plus a
+small sort.
+
+Build:
+    python -m app.core.suggest_index --input-dir processed/ --output suggest_index.npz
+"""
+import argparse
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from app.core.cache import normalize_query
+from app.core.config import settings
+from app.core.corpus import iter_domain_papers
+
+MAX_TERM_LENGTH = 120
+HOT_PREFIX_THRESHOLD = 512
+TOP_K = 10
+
+
+class _Terms:
+    """Read-only sequence view over the term blob, for bisect."""
+
+    def __init__(self, blob: bytes, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+
+class SuggestIndex:
+    def __init__(self, blob: bytes, offsets, freqs, collections, collection_names, hot_prefixes, hot_topk):
+        self.terms = _Terms(blob, offsets.tolist())
+        self.freqs = freqs
+        self.collections = collections
+        self.collection_names = list(collection_names)
+        self.hot = {p: row[row >= 0] for p, row in zip(hot_prefixes.tolist(), hot_topk)}
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["blob"].tobytes(),
+                data["offsets"],
+                data["freqs"],
+                data["collections"],
+                data["collection_names"].tolist(),
+                data["hot_prefixes"],
+                data["hot_topk"]
+            )
+
+    def __len__(self):
+        return len(self.terms)
+
+    def complete(self, prefix: str, k: int = 5):
+        """
+        Returns up to k (term, frequency, collection) for terms starting with
+        prefix, most frequent first.
+        """
+        prefix = normalize_query(prefix)
+        if not prefix:
+            return []
+        top = self.hot.get(prefix)
+        if top is None:
+            lo = bisect_left(self.terms, prefix)
+            hi = bisect_left(self.terms, prefix + "\U0010ffff", lo)
+            if lo == hi:
+                return []
+            order = np.argsort(-self.freqs[lo:hi], kind="stable")[:k]
+            top = order + lo
+        return [
+            (self.terms[i], int(self.freqs[i]), self.collection_names[self.collections[i]])
+            for i in top[:k]
+        ]
+
+
+def paper_terms(paper: dict):
+    terms = set()
+    for concept in paper.get("concepts", []):
+        name = normalize_query(concept.get("name", ""))
+        if name:
+            terms.add(name)
+    title = normalize_query(paper.get("title", ""))
+    if 3 <= len(title) <= MAX_TERM_LENGTH:
+        terms.add(title)
+    return terms
+
+
+def build_index(papers, output: str, top_k: int = TOP_K, hot_threshold: int = HOT_PREFIX_THRESHOLD):
+    counts = defaultdict(Counter)
+    n_papers = 0
+    for collection, paper in papers:
+        n_papers += 1
+        for term in paper_terms(paper):
+            counts[term][collection] += 1
+
+    collection_names = list(settings.COLLECTIONS.keys())
+    collection_ids = {name: i for i, name in enumerate(collection_names)}
+
+    terms = sorted(counts)
+    encoded = [t.encode("utf-8") for t in terms]
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    freqs = np.array([sum(counts[t].values()) for t in terms], dtype=np.int32)
+    collections = np.array([collection_ids[counts[t].most_common(1)[0][0]] for t in terms], dtype=np.uint8)
+
+    # Precompute top-k for prefixes that match too many terms to rank per request
+    hot_prefixes, hot_rows = [], []
+    length = 1
+    while True:
+        groups = defaultdict(list)
+        for i, t in enumerate(terms):
+            if len(t) >= length:
+                groups[t[:length]].append(i)
+        large = {p: idx for p, idx in groups.items() if len(idx) > hot_threshold}
+        if not large:
+            break
+        for prefix, idx in large.items():
+            idx = np.array(idx)
+            top = idx[np.argsort(-freqs[idx], kind="stable")[:top_k]]
+            hot_prefixes.append(prefix)
+            hot_rows.append(np.pad(top, (0, top_k - len(top)), constant_values=-1))
+        length += 1
+
+    np.savez_compressed(
+        output,
+        blob=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        offsets=offsets,
+        freqs=freqs,
+        collections=collections,
+        collection_names=np.array(collection_names),
+        hot_prefixes=np.array(hot_prefixes, dtype=str),
+        hot_topk=np.array(hot_rows, dtype=np.int32).reshape(-1, top_k)
+    )
+    return n_papers, len(terms), len(hot_prefixes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input-dir", required=True, help="directory with the per-domain <domain>.jsonl files")
+    parser.add_argument("--output", default=settings.SUGGEST_INDEX_PATH)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--hot-threshold", type=int, default=HOT_PREFIX_THRESHOLD)
+    args = parser.parse_args()
+
+    start = time.time()
+    n_papers, n_terms, n_hot = build_index(iter_domain_papers(args.input_dir), args.output,
+                                           args.top_k, args.hot_threshold)
+    print(f"Indexed {n_terms} terms from {n_papers} papers ({n_hot} precomputed prefixes) "
+          f"into {args.output} in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
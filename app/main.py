@@ -1,15 +1,42 @@
 from fastapi import FastAPI, Request, Form, Query, Body
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse
-from app.core.services import graph_optimized_search, get_suggestions, get_paper_details
-from app.core.gemini_service import analyze_paper_content, chat_with_paper_context
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse
+from app.core.services import graph_executor, graph_optimized_search, get_suggestions_async, get_paper_details, get_paper_analysis, get_paper_analysis_stream, get_cache_stats, query_cache, analysis_cache, close_clients, warmup_async
+from app.core.services import create_chat_session, get_chat_session, chat_turn, chat_turn_stream, batch_search
+from app.core.gemini_service import chat_with_paper_context, stream_chat_with_paper_context
+from app.core.streaming import markdown_events, SSE_HEADERS
+from app.core import metrics
 from app.core.config import settings
 from app.core.graph import graph_db
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import time
 import uvicorn
-import markdown
 
-app = FastAPI(title=settings.PROJECT_NAME, version=settings.VERSION)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.WARMUP_ON_STARTUP:
+        await warmup_async()
+    yield
+    # Persist write-behind state before the process exits
+    graph_db.close()
+    query_cache.flush()
+    analysis_cache.close()
+    await close_clients()
+
+app = FastAPI(title=settings.PROJECT_NAME, version=settings.VERSION, lifespan=lifespan)
+
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not raw path, to keep the series bounded
+    route = request.scope.get("route")
+    metrics.HTTP_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                                 route=getattr(route, "path", "unmatched"), status=response.status_code)
+    return response
 
 # Mount Static Files (CSS, JS)
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
@@ -22,14 +49,15 @@ async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 @app.get("/suggest")
-def suggest(q: str = Query(..., min_length=1)):
-    data = get_suggestions(q)
+async def suggest(q: str = Query(..., min_length=1)):
+    data = await get_suggestions_async(q)
     return JSONResponse(content=data)
 
 @app.get("/search", response_class=HTMLResponse)
-async def search(request: Request, q: str = Query(..., min_length=3), page: int = Query(1, ge=1)):
-    # Perform the graph-optimized search
-    search_data = await graph_optimized_search(q, page=page, limit=15)
+async def search(request: Request, q: str = Query(..., min_length=3), page: int = Query(1, ge=1),
+                 cursor: str = Query(None), debug: bool = Query(False)):
+    # Perform the graph-optimized search (later pages come from the cursor's cached result set)
+    search_data = await graph_optimized_search(q, page=page, limit=15, cursor=cursor, debug=debug)
     
     return templates.TemplateResponse("index.html", {
         "request": request,
@@ -37,14 +65,40 @@ async def search(request: Request, q: str = Query(..., min_length=3), page: int
         "results": search_data["results"],
         "latency": search_data["latency"],
         "routed_to": search_data["routed_to"],
+        "served_by": search_data.get("served_by"),
+        "expanded_query": search_data.get("expanded_query"),
         "page": page,
-        "has_next": len(search_data["results"]) >= 15 # Simple check for next page
+        "cursor": search_data.get("cursor"),
+        "has_next": search_data["has_next"],
+        "stages": search_data.get("stages"),
+        "fanout": search_data.get("fanout"),
+        "semantic_match": search_data.get("semantic_match")
     })
 
+@app.post("/api/search/batch")
+async def search_batch(queries: list = Body(...), limit: int = Body(10)):
+    """
+    Runs many queries in one request; results stream back as NDJSON, one
+    line per query as it completes, then a summary line.
+    """
+    queries = [str(q) for q in queries]
+    if not queries or len(queries) > settings.BATCH_SEARCH_MAX_QUERIES:
+        return JSONResponse({"error": f"Send 1 to {settings.BATCH_SEARCH_MAX_QUERIES} queries"}, status_code=400)
+    limit = max(1, min(limit, 100))
+
+    async def lines():
+        started = time.perf_counter()
+        async for result in batch_search(queries, limit):
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"done": True, "queries": len(queries),
+                          "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @app.get("/analysis/{collection}/{paper_id}", response_class=HTMLResponse)
 async def analysis(request: Request, collection: str, paper_id: str):
     # 1. Fetch Paper Details
-    paper = get_paper_details(collection, paper_id)
+    paper = await get_paper_details(collection, paper_id)
     
     if not paper:
         return HTMLResponse("Paper not found", status_code=404)
@@ -57,33 +111,97 @@ async def analysis(request: Request, collection: str, paper_id: str):
 
 @app.get("/api/analyze/{collection}/{paper_id}")
 async def analyze_paper_api(collection: str, paper_id: str):
-    paper = get_paper_details(collection, paper_id)
-    if not paper:
+    # Cached per paper (markdown already rendered to HTML)
+    analysis_html = await get_paper_analysis(collection, paper_id)
+    if analysis_html is None:
         return JSONResponse({"error": "Paper not found"}, status_code=404)
-        
-    abstract_text = paper.get("abstract") or "Abstract not available."
-    analysis_md = await analyze_paper_content(paper["title"], abstract_text)
-    
-    # Convert Markdown to HTML
-    analysis_html = markdown.markdown(analysis_md)
     
     return JSONResponse({"analysis": analysis_html})
 
+@app.get("/api/analyze/{collection}/{paper_id}/stream")
+async def analyze_paper_stream(collection: str, paper_id: str):
+    # Server-Sent Events: rendered HTML grows as Gemini generates the analysis
+    started = time.perf_counter()
+    stream = await get_paper_analysis_stream(collection, paper_id)
+    if stream is None:
+        return JSONResponse({"error": "Paper not found"}, status_code=404)
+
+    chunks, on_complete = stream
+    events = markdown_events(chunks, started, "Error generating analysis", on_complete)
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/chat/session")
+async def chat_session(collection: str = Body(...), paper_id: str = Body(...)):
+    """
+    Starts a server-side chat about a paper; later turns send only the
+    session id and the new message.
+    """
+    session = await create_chat_session(collection, paper_id)
+    if session is None:
+        return JSONResponse({"error": "Paper not found"}, status_code=404)
+    return JSONResponse({"session_id": session.id, "title": session.title,
+                         "token_budget": settings.CHAT_TOKEN_BUDGET})
+
+def chat_session_missing():
+    return JSONResponse({"error": "Chat session not found or expired"}, status_code=404)
+
 @app.post("/chat")
 async def chat(
     message: str = Body(...), 
+    session_id: str = Body(None),
     history: list = Body([]), 
-    context: str = Body(...)
+    context: str = Body(None)
 ):
+    if session_id:
+        session = get_chat_session(session_id)
+        if session is None:
+            return chat_session_missing()
+        response, report = await chat_turn(session, message)
+        return JSONResponse({"response": response, "session_id": session.id, "tokens": report})
+
+    # Stateless form: the client sends the abstract and full history every turn
+    if context is None:
+        return JSONResponse({"error": "session_id or context is required"}, status_code=400)
     response = await chat_with_paper_context(history, message, context)
     return JSONResponse({"response": response})
 
+@app.post("/chat/stream")
+async def chat_stream(
+    message: str = Body(...), 
+    session_id: str = Body(None),
+    history: list = Body([]), 
+    context: str = Body(None)
+):
+    started = time.perf_counter()
+    if session_id:
+        session = get_chat_session(session_id)
+        if session is None:
+            return chat_session_missing()
+        chunks, on_complete, report = chat_turn_stream(session, message)
+        events = markdown_events(chunks, started, "Error in chat", on_complete, report)
+    else:
+        if context is None:
+            return JSONResponse({"error": "session_id or context is required"}, status_code=400)
+        chunks = stream_chat_with_paper_context(history, message, context)
+        events = markdown_events(chunks, started, "Error in chat")
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return JSONResponse(get_cache_stats())
+
 @app.post("/feedback")
 async def feedback(collection: str = Body(...), reward: float = Body(0.1)):
     """
     Updates the graph weights based on user interaction (e.g., clicking a result).
     """
-    graph_db.update(collection, reward)
+    # The graph write can wait on other workers: keep it off the event loop
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(graph_executor, graph_db.update, collection, reward)
     return JSONResponse({"status": "success", "new_weight": graph_db.get_weight(collection)})
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+"""
+Fixed top-3 fan-out versus adaptive fan-out (and adaptive with early stop).
+
+Routes each query with the real embedder and router, then runs the first
+result window (run_search_pipeline) against the stand-in Qdrant under each
+mode, reporting collections searched per query, backend calls saved and
+first-window latency percentiles.
+
+The stand-in's random vectors score low, so the early-stop score threshold
+defaults to 0 here; pass --early-stop-score to match a real corpus.
+
+Run from the repo root:
+    python -m benchmarks.adaptive_fanout --queries 200 --latency-ms 20 --jitter-ms 15
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from benchmarks.e2e import percentiles, synthetic_log
+from benchmarks.fake_qdrant import DIM, FakeQdrantServer
+
+MODES = {
+    "fixed": {"ADAPTIVE_FANOUT": False, "FANOUT_EARLY_STOP": False},
+    "adaptive": {"ADAPTIVE_FANOUT": True, "FANOUT_EARLY_STOP": False},
+    "early_stop": {"ADAPTIVE_FANOUT": True, "FANOUT_EARLY_STOP": True},
+}
+
+
+async def run_mode(services, queries):
+    latencies, collections, calls, saved, stops = [], [], [], [], 0
+    for query in queries:
+        start = time.perf_counter()
+        session = await services.run_search_pipeline(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if session is None:
+            continue
+        collections.append(len(session.fanout["collections"]))
+        calls.append(session.fanout["calls"])
+        saved.append(session.fanout["saved_calls"])
+        stops += session.fanout["early_stop"]
+    await services.close_clients()
+    return {
+        "collections_per_query": float(np.mean(collections)) if collections else 0.0,
+        "calls_per_query": float(np.mean(calls)) if calls else 0.0,
+        "saved_calls_per_query": float(np.mean(saved)) if saved else 0.0,
+        "early_stops": stops,
+        "first_window": percentiles(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=15.0)
+    parser.add_argument("--dim", type=int, default=DIM, help="vector size (match the embedding model)")
+    parser.add_argument("--margin", type=float, default=settings.FANOUT_SCORE_MARGIN)
+    parser.add_argument("--early-stop-score", type=float, default=0.0)
+    parser.add_argument("--early-stop-hits", type=int, default=settings.FANOUT_EARLY_STOP_HITS)
+    parser.add_argument("--early-stop-delay-ms", type=float, default=settings.FANOUT_EARLY_STOP_DELAY_MS)
+    args = parser.parse_args()
+
+    queries = [entry["query"] for entry in synthetic_log(args.queries)]
+    settings.FANOUT_SCORE_MARGIN = args.margin
+    settings.FANOUT_EARLY_STOP_SCORE = args.early_stop_score
+    settings.FANOUT_EARLY_STOP_HITS = args.early_stop_hits
+    settings.FANOUT_EARLY_STOP_DELAY_MS = args.early_stop_delay_ms
+
+    with FakeQdrantServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, dim=args.dim) as qdrant:
+        settings.QDRANT_URL = qdrant.url
+        settings.SEARCH_BACKEND = "qdrant"
+        import app.core.services as services
+        services.warmup()
+
+        print(f"{len(queries)} queries, backend latency {args.latency_ms}+-{args.jitter_ms} ms\n")
+        print(f"{'mode':<11} {'colls/q':>8} {'calls/q':>8} {'saved/q':>8} {'stops':>6} "
+              f"{'p50 ms':>8} {'p95 ms':>8}")
+        for mode, overrides in MODES.items():
+            for key, value in overrides.items():
+                setattr(settings, key, value)
+            report = asyncio.run(run_mode(services, queries))
+            window = report["first_window"]
+            print(f"{mode:<11} {report['collections_per_query']:>8.2f} {report['calls_per_query']:>8.2f} "
+                  f"{report['saved_calls_per_query']:>8.2f} {report['early_stops']:>6} "
+                  f"{window['p50_ms']:>8.1f} {window['p95_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
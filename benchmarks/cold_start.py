@@ -0,0 +1,134 @@
+"""
+Cold-start report: import time of app.main and time to first response.
+
+1. Imports app.main in fresh interpreters and reports the median wall
+   time plus the heaviest modules from `python -X importtime`.
+2. Starts uvicorn with warmup off and on (a local stand-in Qdrant unless
+   --qdrant-url is given), then times process start -> ready, and the
+   first and second /suggest and /search responses.
+
+Run from the repo root:
+    python -m benchmarks.cold_start --runs 3
+"""
+import argparse
+import os
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.fake_qdrant import FakeQdrantServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def import_times(runs: int):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=REPO_ROOT,
+                             capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+
+    trace = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=REPO_ROOT,
+                           capture_output=True, text=True).stderr
+    heaviest = []
+    for line in trace.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if m and len(m.group(2)) == 3:  # modules imported directly by a top-level import
+            heaviest.append((int(m.group(1)) / 1e6, m.group(3)))
+    heaviest.sort(reverse=True)
+    return statistics.median(samples), heaviest[:6]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def timed_get(url: str):
+    t0 = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=120) as r:
+        r.read()
+    return time.perf_counter() - t0
+
+
+def time_to_first_response(qdrant_url: str, warmup: bool, router_dir: str, graph_file: str):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, QDRANT_URL=qdrant_url, QDRANT_API_KEY="", ROUTER_VECTORS_DIR=router_dir,
+               GRAPH_FILE=graph_file, GRAPH_DB_PATH=graph_file + ".sqlite3",
+               WARMUP_ON_STARTUP="true" if warmup else "false")
+
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+                             "--log-level", "warning"], cwd=REPO_ROOT, env=env)
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            try:
+                urllib.request.urlopen(f"{base}/api/cache/stats", timeout=1).read()
+                break
+            except OSError:
+                time.sleep(0.05)
+        ready = time.perf_counter() - start
+        return {
+            "ready_s": ready,
+            "suggest_1_s": timed_get(f"{base}/suggest?q=graph+neural"),
+            "suggest_2_s": timed_get(f"{base}/suggest?q=graph+neural+net"),
+            "search_1_s": timed_get(f"{base}/search?q=vision+transformers"),
+            "search_2_s": timed_get(f"{base}/search?q=speech+recognition"),
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters for the import timing")
+    parser.add_argument("--qdrant-url", help="real Qdrant to use instead of the local stand-in")
+    args = parser.parse_args()
+
+    median, heaviest = import_times(args.runs)
+    print(f"import app.main: {median:.3f}s median over {args.runs} runs")
+    for seconds, module in heaviest:
+        print(f"  {module:<40} {seconds:.3f}s cumulative")
+
+    # The third case reuses the router vectors the second one persisted
+    cases = [
+        ("no warmup, no router vectors", False, "a"),
+        ("warmup, no router vectors", True, "b"),
+        ("warmup, persisted router vectors", True, "b"),
+    ]
+
+    def run_cases(url):
+        workdir = tempfile.mkdtemp(prefix="sg_cold_start_")
+        # Scratch copy so the benchmark never touches the real graph weights
+        graph_file = os.path.join(workdir, "graph_weights.json")
+        shutil.copy(os.path.join(REPO_ROOT, "graph_weights.json"), graph_file)
+        print(f"\n{'case':<34} {'ready':>7} {'sug#1':>7} {'sug#2':>7} {'srch#1':>7} {'srch#2':>7}")
+        try:
+            for label, warmup, router_dir in cases:
+                r = time_to_first_response(url, warmup, os.path.join(workdir, router_dir), graph_file)
+                print(f"{label:<34} {r['ready_s']:>7.2f} {r['suggest_1_s']:>7.3f} {r['suggest_2_s']:>7.3f} "
+                      f"{r['search_1_s']:>7.3f} {r['search_2_s']:>7.3f}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.qdrant_url:
+        run_cases(args.qdrant_url)
+    else:
+        with FakeQdrantServer(latency_ms=5, jitter_ms=1) as server:
+            run_cases(server.url)
+
+
+if __name__ == "__main__":
+    main()
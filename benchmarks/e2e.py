@@ -0,0 +1,284 @@
+"""
+End-to-end load test of the search pipeline (expand -> embed -> route ->
+fan-out -> merge) without cloud services.
+
+Starts the stand-in Qdrant (synthetic collections) and the app with the
+fake Gemini (benchmarks/e2e_server.py) in child processes, replays a query
+log at a fixed concurrency and reports latency percentiles, throughput and
+the per-stage breakdown. Results are written as JSON; pass a previous run
+as --baseline to compare and fail on p95/p99 regressions.
+
+The query log is JSONL (one {"query": ...} per line; "q" or "title" also
+work, and {"endpoint": "suggest"} replays /suggest) or plain text lines.
+Without one, a synthetic log with realistic repeats is used.
+
+Run from the repo root:
+    python -m benchmarks.e2e --concurrency 16 --requests 400
+    python -m benchmarks.e2e --log queries.jsonl --baseline benchmarks/results/before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import httpx
+import numpy as np
+
+from benchmarks.fake_qdrant import DIM, FakeQdrantServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOPICS = [
+    "vision transformers", "graph neural networks", "reinforcement learning from human feedback",
+    "diffusion models", "federated learning privacy", "speech recognition", "machine translation",
+    "object detection", "policy gradient robotics", "large language models hallucination",
+    "query optimization databases", "intrusion detection", "medical image segmentation",
+    "bayesian optimization", "contrastive learning", "knowledge graph embeddings",
+]
+MODIFIERS = ["", "survey", "benchmark", "for low-resource settings", "efficient", "2024", "theory"]
+
+
+def synthetic_log(n: int, seed: int = 0):
+    """
+    Zipf-distributed queries, so popular searches repeat like real traffic.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"{t} {m}".strip() for t in TOPICS for m in MODIFIERS]
+    ranks = np.minimum(rng.zipf(1.3, n), len(vocabulary)) - 1
+    return [{"endpoint": "search", "query": vocabulary[r]} for r in ranks]
+
+
+def load_log(path: str):
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = {"query": line}
+            query = record.get("query") or record.get("q") or record.get("title")
+            if query and len(query) >= 3:
+                entries.append({"endpoint": record.get("endpoint", "search"), "query": query})
+    return entries
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(values_ms):
+    values_ms = np.array(values_ms) if len(values_ms) else np.zeros(1)
+    return {
+        "mean_ms": float(values_ms.mean()),
+        "p50_ms": float(np.percentile(values_ms, 50)),
+        "p95_ms": float(np.percentile(values_ms, 95)),
+        "p99_ms": float(np.percentile(values_ms, 99)),
+        "max_ms": float(values_ms.max()),
+    }
+
+
+class AppServer:
+    def __init__(self, env: dict, gemini_args):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.args = [sys.executable, "-m", "benchmarks.e2e_server", "--port", str(self.port)] + gemini_args
+        self.env = env
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.args, cwd=REPO_ROOT, env=self.env)
+        deadline = time.time() + 300
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("App server exited during startup")
+            try:
+                urllib.request.urlopen(f"{self.url}/_bench/stages", timeout=1).read()
+                return self
+            except OSError:
+                time.sleep(0.1)
+        self.process.kill()
+        raise RuntimeError("App server did not start within 300s")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+async def replay(base_url: str, entries, concurrency: int, follow_pages: bool):
+    """
+    Fires the entries with `concurrency` workers; returns per-request records.
+    """
+    queue = asyncio.Queue()
+    for entry in entries:
+        queue.put_nowait(entry)
+    records = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        async def worker():
+            while not queue.empty():
+                entry = queue.get_nowait()
+                path = "/suggest" if entry["endpoint"] == "suggest" else "/search"
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path, params={"q": entry["query"]})
+                    status = response.status_code
+                    # Page 2 through the cursor, like a user paging on
+                    if follow_pages and status == 200 and path == "/search" and "cursor=" in response.text:
+                        cursor = response.text.split("cursor=", 1)[1].split('"', 1)[0].split("&", 1)[0]
+                        page_start = time.perf_counter()
+                        page = await client.get(path, params={"q": entry["query"], "page": 2, "cursor": cursor})
+                        records.append({"endpoint": "search_page", "status": page.status_code,
+                                        "latency_ms": (time.perf_counter() - page_start) * 1000})
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                records.append({"endpoint": entry["endpoint"], "status": status,
+                                "latency_ms": (time.perf_counter() - start) * 1000})
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+        stages = (await client.get("/_bench/stages")).json()
+    return records, elapsed, stages
+
+
+def summarize(records, elapsed: float):
+    summary = {"requests": len(records), "elapsed_s": elapsed, "throughput_rps": len(records) / elapsed}
+    for endpoint in sorted({r["endpoint"] for r in records}):
+        rows = [r for r in records if r["endpoint"] == endpoint]
+        ok = [r["latency_ms"] for r in rows if r["status"] == 200]
+        summary[endpoint] = dict(percentiles(ok), count=len(rows), errors=len(rows) - len(ok))
+    return summary
+
+
+def compare(result: dict, baseline: dict, max_regression: float):
+    """
+    Prints p50/p95/p99 deltas per endpoint; returns the list of regressions.
+    """
+    regressions = []
+    print(f"\nvs baseline {baseline.get('started_at', '?')} ({baseline.get('git_commit', '?')[:10]})")
+    for endpoint, now in result["summary"].items():
+        before = baseline.get("summary", {}).get(endpoint)
+        if not isinstance(now, dict) or not isinstance(before, dict):
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if not before.get(key):
+                continue
+            change = now[key] / before[key] - 1
+            flag = ""
+            if key != "p50_ms" and change > max_regression:
+                flag = "  REGRESSION"
+                regressions.append(f"{endpoint} {key} {change:+.0%}")
+            print(f"  {endpoint:<12} {key:<7} {before[key]:>9.1f} -> {now[key]:>9.1f} ms ({change:+.0%}){flag}")
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", help="query log to replay (JSONL or plain text)")
+    parser.add_argument("--requests", type=int, default=300, help="requests to send (log is cycled)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup-requests", type=int, default=20)
+    parser.add_argument("--follow-pages", action="store_true", help="also fetch page 2 via the cursor")
+    parser.add_argument("--qdrant-latency-ms", type=float, default=20.0)
+    parser.add_argument("--qdrant-size", type=int, default=2000, help="points per synthetic collection")
+    parser.add_argument("--dim", type=int, default=DIM, help="vector size (match the embedding model)")
+    parser.add_argument("--gemini-latency-ms", type=float, default=400.0)
+    parser.add_argument("--gemini-jitter-ms", type=float, default=150.0)
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="result JSON path (default benchmarks/results/e2e-<time>.json)")
+    parser.add_argument("--baseline", help="previous result JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="allowed p95/p99 increase")
+    args = parser.parse_args()
+
+    entries = load_log(args.log) if args.log else synthetic_log(args.requests)
+    if not entries:
+        sys.exit(f"No replayable queries in {args.log}")
+    entries = [entries[i % len(entries)] for i in range(args.requests)]
+    warmup = [{"endpoint": "search", "query": f"warmup query {i}"} for i in range(args.warmup_requests)]
+
+    workdir = tempfile.mkdtemp(prefix="sg_e2e_")
+    graph_file = os.path.join(workdir, "graph_weights.json")
+    shutil.copy(os.path.join(REPO_ROOT, "graph_weights.json"), graph_file)
+    gemini_args = ["--gemini-latency-ms", str(args.gemini_latency_ms), "--gemini-jitter-ms",
+                   str(args.gemini_jitter_ms), "--gemini-failure-rate", str(args.gemini_failure_rate)]
+    started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    try:
+        with FakeQdrantServer(collection_size=args.qdrant_size, latency_ms=args.qdrant_latency_ms,
+                              jitter_ms=args.qdrant_latency_ms / 4, dim=args.dim) as qdrant:
+            env = dict(os.environ, QDRANT_URL=qdrant.url, QDRANT_API_KEY="", SEARCH_BACKEND="qdrant",
+                       GRAPH_FILE=graph_file, GRAPH_DB_PATH=graph_file + ".sqlite3",
+                       ROUTER_VECTORS_DIR=os.path.join(workdir, "router"),
+                       ANALYSIS_CACHE_PATH=os.path.join(workdir, "analyses.sqlite3"), QUERY_CACHE_DISK_PATH="")
+            with AppServer(env, gemini_args) as server:
+                asyncio.run(replay(server.url, warmup, min(args.concurrency, len(warmup) or 1), False))
+                urllib.request.urlopen(urllib.request.Request(f"{server.url}/_bench/stages", method="POST")).read()
+                records, elapsed, stages = asyncio.run(
+                    replay(server.url, entries, args.concurrency, args.follow_pages))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "started_at": started_at,
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": vars(args),
+        "summary": summarize(records, elapsed),
+        "stages": stages,
+    }
+
+    summary = result["summary"]
+    print(f"{summary['requests']} requests in {summary['elapsed_s']:.1f}s "
+          f"({summary['throughput_rps']:.1f} req/s) at concurrency {args.concurrency}\n")
+    print(f"{'endpoint':<12} {'count':>6} {'errors':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for endpoint, row in summary.items():
+        if isinstance(row, dict):
+            print(f"{endpoint:<12} {row['count']:>6} {row['errors']:>6} {row['p50_ms']:>8.1f} "
+                  f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f}")
+    print(f"\n{'stage':<12} {'calls':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for stage, row in stages.items():
+        print(f"{stage:<12} {row['count']:>6} {row['mean_ms']:>8.1f} {row['p50_ms']:>8.1f} "
+              f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f}")
+
+    output = args.output or os.path.join(REPO_ROOT, "benchmarks", "results",
+                                         f"e2e-{started_at.replace(':', '')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nSaved {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.max_regression)
+        if regressions:
+            print(f"\nRegressions over {args.max_regression:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Runs the ScholarGraph app for the end-to-end benchmark: the real FastAPI
+app with the fake Gemini installed and a timer around each pipeline stage.
+Qdrant comes from the environment (QDRANT_URL, usually the stand-in in
+benchmarks/fake_qdrant.py, or SEARCH_BACKEND=local).
+
+Stage timings are served at GET /_bench/stages (POST resets them).
+Started by benchmarks/e2e.py; standalone:
+    python -m benchmarks.e2e_server --port 8001 --gemini-latency-ms 400
+"""
+import argparse
+import asyncio
+import functools
+import time
+
+import numpy as np
+import uvicorn
+
+import app.core.services as services
+from app.main import app
+from benchmarks.fake_gemini import FakeGeminiModel, install
+
+# stage -> function in app.core.services whose calls are timed
+STAGES = {
+    "expand": "expand_query",
+    "embed": "get_embedding_async",
+    "route": "master_router",
+    "fanout": "fill_session",
+    "page": "serve_session_page",
+}
+
+samples = {stage: [] for stage in STAGES}
+samples["request"] = []
+
+
+def timed(stage: str, fn):
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                samples[stage].append(time.perf_counter() - start)
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                samples[stage].append(time.perf_counter() - start)
+    return wrapper
+
+
+def install_stage_timers():
+    for stage, name in STAGES.items():
+        setattr(services, name, timed(stage, getattr(services, name)))
+
+    @app.middleware("http")
+    async def time_requests(request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+        if not request.url.path.startswith("/_bench"):
+            samples["request"].append(time.perf_counter() - start)
+        return response
+
+    @app.get("/_bench/stages")
+    async def stage_report():
+        report = {}
+        for stage, values in samples.items():
+            if values:
+                ms = np.array(values) * 1000
+                report[stage] = {
+                    "count": len(values),
+                    "mean_ms": float(ms.mean()),
+                    "p50_ms": float(np.percentile(ms, 50)),
+                    "p95_ms": float(np.percentile(ms, 95)),
+                    "p99_ms": float(np.percentile(ms, 99)),
+                }
+        return report
+
+    @app.post("/_bench/stages")
+    async def reset_stages():
+        for values in samples.values():
+            values.clear()
+        return {"status": "reset"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--gemini-latency-ms", type=float, default=400.0)
+    parser.add_argument("--gemini-jitter-ms", type=float, default=150.0)
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    install(FakeGeminiModel(args.gemini_latency_ms, args.gemini_jitter_ms, args.gemini_failure_rate, seed=args.seed))
+    install_stage_timers()
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Latency and memory of the embedding backends (torch vs ONNX int8).
+
+Each backend is measured in its own subprocess so resident memory isn't
+shared: load time, RSS after load, and encode latency for single queries
+(the /search path) and batches of 32 (the micro-batcher under load).
+
+Run from the repo root after exporting the ONNX model:
+    python -m benchmarks.embedding_backends --backends torch onnx --iterations 200
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KB on Linux, bytes on macOS; this is a peak, not current
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure(backend: str, iterations: int) -> dict:
+    from app.core.embeddings import load_embedding_model
+    from app.core.onnx_export import PARITY_QUERIES
+
+    base_rss = rss_mb()
+    t0 = time.perf_counter()
+    model = load_embedding_model(backend)
+    model.encode(PARITY_QUERIES, normalize_embeddings=True)  # warm up
+    load_s = time.perf_counter() - t0
+    loaded_rss = rss_mb()
+
+    def timed(texts, n):
+        samples = []
+        for i in range(n):
+            t = time.perf_counter()
+            model.encode(texts[i % len(texts)], normalize_embeddings=True, batch_size=32)
+            samples.append((time.perf_counter() - t) * 1000)
+        return np.array(samples)
+
+    single = timed(PARITY_QUERIES, iterations)
+    batches = [[f"{q} {i}" for q in PARITY_QUERIES * 2] for i in range(4)]
+    batched = timed(batches, max(10, iterations // 10))
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "rss_mb": loaded_rss,
+        "model_rss_mb": loaded_rss - base_rss,
+        "single_p50_ms": float(np.percentile(single, 50)),
+        "single_p99_ms": float(np.percentile(single, 99)),
+        "batch32_p50_ms": float(np.percentile(batched, 50)),
+        "batch32_qps": 32 * 1000 / float(np.percentile(batched, 50)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--parity", action="store_true", help="also run the ONNX parity check")
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.iterations)))
+        return
+
+    rows = []
+    for backend in args.backends:
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.embedding_backends", "--worker", backend,
+             "--iterations", str(args.iterations)],
+            cwd=REPO_ROOT, capture_output=True, text=True
+        )
+        if out.returncode != 0:
+            print(f"{backend}: failed\n{out.stderr[-2000:]}")
+            continue
+        rows.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{'backend':<8} {'load_s':>7} {'rss_mb':>7} {'model_mb':>8} {'1q p50':>8} {'1q p99':>8} "
+          f"{'b32 p50':>8} {'b32 q/s':>8}")
+    for r in rows:
+        print(f"{r['backend']:<8} {r['load_s']:>7.2f} {r['rss_mb']:>7.0f} {r['model_rss_mb']:>8.0f} "
+              f"{r['single_p50_ms']:>8.2f} {r['single_p99_ms']:>8.2f} {r['batch32_p50_ms']:>8.2f} "
+              f"{r['batch32_qps']:>8.0f}")
+
+    if args.parity:
+        from app.core.config import settings
+        from app.core.onnx_export import check_parity
+        report = check_parity(settings.EMBEDDING_ONNX_PATH)
+        print(f"ONNX parity: min cosine {report['min_cosine']:.4f}, mean {report['mean_cosine']:.4f}, "
+              f"routing agreement {report['routing_agreement']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Throughput of the micro-batching embedding engine against batch window.
+
+Runs N client threads that each encode queries back to back for a fixed
+duration, for every combination of batch window and client count, and
+prints requests/s, mean batch size and latency percentiles.
+
+Run from the repo root:
+    python -m benchmarks.embedding_batching --windows 0 2 5 10 --clients 1 8 64
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from app.core.embeddings import EmbeddingBatcher
+from app.core.services import get_model
+
+QUERIES = [
+    "vision transformers for object detection",
+    "reinforcement learning from human feedback",
+    "graph neural networks for molecules",
+    "federated learning privacy",
+    "speech recognition with self-supervised learning",
+    "diffusion models image synthesis",
+    "explainable ai in healthcare",
+    "query optimization in distributed databases",
+]
+
+
+def run_case(model, window_ms: float, clients: int, duration: float, max_batch: int):
+    batcher = EmbeddingBatcher(lambda: model, max_batch_size=max_batch, batch_window=window_ms / 1000.0)
+    latencies = [[] for _ in range(clients)]
+    stop_at = time.perf_counter() + duration
+
+    def client(idx):
+        i = idx
+        while time.perf_counter() < stop_at:
+            t0 = time.perf_counter()
+            batcher.encode(f"{QUERIES[i % len(QUERIES)]} {i}")
+            latencies[idx].append(time.perf_counter() - t0)
+            i += clients
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    all_lat = np.array([x for lat in latencies for x in lat]) * 1000
+    stats = batcher.stats()
+    return {
+        "window_ms": window_ms,
+        "clients": clients,
+        "requests": len(all_lat),
+        "rps": len(all_lat) / elapsed,
+        "mean_batch": stats["mean_batch_size"],
+        "p50_ms": float(np.percentile(all_lat, 50)),
+        "p99_ms": float(np.percentile(all_lat, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 2, 5, 10, 20])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per case")
+    parser.add_argument("--max-batch", type=int, default=64)
+    args = parser.parse_args()
+
+    model = get_model()
+    if model is None:
+        raise SystemExit("Embedding model could not be loaded")
+    model.encode(QUERIES, normalize_embeddings=True)  # warm up
+
+    print(f"{'window_ms':>9} {'clients':>7} {'req/s':>9} {'batch':>6} {'p50_ms':>8} {'p99_ms':>8}")
+    for clients in args.clients:
+        for window in args.windows:
+            r = run_case(model, window, clients, args.duration, args.max_batch)
+            print(f"{r['window_ms']:>9.1f} {r['clients']:>7} {r['rps']:>9.1f} {r['mean_batch']:>6.1f} "
+                  f"{r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Memory and throughput of N worker processes that each load the embedding
+model, versus N workers sharing one embedding server (app.core.embedding_server).
+
+Each worker encodes queries from several client threads through its own
+micro-batcher (as a uvicorn worker does) for a fixed duration. Memory is
+read from /proc after warm-up: RSS, plus PSS where the kernel provides it
+(RSS counts shared library pages once per process, PSS splits them).
+
+Run from the repo root (Linux):
+    python -m benchmarks.embedding_server --workers 4 --clients 8 --duration 10
+    EMBEDDING_ONNX_PATH=models/all-MiniLM-L6-v2-onnx python -m benchmarks.embedding_server --backend onnx
+"""
+import argparse
+import multiprocessing as mp
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from benchmarks.embedding_batching import QUERIES
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def memory_kb(pid="self") -> dict:
+    """
+    {"rss": kB, "pss": kB or None} of a process, from /proc.
+    """
+    usage = {"rss": 0, "pss": None}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                usage["rss"] = int(line.split()[1])
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    usage["pss"] = int(line.split()[1])
+    except OSError:
+        pass
+    return usage
+
+
+def worker(index: int, mode: str, backend: str, socket_path: str, clients: int, duration: float,
+           ready, go, results):
+    from app.core.embeddings import EmbeddingBatcher, load_embedding_model
+
+    if mode == "shared":
+        from app.core.embedding_server import RemoteEmbedder
+        model = RemoteEmbedder(socket_path)
+    else:
+        model = load_embedding_model(backend)
+    batcher = EmbeddingBatcher(lambda: model, max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+                               batch_window=settings.EMBEDDING_BATCH_WINDOW_MS / 1000.0)
+    batcher.encode("warmup query")
+    ready.put(memory_kb())
+    go.wait()
+
+    latencies = [[] for _ in range(clients)]
+    stop_at = time.perf_counter() + duration
+
+    def client(idx):
+        i = idx
+        while time.perf_counter() < stop_at:
+            t0 = time.perf_counter()
+            batcher.encode(f"{QUERIES[i % len(QUERIES)]} {index}-{i}")
+            latencies[idx].append(time.perf_counter() - t0)
+            i += clients
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results.put([x for lat in latencies for x in lat])
+
+
+def start_server(socket_path: str, backend: str):
+    process = subprocess.Popen([sys.executable, "-m", "app.core.embedding_server", "--socket", socket_path,
+                                "--backend", backend], cwd=REPO_ROOT)
+    deadline = time.time() + 300
+    while not os.path.exists(socket_path):
+        if process.poll() is not None or time.time() > deadline:
+            process.kill()
+            raise RuntimeError("Embedding server did not start")
+        time.sleep(0.1)
+    return process
+
+
+def run_mode(mode: str, args, socket_path: str):
+    ctx = mp.get_context("spawn")
+    ready, results, go = ctx.Queue(), ctx.Queue(), ctx.Event()
+    server = start_server(socket_path, args.backend) if mode == "shared" else None
+    try:
+        procs = [ctx.Process(target=worker, args=(i, mode, args.backend, socket_path, args.clients,
+                                                  args.duration, ready, go, results))
+                 for i in range(args.workers)]
+        for p in procs:
+            p.start()
+        memory = [ready.get(timeout=300) for _ in procs]
+        if server is not None:
+            memory.append(memory_kb(server.pid))
+        start = time.perf_counter()
+        go.set()
+        latencies = [x for _ in procs for x in results.get(timeout=args.duration + 120)]
+        elapsed = time.perf_counter() - start
+        for p in procs:
+            p.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    ms = np.array(latencies) * 1000
+    pss = [m["pss"] for m in memory]
+    return {
+        "rss_mb": sum(m["rss"] for m in memory) / 1024,
+        "pss_mb": sum(pss) / 1024 if None not in pss else None,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=8, help="concurrent client threads per worker")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--backend", choices=["torch", "onnx"], default=settings.EMBEDDING_SERVER_BACKEND)
+    args = parser.parse_args()
+
+    socket_path = os.path.join(tempfile.mkdtemp(prefix="sg_embed_"), "embed.sock")
+    print(f"{args.workers} workers x {args.clients} clients, {args.backend} backend, {args.duration}s per mode\n")
+    print(f"{'mode':<9} {'rss MB':>8} {'pss MB':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for mode in ("separate", "shared"):
+        r = run_mode(mode, args, socket_path)
+        pss = f"{r['pss_mb']:>8.0f}" if r["pss_mb"] is not None else f"{'n/a':>8}"
+        print(f"{mode:<9} {r['rss_mb']:>8.0f} {pss} {r['rps']:>8.0f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+    print("\nshared includes the embedding server process.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+In-process stand-in for the Gemini model, for benchmarks only.
+
+Mimics the parts of google.generativeai's GenerativeModel the app uses
+(generate_content_async, with and without stream=True, and start_chat)
+with a configurable latency, jitter and failure rate. install() swaps it
+in behind gemini_service.get_gemini_model, the one place every Gemini call
+goes through.
+"""
+import asyncio
+import random
+
+from app.core import gemini_service
+
+ANALYSIS_TEXT = """## Core Contribution
+The paper introduces a method that improves on prior work in its area.
+
+## Key Methodology
+The authors combine a learned encoder with a task-specific objective and evaluate on standard benchmarks.
+
+## Implications
+Results suggest the approach transfers to related problems with little tuning.
+
+## Potential Limitations
+Evaluation is limited to a handful of datasets; compute costs are not reported.
+
+## Future Directions
+Scaling the method and testing it on out-of-domain data are natural next steps.
+"""
+
+
+class FakeGeminiError(Exception):
+    pass
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeStream:
+    def __init__(self, chunks, interval: float):
+        self.chunks = chunks
+        self.interval = interval
+
+    async def __aiter__(self):
+        for i, chunk in enumerate(self.chunks):
+            if i:
+                await asyncio.sleep(self.interval)
+            yield FakeResponse(chunk)
+
+
+class FakeGeminiModel:
+    def __init__(self, latency_ms: float = 400.0, jitter_ms: float = 150.0, failure_rate: float = 0.0,
+                 chunk_interval_ms: float = 40.0, seed: int = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.chunk_interval = chunk_interval_ms / 1000.0
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+
+    async def respond(self, prompt: str, stream: bool):
+        self.calls += 1
+        delay = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+        await asyncio.sleep(delay)
+        if self.rng.random() < self.failure_rate:
+            self.failures += 1
+            raise FakeGeminiError("429 Resource has been exhausted (fake Gemini)")
+
+        if "Original Query:" in prompt:
+            query = prompt.rsplit("Original Query:", 1)[1].strip()
+            text = f"{query} methods applications survey"
+        elif "User:" in prompt:
+            text = "Based on the abstract, the paper's main result is an improvement over the baseline."
+        else:
+            text = ANALYSIS_TEXT
+        if not stream:
+            return FakeResponse(text)
+        words = text.split(" ")
+        return FakeStream([" ".join(words[i:i + 8]) + " " for i in range(0, len(words), 8)], self.chunk_interval)
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        return await self.respond(prompt, stream)
+
+    def start_chat(self, history=None):
+        return FakeChat(self)
+
+
+class FakeChat:
+    def __init__(self, model: FakeGeminiModel):
+        self.model = model
+
+    async def send_message_async(self, prompt, stream: bool = False, **kwargs):
+        return await self.model.respond(prompt, stream)
+
+
+def install(model: FakeGeminiModel) -> FakeGeminiModel:
+    gemini_service.get_gemini_model = lambda: model
+    return model
@@ -0,0 +1,251 @@
+"""
+Local stand-in for the Qdrant REST API, for benchmarks only.
+
+Serves synthetic collections (seeded random unit vectors, 384-dim by
+default, with OpenAlex-shaped payloads) for the endpoints ScholarGraph uses:
+query_points, query_batch_points and retrieve. Each request sleeps for a
+configurable latency so network-bound behaviour can be measured without
+the cloud. Collections created through the API (app.core.ingest) accept
+upserts and count their points; they are not searchable.
+
+Standalone:
+    python -m benchmarks.fake_qdrant --port 6333 --latency-ms 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from importlib.metadata import version
+
+import numpy as np
+import uvicorn
+from fastapi import Body, FastAPI, Response
+
+from app.core.config import settings
+from app.core.records import search_fields
+
+DIM = 384
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_payload(collection: str, idx: int, rng: random.Random) -> dict:
+    n_authors = rng.randint(1, 12)
+    n_concepts = rng.randint(5, 30)
+    payload = {
+        "id": f"https://openalex.org/W{idx}",
+        "doi": f"https://doi.org/10.0000/{collection}.{idx}",
+        "title": f"Synthetic {collection} paper {idx}",
+        "abstract": " ".join(f"token{rng.randint(0, 5000)}" for _ in range(rng.randint(80, 300))),
+        "publication_year": rng.randint(1990, 2025),
+        "publication_date": f"{rng.randint(1990, 2025)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+        "venue": f"Venue {rng.randint(1, 200)}",
+        "citation_count": rng.randint(0, 5000),
+        "is_open_access": rng.random() < 0.4,
+        "url": f"https://openalex.org/W{idx}",
+        "authors": [{"name": f"Author {rng.randint(1, 10000)}", "id": f"A{rng.randint(1, 10**6)}"}
+                    for _ in range(n_authors)],
+        "concepts": [{"name": f"Concept {rng.randint(1, 3000)}", "score": rng.random(), "level": rng.randint(0, 3)}
+                     for _ in range(n_concepts)],
+    }
+    # Stored at ingest like app.core.corpus.paper_payload
+    payload.update(search_fields(payload, settings.SNIPPET_LENGTH))
+    return payload
+
+
+class FakeCollection:
+    def __init__(self, name: str, size: int, seed: int, dim: int = DIM):
+        rng = np.random.default_rng(seed)
+        vectors = rng.standard_normal((size, dim)).astype(np.float32)
+        self.vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        prng = random.Random(seed)
+        self.payloads = [synthetic_payload(name, i, prng) for i in range(size)]
+        # Pre-serialized so the stand-in spends its CPU on latency, not JSON
+        self.payload_json = [json.dumps(p) for p in self.payloads]
+
+    def query(self, vector, limit: int, offset: int):
+        scores = self.vectors @ np.asarray(vector, dtype=np.float32)
+        k = min(len(scores), limit + offset)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])][offset:offset + limit]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+def payload_json(col: FakeCollection, idx: int, with_payload) -> str:
+    if with_payload is True:
+        return col.payload_json[idx]
+    if not with_payload:
+        return "null"
+    if isinstance(with_payload, dict):
+        with_payload = with_payload.get("include", [])
+    payload = col.payloads[idx]
+    return json.dumps({k: payload[k] for k in with_payload if k in payload})
+
+
+def ok(result_json: str) -> Response:
+    return Response(f'{{"result":{result_json},"status":"ok","time":0.0}}', media_type="application/json")
+
+
+def create_app(collection_size: int = 2000, latency_ms: float = 20.0, jitter_ms: float = 5.0,
+               collections=None, dim: int = DIM) -> FastAPI:
+    names = list(collections or settings.COLLECTIONS.keys())
+    data = {name: FakeCollection(name, collection_size, seed=i, dim=dim) for i, name in enumerate(names)}
+    app = FastAPI()
+    app.state.requests = 0
+
+    async def simulate_latency():
+        app.state.requests += 1
+        delay = max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000.0
+        await asyncio.sleep(delay)
+
+    @app.get("/")
+    async def root():
+        # Report the installed client's version so the compatibility check passes
+        return {"title": "qdrant - vector search engine (stand-in)", "version": version("qdrant-client")}
+
+    @app.get("/collections")
+    async def list_collections():
+        names_json = ",".join(f'{{"name":"{name}"}}' for name in names)
+        return ok(f'{{"collections":[{names_json}]}}')
+
+    def query_result(col: FakeCollection, body: dict) -> str:
+        query = body["query"]
+        if isinstance(query, dict):
+            query = query.get("nearest")
+        limit = body.get("limit") or 10
+        offset = body.get("offset") or 0
+        with_payload = body.get("with_payload", False)
+        points = ",".join(
+            f'{{"id":{i},"version":0,"score":{score},"payload":{payload_json(col, i, with_payload)}}}'
+            for i, score in col.query(query, limit, offset)
+        )
+        return f'{{"points":[{points}]}}'
+
+    @app.post("/collections/{name}/points/query")
+    async def query_points(name: str, body: dict = Body(...)):
+        await simulate_latency()
+        col = data.get(name)
+        if col is None:
+            return {"status": {"error": f"Collection {name} not found"}, "result": None}
+        return ok(query_result(col, body))
+
+    @app.post("/collections/{name}/points/query/batch")
+    async def query_batch_points(name: str, body: dict = Body(...)):
+        # One round trip for the whole batch, like the real server
+        await simulate_latency()
+        col = data.get(name)
+        if col is None:
+            return {"status": {"error": f"Collection {name} not found"}, "result": None}
+        return ok("[" + ",".join(query_result(col, search) for search in body.get("searches", [])) + "]")
+
+    # Collections created by ingestion: point id -> payload
+    ingested = {}
+
+    @app.get("/collections/{name}/exists")
+    async def collection_exists(name: str):
+        return ok(f'{{"exists":{"true" if name in ingested else "false"}}}')
+
+    @app.put("/collections/{name}")
+    async def create_collection(name: str):
+        ingested.setdefault(name, {})
+        return ok("true")
+
+    @app.put("/collections/{name}/points")
+    async def upsert(name: str, body: dict = Body(...)):
+        await simulate_latency()
+        points = ingested.get(name)
+        if points is None:
+            return {"status": {"error": f"Collection {name} not found"}, "result": None}
+        if "batch" in body:
+            batch = body["batch"]
+            payloads = batch.get("payloads") or [None] * len(batch["ids"])
+            points.update(zip(batch["ids"], payloads))
+        else:
+            points.update((p["id"], p.get("payload")) for p in body.get("points", []))
+        return ok('{"operation_id":0,"status":"completed"}')
+
+    @app.post("/collections/{name}/points/count")
+    async def count(name: str):
+        points = ingested.get(name)
+        if points is None:
+            return {"status": {"error": f"Collection {name} not found"}, "result": None}
+        return ok(f'{{"count":{len(points)}}}')
+
+    @app.post("/collections/{name}/points")
+    async def retrieve(name: str, body: dict = Body(...)):
+        await simulate_latency()
+        col = data.get(name)
+        if col is None:
+            return {"status": {"error": f"Collection {name} not found"}, "result": None}
+        with_payload = body.get("with_payload", True)
+        points = ",".join(
+            f'{{"id":{int(i)},"payload":{payload_json(col, int(i), with_payload)}}}'
+            for i in body.get("ids", []) if str(i).isdigit() and int(i) < len(col.payloads)
+        )
+        return ok(f"[{points}]")
+
+    return app
+
+
+class FakeQdrantServer:
+    """
+    Runs the stand-in in a child process (so it doesn't share the GIL with
+    the code under test); use as a context manager.
+    """
+
+    def __init__(self, port: int = 0, collection_size: int = 2000, latency_ms: float = 20.0,
+                 jitter_ms: float = 5.0, dim: int = DIM):
+        if not port:
+            with socket.socket() as s:
+                s.bind(("127.0.0.1", 0))
+                port = s.getsockname()[1]
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.args = [
+            sys.executable, "-m", "benchmarks.fake_qdrant", "--port", str(port),
+            "--size", str(collection_size), "--latency-ms", str(latency_ms), "--jitter-ms", str(jitter_ms),
+            "--dim", str(dim)
+        ]
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.args, cwd=REPO_ROOT)
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("Stand-in Qdrant exited during startup")
+            try:
+                urllib.request.urlopen(self.url, timeout=1).read()
+                return self
+            except OSError:
+                time.sleep(0.1)
+        self.process.kill()
+        raise RuntimeError("Stand-in Qdrant did not start within 60s")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument("--size", type=int, default=2000, help="points per collection")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--dim", type=int, default=DIM, help="vector size (match the embedding model)")
+    args = parser.parse_args()
+    app = create_app(args.size, args.latency_ms, args.jitter_ms, dim=args.dim)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Notebook-style serial ingestion versus the parallel pipeline (app.core.ingest).
+
+Writes a synthetic raw OpenAlex JSONL (concept names drawn so papers spread
+over the seven domains, some multi-domain, some null fields and short
+texts), then loads it into the stand-in Qdrant both ways:
+
+  serial    the preprocessing notebook's split (json.loads + clean_nulls +
+            detect_domains, one <domain>.jsonl per domain), then per domain
+            encode each paper and upsert in batches of 64 with one client
+  pipeline  app.core.ingest with --workers / --writers
+
+and checks both produced the same point count per collection.
+
+Run from the repo root:
+    python -m benchmarks.ingest --papers 20000 --workers 4 --writers 8 --latency-ms 30
+    EMBEDDING_BACKEND=onnx python -m benchmarks.ingest --dim 384
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+from app.core.config import settings
+from benchmarks.fake_qdrant import DIM, FakeQdrantServer
+
+CONCEPTS = [
+    "Computer science", "Artificial intelligence", "Machine learning", "Deep learning",
+    "Artificial neural network", "Computer vision", "Image processing", "Object detection",
+    "Natural language processing", "Speech recognition", "Text mining", "Reinforcement learning",
+    "Algorithm", "Distributed computing", "Computer network", "Software engineering", "Database",
+    "Operating system", "Theoretical computer science", "Human-computer interaction",
+]
+WORDS = ("model learning network data graph training feature method task performance image text "
+         "policy agent retrieval query benchmark dataset system optimization robust efficient").split()
+
+
+def synthetic_openalex(path: str, n: int, seed: int = 0):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            short = rng.random() < 0.02
+            paper = {
+                "openalex_id": f"https://openalex.org/W{i}",
+                "doi": f"https://doi.org/10.0000/{i}" if rng.random() < 0.8 else None,
+                "title": " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12))).capitalize(),
+                "abstract": None if short else " ".join(rng.choice(WORDS) for _ in range(rng.randint(60, 250))),
+                "publication_year": 2025,
+                "publication_date": f"2025-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+                "venue": f"Venue {rng.randint(1, 200)}" if rng.random() < 0.9 else "",
+                "citation_count": rng.randint(0, 500),
+                "is_open_access": rng.random() < 0.4,
+                "oa_status": rng.choice(["gold", "green", "closed", None]),
+                "url": f"https://openalex.org/W{i}",
+                "authors": [{"author_id": f"A{rng.randint(1, 10 ** 6)}", "name": f"Author {rng.randint(1, 10000)}"}
+                            for _ in range(rng.randint(1, 8))],
+                "concepts": [{"id": f"C{c}", "name": CONCEPTS[c], "score": round(rng.random(), 3)}
+                             for c in rng.sample(range(len(CONCEPTS)), rng.randint(2, 6))],
+            }
+            if short:
+                paper["title"] = "Short"
+            f.write(json.dumps(paper) + "\n")
+
+
+def serial(path: str, url: str, batch_size: int = 64):
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import Distance, PointStruct, VectorParams
+    from app.core.corpus import DOMAIN_KEYWORDS, OTHER_DOMAIN, clean_nulls, detect_domains, iter_indexable_papers, paper_payload
+    from app.core.embeddings import load_embedding_model
+
+    start = time.perf_counter()
+    split_dir = tempfile.mkdtemp(prefix="sg_split_")
+    outputs = {d: open(os.path.join(split_dir, f"{d}.jsonl"), "w", encoding="utf-8")
+               for d in list(DOMAIN_KEYWORDS) + [OTHER_DOMAIN]}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            paper = clean_nulls(json.loads(line))
+            for d in detect_domains(paper.get("concepts", [])) or {OTHER_DOMAIN}:
+                outputs[d].write(json.dumps(paper) + "\n")
+    for out in outputs.values():
+        out.close()
+
+    model = load_embedding_model()
+    client = QdrantClient(url=url, timeout=60)
+    points, created = {}, set()
+
+    def flush(collection):
+        client.upsert(collection_name=collection, points=points.pop(collection), wait=False)
+
+    for collection, point_id, text, paper in iter_indexable_papers(split_dir):
+        if collection not in created:
+            if not client.collection_exists(collection):
+                client.create_collection(collection_name=collection, vectors_config=VectorParams(
+                    size=model.get_sentence_embedding_dimension(), distance=Distance.COSINE))
+            created.add(collection)
+        vector = model.encode(text, normalize_embeddings=True).tolist()
+        points.setdefault(collection, []).append(PointStruct(id=point_id, vector=vector, payload=paper_payload(paper)))
+        if len(points[collection]) == batch_size:
+            flush(collection)
+    for collection in list(points):
+        flush(collection)
+    elapsed = time.perf_counter() - start
+    counts = {c: client.count(c).count for c in sorted(created)}
+    client.close()
+    return elapsed, counts
+
+
+def pipeline(path: str, url: str, args):
+    from qdrant_client import QdrantClient
+    from app.core.ingest import ingest
+
+    settings.QDRANT_URL = url
+    options = argparse.Namespace(
+        input=path, target="qdrant", output=None, backend=settings.EMBEDDING_BACKEND, workers=args.workers,
+        threads=0, writers=args.writers, chunk_mb=args.chunk_mb, encode_batch_size=256, upsert_batch_size=512,
+        checkpoint=os.path.join(tempfile.mkdtemp(prefix="sg_ingest_"), "checkpoint.json"), restart=True,
+        report_every=30.0, dtype="float32", lists=None
+    )
+    start = time.perf_counter()
+    asyncio.run(ingest(options))
+    elapsed = time.perf_counter() - start
+    client = QdrantClient(url=url, timeout=60)
+    counts = {c: client.count(c).count for c in sorted(settings.DOMAIN_COLLECTIONS.values())
+              if client.collection_exists(c)}
+    client.close()
+    return elapsed, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--papers", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--chunk-mb", type=float, default=1.0)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="stand-in Qdrant latency per upsert")
+    parser.add_argument("--dim", type=int, default=DIM, help="vector size (match the embedding model)")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="sg_openalex_"), "openalex.jsonl")
+    synthetic_openalex(path, args.papers)
+    print(f"{args.papers} papers ({os.path.getsize(path) / 2 ** 20:.1f} MB), {settings.EMBEDDING_BACKEND} backend, "
+          f"upsert latency {args.latency_ms} ms\n")
+
+    results = {}
+    for mode in ("serial", "pipeline"):
+        with FakeQdrantServer(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 4, dim=args.dim) as qdrant:
+            if mode == "serial":
+                results[mode] = serial(path, qdrant.url)
+            else:
+                results[mode] = pipeline(path, qdrant.url, args)
+
+    print(f"\n{'mode':<9} {'seconds':>8} {'papers/s':>9} {'points':>8}")
+    for mode, (elapsed, counts) in results.items():
+        print(f"{mode:<9} {elapsed:>8.1f} {args.papers / elapsed:>9.0f} {sum(counts.values()):>8}")
+    same = results["serial"][1] == results["pipeline"][1]
+    print(f"\nPer-collection counts {'match' if same else 'DIFFER'}: {results['pipeline'][1]}")
+
+
+if __name__ == "__main__":
+    main()
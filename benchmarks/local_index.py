@@ -0,0 +1,101 @@
+"""
+Recall@k and QPS of the local index (IVF probes) against exact brute force.
+
+By default builds a synthetic clustered collection (unit vectors around
+random topic centres, like embedded paper abstracts) in a temp dir; with
+--snapshot it runs against an exported collection instead, using its own
+vectors (plus noise) as queries.
+
+Run from the repo root:
+    python -m benchmarks.local_index --points 200000 --queries 200
+    python -m benchmarks.local_index --snapshot snapshots/cv_collection
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.core.local_index import LocalCollection, default_list_count, normalize, write_collection
+
+
+def synthetic_vectors(n: int, dim: int, topics: int, spread: float, rng):
+    centres = normalize(rng.standard_normal((topics, dim)))
+    labels = rng.integers(0, topics, n)
+    return normalize(centres[labels] + spread * rng.standard_normal((n, dim)).astype(np.float32) / np.sqrt(dim))
+
+
+def sample_queries(col: LocalCollection, n: int, noise: float, rng):
+    rows = rng.choice(len(col), n, replace=False)
+    base = np.asarray(col.vectors[np.sort(rows)], dtype=np.float32)
+    return normalize(base + noise * rng.standard_normal(base.shape).astype(np.float32) / np.sqrt(base.shape[1]))
+
+
+def run(col: LocalCollection, queries, k: int, nprobe: int = None):
+    """
+    Returns (rows per query, queries per second). nprobe=None is exact search.
+    """
+    results = []
+    start = time.perf_counter()
+    for q in queries:
+        rows, _ = col.search(q, k, nprobe or 0, exact=nprobe is None)
+        results.append(rows)
+    return results, len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snapshot", help="exported collection directory to benchmark")
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--spread", type=float, default=2.0, help="within-topic noise of the synthetic vectors")
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float32")
+    parser.add_argument("--lists", type=int, default=None, help="IVF lists (default: the exporter's heuristic)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=1.0, help="noise added to query vectors")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    workdir = None
+    if args.snapshot:
+        path = args.snapshot
+    else:
+        workdir = tempfile.mkdtemp(prefix="sg_local_index_")
+        path = workdir
+        n_lists = args.lists if args.lists is not None else max(default_list_count(args.points), 1)
+        start = time.perf_counter()
+        vectors = synthetic_vectors(args.points, args.dim, args.topics, args.spread, rng)
+        write_collection(path, np.arange(args.points), vectors, [{} for _ in range(args.points)],
+                         n_lists, args.dtype)
+        print(f"Built {args.points} x {args.dim} {args.dtype}, {n_lists} IVF lists in "
+              f"{time.perf_counter() - start:.1f}s")
+
+    try:
+        col = LocalCollection(path)
+        queries = sample_queries(col, min(args.queries, len(col)), args.noise, rng)
+        n_lists = 0 if col.centroids is None else len(col.centroids)
+        print(f"{len(col)} points, {n_lists} lists, {len(queries)} queries, recall@{args.k} vs exact\n")
+
+        exact, exact_qps = run(col, queries, args.k)
+        print(f"{'search':<14} {'recall':>7} {'qps':>9} {'speedup':>8}")
+        print(f"{'exact':<14} {1.0:>7.3f} {exact_qps:>9.1f} {1.0:>7.1f}x")
+        if n_lists == 0:
+            print("No IVF index in this collection (below the exact-search threshold).")
+            return
+        for nprobe in args.nprobe:
+            if nprobe >= n_lists:
+                break
+            got, qps = run(col, queries, args.k, nprobe)
+            recall = np.mean([len(np.intersect1d(a, b)) / args.k for a, b in zip(got, exact)])
+            print(f"{'ivf nprobe=' + str(nprobe):<14} {recall:>7.3f} {qps:>9.1f} {qps / exact_qps:>7.1f}x")
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
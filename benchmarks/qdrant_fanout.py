@@ -0,0 +1,112 @@
+"""
+Load test for the Qdrant fan-out stage against a local stand-in Qdrant.
+
+Compares the previous path (sync QdrantClient behind a 3-thread
+executor) with the native async client, firing C concurrent searches
+that each query 3 collections, and reports per-search p50/p95/p99.
+
+Run from the repo root:
+    python -m benchmarks.qdrant_fanout --concurrency 50 --rounds 10 --latency-ms 20
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+import app.core.services as services
+from app.core.config import settings
+from benchmarks.fake_qdrant import FakeQdrantServer
+
+ROUTES = [
+    {"name": name, "display_name": settings.COLLECTION_DISPLAY_NAMES.get(name, name)}
+    for name in ["dl_collection", "cv_collection", "ML_collection"]
+]
+
+
+def random_vectors(n: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    v = rng.standard_normal((n, 384)).astype(np.float32)
+    return (v / np.linalg.norm(v, axis=1, keepdims=True)).tolist()
+
+
+async def legacy_search(client, executor, vector, limit):
+    loop = asyncio.get_running_loop()
+
+    def search_one(route):
+        return client.query_points(
+            collection_name=route["name"], query=vector, limit=limit, offset=0, with_payload=True
+        ).points
+
+    return await asyncio.gather(*[loop.run_in_executor(executor, search_one, r) for r in ROUTES])
+
+
+async def async_search(vector, limit):
+    return await asyncio.gather(*[
+        services.search_single_collection(r, vector, limit, 0) for r in ROUTES
+    ])
+
+
+async def run_load(search, vectors, concurrency: int, rounds: int):
+    latencies = []
+
+    async def one(vector):
+        t0 = time.perf_counter()
+        await search(vector)
+        latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    for r in range(rounds):
+        batch = vectors[r * concurrency:(r + 1) * concurrency]
+        await asyncio.gather(*[one(v) for v in batch])
+    elapsed = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    return {
+        "searches": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+async def main_async(args):
+    vectors = random_vectors(args.concurrency * args.rounds)
+    limit = 15 // len(ROUTES)
+
+    with FakeQdrantServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, collection_size=args.size) as server:
+        sync_client = QdrantClient(url=server.url, timeout=60)
+        executor = ThreadPoolExecutor(max_workers=3)
+        legacy = await run_load(lambda v: legacy_search(sync_client, executor, v, limit),
+                                vectors, args.concurrency, args.rounds)
+
+        settings.QDRANT_URL = server.url
+        settings.QDRANT_API_KEY = ""
+        settings.QDRANT_POOL_SIZE = args.pool_size
+        services.async_client = None
+        native = await run_load(lambda v: async_search(v, limit), vectors, args.concurrency, args.rounds)
+        await services.async_client.close()
+
+    print(f"{args.concurrency} concurrent searches x {args.rounds} rounds, 3 collections each, "
+          f"stand-in latency {args.latency_ms}ms")
+    print(f"{'path':<28} {'search/s':>9} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8}")
+    for label, r in [("sync client + 3 threads", legacy), (f"async client (pool={args.pool_size})", native)]:
+        print(f"{label:<28} {r['throughput']:>9.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--size", type=int, default=2000, help="points per collection")
+    parser.add_argument("--pool-size", type=int, default=settings.QDRANT_POOL_SIZE)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()